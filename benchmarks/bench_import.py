@@ -0,0 +1,55 @@
+#! /usr/bin/python3
+# -*- encoding: utf-8 -*-
+#
+# Measures the start time of fresh Python processes importing lednamebadge, with and without also importing the USB
+# backends, like the module did in the class bodies formerly. Now they are imported only when a write method is first
+# used. Backends not installed are left out of the comparison.
+#
+# Run from anywhere: python3 benchmarks/bench_import.py
+
+import os
+import subprocess
+import sys
+import time
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+backends = {
+    'usb.core': "import usb.core, usb.util",
+    'pyhidapi': "import pyhidapi; pyhidapi.hid_init()",
+}
+
+
+def run(code, number):
+    """Returns the shortest of number runs of a fresh Python process executing code, in seconds."""
+    times = []
+    for _ in range(number):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], cwd=package_dir, stdout=subprocess.DEVNULL)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def is_available(code):
+    return subprocess.call([sys.executable, '-c', code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+
+
+def main():
+    number = 10
+    available = [code for name, code in sorted(backends.items()) if is_available(code)]
+    print("Backends installed: %s" % (', '.join(n for n, c in sorted(backends.items()) if c in available) or 'none',))
+
+    cases = [
+        ('python only', "pass"),
+        ('import (eager)', "; ".join(["import lednamebadge"] + available)),
+        ('import (lazy)', "import lednamebadge"),
+        ('render (lazy)', "import lednamebadge; lednamebadge.SimpleTextAndIcons().bitmap('Hello')"),
+        ('list methods', "import lednamebadge; lednamebadge.LedNameBadge.get_available_methods()"),
+    ]
+    print("%-16s %10s" % ('case', 'time [ms]'))
+    for name, code in cases:
+        print("%-16s %10.1f" % (name, run(code, number) * 1000))
+
+
+if __name__ == '__main__':
+    main()
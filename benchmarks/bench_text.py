@@ -0,0 +1,66 @@
+#! /usr/bin/python3
+# -*- encoding: utf-8 -*-
+#
+# Compares SimpleTextAndIcons.bitmap_text() with the former per-glyph rendering, which sliced a tuple font and
+# extended an array glyph by glyph. The rendering itself is timed without the render cache, the cache hits separately.
+#
+# Run from anywhere: python3 benchmarks/bench_text.py
+
+import os
+import re
+import sys
+import timeit
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from lednamebadge import RenderCache, SimpleTextAndIcons
+
+
+legacy_font = tuple(bytearray(SimpleTextAndIcons.font_11x44))
+
+
+def legacy_bitmap_text(creator, text):
+    def replace_symbolic(m):
+        name = m.group(1)
+        if name == '':
+            return ':'
+        return SimpleTextAndIcons.bitmap_named[name][2]
+
+    text = re.sub(r':([^:]*):', replace_symbolic, text)
+    buf = array('B')
+    cols = 0
+    for c in text:
+        if ord(c) < 32:
+            (b, n) = SimpleTextAndIcons.bitmap_builtin[c][:2]
+        else:
+            o = SimpleTextAndIcons.char_offsets[c]
+            (b, n) = legacy_font[o:o + 11], 1
+        buf.extend(b)
+        cols += n
+    return buf, cols
+
+
+def main():
+    creator = SimpleTextAndIcons(RenderCache(0))
+    cached_creator = SimpleTextAndIcons()
+    texts = [
+        ('short', u"Hello World!"),
+        ('name', u"Jürgen Weigert"),
+        ('long', u"The quick brown fox jumps over the lazy dog. " * 16),
+        ('long with icons', u"I :HEART2: my :fablab: and my :bicycle: " * 16),
+    ]
+    print("%-16s %6s %14s %14s %8s %14s" % ('text', 'chars', 'legacy [us]', 'current [us]', 'speedup',
+                                              'cached [us]'))
+    for name, text in texts:
+        assert legacy_bitmap_text(creator, text) == creator.bitmap_text(text)
+        number = 2000
+        legacy = min(timeit.repeat(lambda: legacy_bitmap_text(creator, text), number=number, repeat=3)) / number
+        current = min(timeit.repeat(lambda: creator.bitmap_text(text), number=number, repeat=3)) / number
+        cached = min(timeit.repeat(lambda: cached_creator.bitmap_text(text), number=number, repeat=3)) / number
+        print("%-16s %6d %14.1f %14.1f %7.1fx %14.1f" % (name, len(text), legacy * 1e6, current * 1e6,
+                                                          legacy / current, cached * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#! /usr/bin/python3
+# -*- encoding: utf-8 -*-
+#
+# Benchmark suite for the upload pipeline: rendering text and images, building the header, assembling the payload
+# like main() does, and writing it to a simulated device (write method 'capture' with a fixed latency per report).
+#
+# Run from anywhere:
+#
+#     python3 benchmarks/run_benchmarks.py --output results.json
+#     python3 benchmarks/run_benchmarks.py --compare results.json
+#
+# The results are the best time per call of some repeated measurements. With --compare, the results are compared with
+# an earlier run and the exit code is 1, if any of them got slower by more than the tolerance.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, package_dir)
+
+import lednamebadge
+from lednamebadge import LedNameBadge, RenderCache, SimpleTextAndIcons, WriteCapture
+
+
+def measure(func, number, repeat=7):
+    """Returns the best time per call of func in seconds."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def assemble(messages, cache=True):
+    """The payload assembly of main(): render each message, then the header and the bitmaps."""
+    creator = assemble.creator if cache else SimpleTextAndIcons(RenderCache(0))
+    bitmaps = [creator.bitmap(m) for m in messages]
+    return LedNameBadge.build_buffer(bitmaps, [4], [0], [0], [0], 100)
+
+
+assemble.creator = SimpleTextAndIcons()
+
+
+def benchmarks(temp_dir, latency):
+    """Returns a list of (name, func, number, details) with the benchmarks to run."""
+    from PIL import Image
+
+    wide_image = os.path.join(temp_dir, 'wide_4096x11.png')
+    Image.frombytes('L', (4096, 11), bytes(bytearray((i * 7) % 256 for i in range(4096 * 11)))).save(wide_image)
+    creator = SimpleTextAndIcons(RenderCache(0))
+    short_text = u"Hello World!"
+    long_text = u"The quick brown fox jumps over the lazy dog. " * 16
+    gfx_dir = os.path.join(package_dir, 'gfx')
+    messages = [u"Hello :HEART2: World!", os.path.join(gfx_dir, 'fablabnbg_logo_44x11.png'),
+                u"I :HEART2: my :%s: fablab" % (os.path.join(gfx_dir, 'fablab_logo_16x11.png'),)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        payload = assemble(messages)
+
+    def write():
+        LedNameBadge.write(payload, 'capture', 'auto')
+
+    return [
+        ('bitmap_text short', lambda: creator.bitmap_text(short_text), 2000, {'chars': len(short_text)}),
+        ('bitmap_text long', lambda: creator.bitmap_text(long_text), 500, {'chars': len(long_text)}),
+        ('bitmap_img 44x11', lambda: SimpleTextAndIcons.bitmap_img(messages[1]), 200, {'pixels': 44 * 11}),
+        ('bitmap_img 960x11', lambda: SimpleTextAndIcons.bitmap_img(
+            os.path.join(gfx_dir, 'starfield', 'starfield_020.png')), 100, {'pixels': 960 * 11}),
+        ('bitmap_img 4096x11', lambda: SimpleTextAndIcons.bitmap_img(wide_image), 50, {'pixels': 4096 * 11}),
+        ('header', lambda: LedNameBadge.header((6, 7, 8), (5, 3), (6, 2), (0, 1), (1, 0), 75), 5000, {}),
+        ('assemble cold', lambda: assemble(messages, False), 100, {'bytes': len(payload)}),
+        ('assemble cached', lambda: assemble(messages), 500, {'bytes': len(payload)}),
+        ('write capture', write, 5, {'bytes': len(payload), 'latency_per_report': latency}),
+    ]
+
+
+def compare(results, baseline_file, tolerance):
+    """Prints the ratio to the baseline per benchmark and returns the names of those slower than the tolerance."""
+    with open(baseline_file) as f:
+        baseline = json.load(f)['results']
+    slower = []
+    print("\n%-20s %14s %14s %8s" % ('benchmark', 'baseline [us]', 'current [us]', 'ratio'))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[name]['seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            slower.append(name)
+            flag = '  slower'
+        print("%-20s %14.1f %14.1f %7.2fx%s" % (name, baseline[name]['seconds'] * 1e6, result['seconds'] * 1e6, ratio,
+                                               flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of rendering, header building and transfer.')
+    parser.add_argument('--output', metavar='FILE', help="Save the results as JSON to this file.")
+    parser.add_argument('--compare', metavar='FILE', help="Compare with the results saved to this file before.")
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help="Slowdown accepted by --compare, as a fraction (default 0.3).")
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help="Simulated time per report for the write benchmark in seconds (default 0.001).")
+    args = parser.parse_args()
+
+    WriteCapture.configure(latency=args.latency)
+    temp_dir = tempfile.mkdtemp()
+    results = {}
+    try:
+        print("%-20s %14s %16s" % ('benchmark', 'per call [us]', 'throughput'))
+        for name, func, number, details in benchmarks(temp_dir, args.latency):
+            seconds = measure(func, number)
+            result = {'seconds': seconds, 'number': number}
+            result.update(details)
+            throughput = ''
+            if 'bytes' in details and name.startswith('write'):
+                result['bytes_per_second'] = details['bytes'] / seconds
+                throughput = '%.0f bytes/s' % (result['bytes_per_second'],)
+            elif 'pixels' in details:
+                throughput = '%.1f Mpx/s' % (details['pixels'] / seconds / 1e6,)
+            elif 'chars' in details:
+                throughput = '%.0f chars/ms' % (details['chars'] / seconds / 1e3,)
+            results[name] = result
+            print("%-20s %14.1f %16s" % (name, seconds * 1e6, throughput))
+    finally:
+        shutil.rmtree(temp_dir)
+        WriteCapture.configure()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': getattr(lednamebadge, '__version'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        print("Results saved to %s" % (args.output,))
+
+    if args.compare:
+        slower = compare(results, args.compare, args.tolerance)
+        if slower:
+            print("Slower than %s: %s" % (args.compare, ', '.join(slower)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
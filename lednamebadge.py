@@ -87,20 +87,79 @@
 #       get_available_methods() and get_available_device_ids().
 
 
-import argparse
+import binascii
+import errno
+import hashlib
+import json
+import math
 import os
 import re
+import string
+import struct
 import sys
+import threading
 import time
 from array import array
+from collections import OrderedDict
 from datetime import datetime
 
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
 
 __version = "0.14"
 
 
+class DisplayGeometry:
+    """The size of a badge type in LEDs. The bitmap data consists of byte-columns of 8 pixels width, with one byte per
+    row. The builtin font and icons are 11 rows high, so for higher displays empty rows are added at the bottom.
+    """
+
+    def __init__(self, name, rows, cols):
+        self.name = name
+        self.rows = rows
+        self.cols = cols
+
+    @staticmethod
+    def get(name):
+        """Returns the geometry for the given display type name, like '11x44'. For backwards compatibility, any name
+            containing '12' means '12x48'.
+        """
+        if isinstance(name, DisplayGeometry):
+            return name
+        if name in DisplayGeometry.known:
+            return DisplayGeometry.known[name]
+        if '12' in name:
+            return DisplayGeometry.known['12x48']
+        raise ValueError("Unknown display type '%s', please use one of %s" % (name, ', '.join(sorted(DisplayGeometry.known))))
+
+    @staticmethod
+    def pad_rows(buf, rows):
+        """Returns the given 11 rows high bitmap data with empty rows added to the given number of rows. This is
+            done in one pass, the given buffer is returned unchanged for 11 rows.
+        """
+        if rows == 11:
+            return buf
+        padding = b'\0' * (rows - 11)
+        view = memoryview(buf)
+        parts = []
+        for i in range(0, len(view), 11):
+            parts.append(view[i:i + 11])
+            parts.append(padding)
+        return array('B', b''.join(parts))
+
+
+DisplayGeometry.known = {
+    '11x44': DisplayGeometry('11x44', 11, 44),
+    '12x48': DisplayGeometry('12x48', 12, 48),
+    '11x55': DisplayGeometry('11x55', 11, 55),
+}
+
+
 class SimpleTextAndIcons:
-    font_11x44 = (
+    font_11x44 = bytes(bytearray((
         # 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
         0x00, 0x38, 0x6c, 0xc6, 0xc6, 0xfe, 0xc6, 0xc6, 0xc6, 0xc6, 0x00,
         0x00, 0xfc, 0x66, 0x66, 0x66, 0x7c, 0x66, 0x66, 0x66, 0xfc, 0x00,
@@ -252,7 +311,7 @@ class SimpleTextAndIcons:
         0x10, 0x6c, 0x00, 0xc6, 0xc6, 0xc6, 0xc6, 0xc6, 0xc6, 0x7c, 0x00,  # Û
         0x60, 0x18, 0x00, 0xc6, 0xc6, 0xc6, 0xc6, 0xc6, 0xc6, 0x7c, 0x00,  # Ù
         0x66, 0x66, 0x00, 0x66, 0x66, 0x66, 0x3c, 0x18, 0x18, 0x3c, 0x00,  # Ÿ
-    )
+    )))
 
     charmap = u'ABCDEFGHIJKLMNOPQRSTUVWXYZ' + \
               u'abcdefghijklmnopqrstuvwxyz' + \
@@ -267,6 +326,13 @@ class SimpleTextAndIcons:
         char_offsets[charmap[i]] = 11 * i
         # print(i, charmap[i], char_offsets[charmap[i]])
 
+    # The glyphs sliced once from font_11x44, so rendering text is just a lookup per character. Control characters
+    # are left out, they reference builtin or preloaded bitmaps (see bitmap_char()).
+    char_bitmaps = {}
+    for i in range(len(charmap)):
+        if ord(charmap[i]) >= 32:
+            char_bitmaps[charmap[i]] = font_11x44[11 * i:11 * i + 11]
+
     bitmap_named = {
         'ball':      (array('B', (
             0b00000000,
@@ -319,13 +385,46 @@ class SimpleTextAndIcons:
     for i in bitmap_named:
         bitmap_builtin[bitmap_named[i][2]] = bitmap_named[i]
 
-    def __init__(self):
-        self.bitmap_preloaded = [([], 0)]
+    # Control characters below the builtin ones are free for preloaded images. Slot 0 is '\0', which is unused.
+    preload_slots_max = min(ord(c) for c in bitmap_builtin) - 1
+
+    # Decoded image files by resolved path, each with the (mtime, size) it was decoded with. Shared by all instances.
+    _loaded_images = {}
+
+    def __init__(self, render_cache=None, display_type='11x44'):
+        """The render_cache is a RenderCache for the results of bitmap() and bitmap_text(). If not given, an in-memory
+            cache with default size is used.
+            The display_type is one of the names in DisplayGeometry.known, like '11x44' or '12x48'. All bitmaps are
+            rendered with the number of rows of that type.
+        """
+        self.geometry = DisplayGeometry.get(display_type)
+        self.char_bitmaps = SimpleTextAndIcons._get_char_bitmaps(self.geometry)
+        self.bitmap_preloaded = [(array('B'), 0)]
+        self.bitmap_preloaded_slots = {}
         self.bitmaps_preloaded_unused = False
+        self.render_cache = render_cache if render_cache is not None else RenderCache()
+
+    @staticmethod
+    def _get_char_bitmaps(geometry):
+        """Returns char_bitmaps with the glyphs padded to the rows of the given geometry. Built once per geometry."""
+        if geometry.rows == 11:
+            return SimpleTextAndIcons.char_bitmaps
+        padded = SimpleTextAndIcons._char_bitmaps_padded.get(geometry.rows)
+        if padded is None:
+            padded = {}
+            for ch, glyph in SimpleTextAndIcons.char_bitmaps.items():
+                padded[ch] = bytes(bytearray(DisplayGeometry.pad_rows(glyph, geometry.rows)))
+            SimpleTextAndIcons._char_bitmaps_padded[geometry.rows] = padded
+        return padded
+
+    _char_bitmaps_padded = {}
 
     def add_preload_img(self, filename):
         """Still used by main, but deprecated. PLease use ":"-notation for bitmap() / bitmap_text()"""
-        self.bitmap_preloaded.append(SimpleTextAndIcons.bitmap_img(filename))
+        self.bitmap_preloaded.append(SimpleTextAndIcons._load_img(filename))
+        stamp = SimpleTextAndIcons._file_stamp(filename)
+        if stamp and stamp[0] not in self.bitmap_preloaded_slots:
+            self.bitmap_preloaded_slots[stamp[0]] = len(self.bitmap_preloaded) - 1
         self.bitmaps_preloaded_unused = True
 
     def are_preloaded_unused(self):
@@ -337,8 +436,9 @@ class SimpleTextAndIcons:
         return SimpleTextAndIcons.bitmap_named.keys()
 
     def bitmap_char(self, ch):
-        """Returns a tuple of 11 bytes, it is the bitmap data of given character.
-            Example: ch = '_' returns (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 255).
+        """Returns a tuple of the bitmap data of given character and its length in byte-columns. For font characters,
+            this is 11 bytes and 1 byte-column.
+            Example: ch = '_' returns (b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff', 1).
             The bits in each byte are horizontal, highest bit is left.
         """
         if ord(ch) < 32:
@@ -346,21 +446,122 @@ class SimpleTextAndIcons:
                 return SimpleTextAndIcons.bitmap_builtin[ch][:2]
 
             self.bitmaps_preloaded_unused = False
+            if self.bitmap_preloaded[ord(ch)][0] is None:
+                # Slot was reserved for a text taken from the render cache, see bitmap_text(). Load it on first use.
+                self.bitmap_preloaded[ord(ch)] = SimpleTextAndIcons._load_img(self.bitmap_preloaded[ord(ch)][1])
             return self.bitmap_preloaded[ord(ch)]
 
-        o = SimpleTextAndIcons.char_offsets[ch]
-        return SimpleTextAndIcons.font_11x44[o:o + 11], 1
+        return SimpleTextAndIcons.char_bitmaps[ch], 1
 
     def bitmap_text(self, text):
         """Returns a tuple of (buffer, length_in_byte_columns_aka_chars)
+          The buffer has as many bytes per byte-column as the display type has rows.
           We preprocess the text string for substitution patterns
           "::" is replaced with a single ":"
           ":1: is replaced with CTRL-A referencing the first preloaded or loaded image.
           ":happy:" is replaced with a reference to a builtin smiley glyph
           ":heart:" is replaced with a reference to a builtin heart glyph
           ":gfx/logo.png:" preloads the file gfx/logo.png and is replaced the corresponding control char.
+          Each image file gets only one control char, even if referenced multiple times.
+          The result is taken from the render cache, if the same text was rendered before and the referenced image
+          files have not changed since.
+        """
+        key = self._text_cache_key(text)
+        if key is not None:
+            cached = self.render_cache.get(key)
+            if cached is not None:
+                # Keep the preload slots in the same order as rendering would have done, for later ":1:"-references.
+                for stamp in key[3]:
+                    self._preload_slot(stamp[0], lazy=True)
+                return cached
+
+        result = self._render_text(text)
+        if key is not None:
+            self.render_cache.put(key, result)
+        return result
+
+    def _text_cache_key(self, text):
+        """Returns the render cache key for the given text. That is the text and path, mtime and size of all image
+            files referenced in it. Returns None if the text cannot be cached: the result of references to preloaded
+            images by number or control character depends on this objects state, and missing files or unknown names
+            are better reported by rendering.
+        """
+        for c in text:
+            if ord(c) < 32 and c not in SimpleTextAndIcons.bitmap_builtin:
+                return None
+        stamps = []
+        for m in re.finditer(r':([^:]*):', text):
+            name = m.group(1)
+            if name == '':
+                continue
+            if re.match('^[0-9]*$', name):
+                return None
+            if '.' in name:
+                stamp = SimpleTextAndIcons._file_stamp(name)
+                if stamp is None:
+                    return None
+                stamps.append(stamp)
+            elif name not in SimpleTextAndIcons.bitmap_named:
+                return None
+        return 'text', self.geometry.name, text, tuple(stamps)
+
+    @staticmethod
+    def absolute_paths(arg):
+        """Returns the message with the image files it references made absolute, so it renders the same in another
+            working directory: the whole message, if it is an existing file, or the embedded ones, like ":gfx/logo.png:".
+        """
+        if os.path.exists(arg):
+            return os.path.abspath(arg)
+
+        def replace(m):
+            name = m.group(1)
+            if '.' in name and os.path.exists(name):
+                return ':%s:' % (os.path.abspath(name),)
+            return m.group(0)
+
+        return re.sub(r':([^:]*):', replace, arg)
+
+    @staticmethod
+    def _file_stamp(path):
+        """Returns a tuple of resolved path, mtime and size of the given file, or None if it does not exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return os.path.realpath(path), st.st_mtime, st.st_size
+
+    def _preload_slot(self, file, lazy=False):
+        """Returns the preload slot (the ordinal of the control char) for the given image file. The first reference to
+            a file takes the next free slot, later ones reuse it. The slot content is refreshed if the file has
+            changed. With lazy, a new slot is just reserved and the image is loaded on first use.
         """
+        stamp = SimpleTextAndIcons._file_stamp(file)
+        path = stamp[0] if stamp else file
+        slot = self.bitmap_preloaded_slots.get(path)
+        if slot is None:
+            slot = len(self.bitmap_preloaded)
+            if slot > SimpleTextAndIcons.preload_slots_max:
+                raise ValueError("Too many different images, at most %d are possible: %s" %
+                                 (SimpleTextAndIcons.preload_slots_max, file))
+            self.bitmap_preloaded.append((None, path))
+            self.bitmap_preloaded_slots[path] = slot
+        if not lazy:
+            self.bitmap_preloaded[slot] = SimpleTextAndIcons._load_img(file)
+        return slot
 
+    @staticmethod
+    def _load_img(file):
+        """Like bitmap_img(), but decodes each file only once, as long as its mtime and size do not change."""
+        stamp = SimpleTextAndIcons._file_stamp(file)
+        if stamp is None:
+            return SimpleTextAndIcons.bitmap_img(file)  # Let it fail, there.
+        loaded = SimpleTextAndIcons._loaded_images.get(stamp[0])
+        if loaded is None or loaded[0] != stamp[1:]:
+            loaded = (stamp[1:], SimpleTextAndIcons.bitmap_img(file))
+            SimpleTextAndIcons._loaded_images[stamp[0]] = loaded
+        return array('B', loaded[1][0]), loaded[1][1]
+
+    def _render_text(self, text):
         def replace_symbolic(m):
             name = m.group(1)
             if name == '':
@@ -368,25 +569,31 @@ class SimpleTextAndIcons:
             if re.match('^[0-9]*$', name):  # py3 name.isdecimal()
                 return chr(int(name))
             if '.' in name:
-                self.bitmap_preloaded.append(SimpleTextAndIcons.bitmap_img(name))
-                return chr(len(self.bitmap_preloaded) - 1)
+                return chr(self._preload_slot(name))
             return SimpleTextAndIcons.bitmap_named[name][2]
 
         text = re.sub(r':([^:]*):', replace_symbolic, text)
-        buf = array('B')
+        try:
+            # Plain font characters only: one lookup per character, one join.
+            return array('B', b''.join(map(self.char_bitmaps.__getitem__, text))), len(text)
+        except KeyError:
+            pass
+
+        parts = []
         cols = 0
         for c in text:
             (b, n) = self.bitmap_char(c)
-            buf.extend(b)
+            parts.append(b)
             cols += n
-        return buf, cols
+        return DisplayGeometry.pad_rows(array('B', b''.join(parts)), self.geometry.rows), cols
 
     @staticmethod
-    def bitmap_img(file):
+    def bitmap_img(file, rows=11):
         """Returns a tuple of (buffer, length_in_byte_columns) representing the given image file.
             It has to be an 8-bit grayscale image or a color image with 8 bit per channel. Color pixels are converted to
             grayscale by arithmetic mean. Threshold for an active led is then > 127.
             If the width is not a multiple on 8 it will be padded with empty pixel-columns.
+            The height has to be 11 or the given number of rows. In the first case empty rows are added.
         """
         try:
             from PIL import Image
@@ -398,12 +605,70 @@ class SimpleTextAndIcons:
 
         im = Image.open(file)
         print("fetching bitmap from file %s -> (%d x %d)" % (file, im.width, im.height))
-        if im.height != 11:
-            sys.exit("%s: image height must be 11px. Seen %d" % (file, im.height))
+        if im.height not in (11, rows):
+            sys.exit("%s: image height must be %s. Seen %d" % (
+                file, '11px' if rows == 11 else '11px or %dpx' % (rows,), im.height))
+        cols = int((im.width + 7) / 8)
+        buf = SimpleTextAndIcons._bitmap_img_bulk(im)
+        if buf is None:
+            buf = SimpleTextAndIcons._bitmap_img_pixelwise(im, file)
+        if im.height < rows:
+            buf = DisplayGeometry.pad_rows(buf, rows)
+        im.close()
+        return buf, cols
+
+    _img_threshold_table = [0] * 128 + [255] * 128
+
+    @staticmethod
+    def _bitmap_img_bulk(im):
+        """Converts the whole image at once, with numpy if available, otherwise with pillow's own bulk operations.
+            The result is the same as with _bitmap_img_pixelwise(). Returns None for pixel formats not handled here,
+            so the caller can fall back to the pixel by pixel conversion.
+        """
+        from PIL import Image
+
+        if im.mode not in ('1', 'L', 'P', 'LA', 'RGB', 'RGBA'):
+            return None
+        if im.mode == '1':
+            im = im.convert('L')  # getpixel() yields 0 or 255 for these
+
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        cols = int((im.width + 7) / 8)
+        if numpy is not None:
+            # For 'P', this is the palette index, just like getpixel() returns it.
+            pixels = numpy.asarray(im)
+            if pixels.ndim == 3:
+                channels = min(pixels.shape[2], 3)
+                lit = pixels[:, :, :channels].sum(axis=2, dtype=numpy.uint16) > 127 * channels
+            else:
+                lit = pixels > 127
+            # packbits() pads each row with zero bits, the transposition gives us the byte-columns.
+            return array('B', numpy.packbits(lit, axis=1).T.tobytes())
+
+        if im.mode in ('L', 'P'):
+            gray = Image.frombytes('L', im.size, im.tobytes())
+        else:
+            bands = [band.tobytes() for band in im.split()[:3]]
+            limit = 127 * len(bands)
+            gray = Image.frombytes('L', im.size, bytes(bytearray(
+                255 if sum(p) > limit else 0 for p in zip(*bands))))
+        # Mode '1' packs 8 pixels per byte, highest bit is left, and each row is padded to full bytes.
+        rows = gray.point(SimpleTextAndIcons._img_threshold_table, '1').tobytes()
+        return array('B', b''.join(rows[col::cols] for col in range(cols)))
+
+    @staticmethod
+    def _bitmap_img_pixelwise(im, file):
+        """Converts the image pixel by pixel. This is the slow, but most tolerant way. Unknown pixel formats abort
+            the program.
+        """
         buf = array('B')
         cols = int((im.width + 7) / 8)
         for col in range(cols):
-            for row in range(11):  # [0..10]
+            for row in range(im.height):
                 byte_val = 0
                 for bit in range(8):  # [0..7]
                     bit_val = 0
@@ -420,18 +685,738 @@ class SimpleTextAndIcons:
                             bit_val = 1 << (7 - bit)
                         byte_val += bit_val
                 buf.append(byte_val)
-        im.close()
-        return buf, cols
+        return buf
 
     def bitmap(self, arg):
         """If arg is a valid and existing path name, we load it as an image.
             Otherwise, we take it as a string (with ":"-notation, see bitmap_text()).
         """
+        with UploadProfile.phase('render'):
+            return self._bitmap(arg)
+
+    def _bitmap(self, arg):
         if os.path.exists(arg):
-            return SimpleTextAndIcons.bitmap_img(arg)
+            stamp = SimpleTextAndIcons._file_stamp(arg)
+            key = ('img', self.geometry.name, stamp)
+            result = self.render_cache.get(key)
+            if result is None:
+                result = SimpleTextAndIcons.bitmap_img(arg, self.geometry.rows)
+                self.render_cache.put(key, result)
+            return result
         return self.bitmap_text(arg)
 
 
+class RenderCache:
+    """A bounded cache for rendered bitmaps, dropping the least recently used entries first. The keys are built by
+    SimpleTextAndIcons and contain everything the result depends on. If a directory is given, the bitmaps are also
+    stored there, so later program runs can skip rendering.
+    The results are handed out as new arrays, so the callers may modify them.
+    """
+
+    def __init__(self, max_entries=256, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def get(self, key):
+        """Returns a tuple of (buffer, length_in_byte_columns) for the given key or None, if not cached."""
+        entry = self.entries.pop(key, None)
+        if entry is None and self.directory:
+            entry = self._read_file(key)
+            if entry is not None:
+                self.disk_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[key] = entry
+        return array('B', entry[0]), entry[1]
+
+    def put(self, key, bitmap):
+        """Stores the tuple of (buffer, length_in_byte_columns) under the given key."""
+        if self.max_entries <= 0:
+            return
+        entry = (bytes(bytearray(bitmap[0])), bitmap[1])
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if self.directory:
+            self._write_file(key, entry)
+
+    def get_stats(self):
+        """Returns the counters of this cache as a dict."""
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits, 'entries': len(self.entries)}
+
+    def clear(self):
+        """Drops all entries kept in memory. Files on disk are kept."""
+        self.entries.clear()
+
+    def _file_name(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.bin')
+
+    def _read_file(self, key):
+        try:
+            with open(self._file_name(key), 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        if len(data) < 4:
+            return None
+        return data[4:], struct.unpack('>I', data[:4])[0]
+
+    def _write_file(self, key, entry):
+        file_name = self._file_name(key)
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # Concurrent runs and threads never read half of a file.
+            write_file_atomically(file_name, struct.pack('>I', entry[1]) + entry[0])
+        except (IOError, OSError) as e:
+            print("Cannot write render cache file %s: %s" % (file_name, e))
+
+
+class PayloadOptimizer:
+    """Makes the rendered messages smaller before the buffer is built: blank byte-columns at the start and the end of
+    a message are removed, where its mode shows no difference, and a message repeating an earlier one with the same
+    settings is dropped. Fewer bytes need fewer reports and thus upload faster.
+    """
+
+    # Modes with the message entering from an edge, so blank byte-columns at both ends do not show
+    trim_both_modes = (0, 1)
+    # Modes with the message starting at the left edge, so blank byte-columns at the end do not show. Still-centered (4)
+    # and animation (5) are kept as they are, the blank byte-columns give the position resp. the frame width there.
+    trim_end_modes = (2, 3, 6, 7, 8)
+
+    def __init__(self, display_type='11x44', max_size=8192):
+        self.rows = DisplayGeometry.get(display_type).rows
+        self.max_size = max_size
+        self.stats = {'messages': 0, 'folded': 0, 'trimmed_columns': 0, 'bytes_saved': 0, 'bytes': 0}
+
+    def optimize(self, bitmaps, speeds=(4,), modes=(0,), blinks=(0,), ants=(0,)):
+        """Returns the tuple (bitmaps, speeds, modes, blinks, ants) for build_buffer() with the optimized bitmaps. The
+            settings are given as for header() (the last value repeats for the remaining messages), they are returned
+            with one value per remaining message. See get_stats() for what was saved.
+        """
+        settings = [[s[min(i, len(s) - 1)] for i in range(len(bitmaps))] for s in (speeds, modes, blinks, ants)]
+        result = []
+        seen = set()
+        trimmed_columns = 0
+        for i, (buf, cols) in enumerate(bitmaps):
+            message_settings = tuple(s[i] for s in settings)
+            trimmed_buf, trimmed_cols = self.trim(buf, cols, message_settings[1])
+            key = (bytes(bytearray(trimmed_buf)), message_settings)
+            if key in seen:
+                continue
+            seen.add(key)
+            trimmed_columns += cols - trimmed_cols
+            result.append(((trimmed_buf, trimmed_cols), message_settings))
+        before = self.get_size(bitmaps)
+        optimized = [r[0] for r in result]
+        self.stats = {'messages': len(bitmaps), 'folded': len(bitmaps) - len(result),
+                      'trimmed_columns': trimmed_columns, 'bytes_saved': before - self.get_size(optimized),
+                      'bytes': self.get_size(optimized)}
+        return (optimized,) + tuple([r[1][j] for r in result] for j in range(4))
+
+    def trim(self, buf, cols, mode):
+        """Returns the tuple (buffer, length_in_byte_columns) of the given bitmap without the blank byte-columns not
+            showing with the given mode. At least one byte-column is kept.
+        """
+        rows = self.rows
+        data = bytes(bytearray(buf))
+        blank = b'\0' * rows
+        start = 0
+        end = cols
+        if mode in PayloadOptimizer.trim_both_modes:
+            while start < end - 1 and data[start * rows:(start + 1) * rows] == blank:
+                start += 1
+        if mode in PayloadOptimizer.trim_both_modes or mode in PayloadOptimizer.trim_end_modes:
+            while end - 1 > start and data[(end - 1) * rows:end * rows] == blank:
+                end -= 1
+        if start == 0 and end == cols:
+            return buf, cols
+        return array('B', data[start * rows:end * rows]), end - start
+
+    def get_size(self, bitmaps):
+        """Returns the size of the buffer, which build_buffer() makes of the given bitmaps."""
+        return len(LedNameBadge._protocol_header_template) + sum(len(b[0]) for b in bitmaps)
+
+    def check_fit(self, bitmaps):
+        """Raises PayloadTooLargeError, if the buffer of the given bitmaps would exceed max_size."""
+        size = self.get_size(bitmaps)
+        if size > self.max_size:
+            longest = max(range(len(bitmaps)), key=lambda i: bitmaps[i][1])
+            raise PayloadTooLargeError(size, self.max_size, self.rows, "The longest is message %d with %d byte-columns."
+                                       % (longest + 1, bitmaps[longest][1]))
+
+    def get_stats(self):
+        """Returns a dict with the number of 'messages' given to the last optimize(), how many were 'folded' as
+            duplicates, the number of 'trimmed_columns', the 'bytes_saved' and the 'bytes' of the resulting buffer.
+        """
+        return dict(self.stats)
+
+
+class SlotRenderer:
+    """Renders the texts of the message slots of a device with SimpleTextAndIcons.bitmap_text(), but only those
+    changed since the last call. The bitmaps of the others are reused.
+    """
+
+    def __init__(self, creator):
+        self.creator = creator
+        self.slots = []
+        self.rendered = 0
+        self.reused = 0
+
+    def render(self, texts):
+        """Returns the list of bitmaps for the given list of texts, one per slot."""
+        slots = []
+        for i, text in enumerate(texts):
+            if i < len(self.slots) and self.slots[i][0] == text:
+                slots.append(self.slots[i])
+                self.reused += 1
+            else:
+                slots.append((text, self.creator.bitmap_text(text)))
+                self.rendered += 1
+        self.slots = slots
+        return [slot[1] for slot in slots]
+
+    def get_stats(self):
+        """Returns the numbers of rendered and reused slots as a dict."""
+        return {'rendered': self.rendered, 'reused': self.reused}
+
+
+class PayloadDigestStore:
+    """Remembers a digest of the last data written to each device in a small JSON file, so writing the same data again
+    can be skipped, also by later program runs. The date in the header is not part of the digest. The devices are
+    identified by write method and device key (see WriteMethod.get_device_key()), which changes, when a device is
+    connected again. If the device was programmed otherwise in the meantime (e.g. by another program), the digest is
+    outdated. Write with force then.
+    """
+
+    default_file = os.path.join(os.path.expanduser('~'), '.cache', 'lednamebadge', 'written.json')
+    # Guards reading, changing and writing the file, for stores shared by threads (e.g. of the daemon)
+    _lock = threading.Lock()
+
+    def __init__(self, file_name=None):
+        self.file_name = file_name or PayloadDigestStore.default_file
+
+    @staticmethod
+    def digest(buf):
+        """Returns the digest of the given data (header and bitmaps) as a hex string. The date bytes of the header are
+            left out and the data is padded like it is written.
+        """
+        data = bytearray(buf)
+        data[38:44] = bytearray(len(data[38:44]))
+        if len(data) % 64:
+            data.extend(bytearray(64 - len(data) % 64))
+        return hashlib.sha256(bytes(data)).hexdigest()
+
+    def is_unchanged(self, method_name, device_id, buf):
+        """Returns True, if the given data was the last written to the given device."""
+        return self._read().get(self._key(method_name, device_id)) == PayloadDigestStore.digest(buf)
+
+    def put(self, method_name, device_id, buf):
+        """Records the given data as the last written to the given device."""
+        with PayloadDigestStore._lock:
+            digests = self._read()
+            digests[self._key(method_name, device_id)] = PayloadDigestStore.digest(buf)
+            self._write(digests)
+
+    def forget(self, method_name, device_id):
+        """Drops the digest of the given device, so the next write is not skipped."""
+        with PayloadDigestStore._lock:
+            digests = self._read()
+            if digests.pop(self._key(method_name, device_id), None) is not None:
+                self._write(digests)
+
+    @staticmethod
+    def _key(method_name, device_id):
+        return '%s:%s' % (method_name, device_id)
+
+    def _read(self):
+        try:
+            with open(self.file_name) as f:
+                digests = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return digests if isinstance(digests, dict) else {}
+
+    def _write(self, digests):
+        try:
+            directory = os.path.dirname(self.file_name)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            write_file_atomically(self.file_name, json.dumps(digests, indent=1, sort_keys=True))
+        except (IOError, OSError) as e:
+            print("Cannot write state file %s: %s" % (self.file_name, e))
+
+
+class DeviceLock:
+    """Serializes the writes of several processes (and threads) to the same device, as interleaved reports spoil the
+    upload. The lock is an advisory lock (flock) on a file per write method and device id in directory. The writers
+    get it in the order they asked for it: each waits with a ticket file in a queue directory until it is the oldest.
+    With supersede, a waiting writer gives up as soon as a newer one asks for the same device, as that one overwrites
+    the content anyway. On systems without flock (e.g. Windows), nothing is locked.
+    """
+
+    poll_interval = 0.05
+    _counter = 0
+    _counter_lock = threading.Lock()
+
+    def __init__(self, directory=None, timeout=60.0, supersede=False):
+        """The directory defaults to lednamebadge-locks in the temporary directory, shared by all users. The timeout
+        is the maximum time to wait in seconds.
+        """
+        if directory is None:
+            import tempfile
+            directory = os.path.join(tempfile.gettempdir(), 'lednamebadge-locks')
+        self.directory = directory
+        self.timeout = timeout
+        self.supersede = supersede
+
+    def acquire(self, method_name, device_id, supersede=None):
+        """Waits for the lock of the given device and returns a DeviceLockHold to release it, also usable as a
+        context manager. Raises DeviceBusyError after the timeout, WriteSuperseded if a newer writer asked for the
+        device meanwhile (with supersede only, which defaults to the one given to the constructor).
+        """
+        if supersede is None:
+            supersede = self.supersede
+        try:
+            import fcntl
+        except ImportError:
+            return DeviceLockHold(None, None)
+        key = '%s:%s' % (method_name, device_id)
+        base = os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+        queue_dir = base + '.queue'
+        if not os.path.isdir(queue_dir):
+            try:
+                os.makedirs(queue_dir)
+                os.chmod(queue_dir, 0o1777)
+                os.chmod(self.directory, 0o1777)
+            except OSError:
+                # Made by another process meanwhile, or not ours
+                pass
+        with DeviceLock._counter_lock:
+            DeviceLock._counter += 1
+            ticket = '%017d-%d-%d' % (int(time.time() * 1e6), os.getpid(), DeviceLock._counter)
+        ticket_file = os.path.join(queue_dir, ticket)
+        open(ticket_file, 'w').close()
+        fd = os.open(base + '.lock', os.O_RDONLY | os.O_CREAT, 0o644)
+        deadline = time.time() + self.timeout
+        try:
+            while True:
+                tickets = [t for t in sorted(os.listdir(queue_dir)) if DeviceLock._is_alive(queue_dir, t)]
+                if supersede and tickets and tickets[-1] > ticket:
+                    raise WriteSuperseded("A newer write for device '%s' is waiting" % (device_id,))
+                if not tickets or tickets[0] >= ticket:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        return DeviceLockHold(fd, ticket_file)
+                    except (IOError, OSError):
+                        pass
+                if time.time() >= deadline:
+                    raise DeviceBusyError("Device '%s' still busy after %.0f s, %d writes before this one" % (
+                        device_id, self.timeout, len([t for t in tickets if t < ticket])))
+                time.sleep(DeviceLock.poll_interval)
+        except BaseException:
+            os.close(fd)
+            DeviceLockHold._remove(ticket_file)
+            raise
+
+    @staticmethod
+    def _is_alive(queue_dir, ticket):
+        """Tells whether the process of the given ticket is still running. Removes the ticket, if not."""
+        try:
+            pid = int(ticket.split('-')[1])
+            os.kill(pid, 0)
+        except (IndexError, ValueError):
+            return False
+        except OSError as e:
+            # EPERM: running, but not ours
+            if e.errno == errno.EPERM:
+                return True
+            DeviceLockHold._remove(os.path.join(queue_dir, ticket))
+            return False
+        return True
+
+
+class DeviceLockHold:
+    """The lock of a device, as returned by DeviceLock.acquire(). Release it when done, or use it as a context
+    manager.
+    """
+
+    def __init__(self, fd, ticket_file):
+        self.fd = fd
+        self.ticket_file = ticket_file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def release(self):
+        """Lets the next writer have the device."""
+        if self.fd is not None:
+            import fcntl
+            DeviceLockHold._remove(self.ticket_file)
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    @staticmethod
+    def _remove(file_name):
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass
+
+
+class UploadProfile:
+    """Collects the time spent in the phases of an upload (importing the USB packages, finding, opening and
+    configuring the device, rendering, building the header, the transfer and the pauses between the reports) and the
+    time each report takes. Nothing is measured, unless a profile is started:
+
+        profile = UploadProfile.start()
+        ... render and write as usual ...
+        UploadProfile.stop()
+        print(profile.get_stats())
+    """
+
+    # The profile being recorded, if any
+    active = None
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.report_seconds = []
+        self.bytes = 0
+        self.transfer_seconds = 0.0
+        # The writes of the daemon, the batch programmer and write_all run in threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def start():
+        """Starts recording a new profile and returns it."""
+        UploadProfile.active = UploadProfile()
+        return UploadProfile.active
+
+    @staticmethod
+    def stop():
+        """Stops recording and returns the profile recorded."""
+        profile = UploadProfile.active
+        UploadProfile.active = None
+        return profile
+
+    @staticmethod
+    def phase(name):
+        """Returns a context manager measuring the enclosed code as the named phase of the active profile, if any."""
+        if UploadProfile.active is None:
+            return _no_phase
+        return _Phase(UploadProfile.active, name)
+
+    def add(self, name, seconds):
+        """Adds the given seconds to the named phase."""
+        with self._lock:
+            count, total = self.phases.get(name, (0, 0.0))
+            self.phases[name] = (count + 1, total + seconds)
+
+    def add_transfer(self, size, seconds):
+        """Adds a transfer of the given number of bytes."""
+        with self._lock:
+            self.bytes += size
+            self.transfer_seconds += seconds
+
+    @staticmethod
+    def percentile(sorted_values, percent):
+        """Returns the given percentile (nearest rank) of the sorted values, or None if there are none."""
+        if not sorted_values:
+            return None
+        rank = int(math.ceil(percent / 100.0 * len(sorted_values)))
+        return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+    def get_stats(self):
+        """Returns the profile as a dict: 'phases' with a dict of count and seconds per phase, 'reports' with the
+        count, mean, p50, p90, p99 and max seconds per report, 'bytes', 'transfer_seconds' and 'bytes_per_second'.
+        """
+        values = sorted(self.report_seconds)
+        reports = {'count': len(values), 'mean': sum(values) / len(values) if values else None}
+        for percent in (50, 90, 99, 100):
+            reports['max' if percent == 100 else 'p%d' % (percent,)] = UploadProfile.percentile(values, percent)
+        return {
+            'phases': dict((name, {'count': c, 'seconds': t}) for name, (c, t) in self.phases.items()),
+            'reports': reports,
+            'bytes': self.bytes,
+            'transfer_seconds': self.transfer_seconds,
+            'bytes_per_second': self.bytes / self.transfer_seconds if self.transfer_seconds > 0 else 0.0,
+        }
+
+    @staticmethod
+    def print_active():
+        """Stops recording and prints the profile recorded as a summary table, if any."""
+        profile = UploadProfile.stop()
+        if profile:
+            print(profile.format_table())
+
+    def format_table(self):
+        """Returns the profile as a summary table for printing."""
+        stats = self.get_stats()
+        lines = ["%-20s %6s %12s" % ('Phase', 'Count', 'Total [ms]')]
+        for name, (count, total) in self.phases.items():
+            lines.append("%-20s %6d %12.2f" % (name, count, total * 1000))
+        reports = stats['reports']
+        if reports['count']:
+            lines.append("Reports: %d, per report [ms]: mean %.3f, p50 %.3f, p90 %.3f, p99 %.3f, max %.3f" % (
+                reports['count'], reports['mean'] * 1000, reports['p50'] * 1000, reports['p90'] * 1000,
+                reports['p99'] * 1000, reports['max'] * 1000))
+        lines.append("Transfer: %d bytes in %.3f s, %.0f bytes/s" % (stats['bytes'], stats['transfer_seconds'],
+                                                                  stats['bytes_per_second']))
+        return '\n'.join(lines)
+
+
+class WriteMetrics:
+    """Counts the writes per write method and device id since the start of the program: successful, failed, skipped
+    (unchanged content) writes and retries, the bytes and seconds of the transfers and a histogram of the seconds per
+    write. All writes are recorded in WriteMetrics.instance. To export the metrics after each write, set a JSON file
+    and/or a file in the Prometheus text format with configure(). Both files are written atomically, so e.g. the
+    textfile collector of the Prometheus node exporter can pick them up at any time.
+    """
+
+    # Upper bounds of the histogram buckets in seconds, there is one more for everything above
+    buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    counters = (('writes', "Successful writes"),
+                ('failures', "Failed writes"),
+                ('skipped', "Writes skipped as the device got the same content the last time already"),
+                ('retries', "Transfers started over after an error"),
+                ('bytes', "Bytes written"),
+                ('seconds', "Seconds spent writing"))
+
+    # The metrics all writes are recorded in
+    instance = None
+
+    # A sample of format_prometheus(): metric name, method and device labels, further labels and the value
+    _prometheus_sample = re.compile(r'^lednamebadge_(\w+)\{method="((?:[^"\\]|\\.)*)",device="((?:[^"\\]|\\.)*)"'
+                                    r'(?:,le="([^"]*)")?\} (\S+)$')
+
+    def __init__(self, json_file=None, prometheus_file=None):
+        """If the JSON file exists already, counting continues from there, e.g. for repeated runs from cron. Without
+        a JSON file, counting continues from the Prometheus file.
+        """
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self.devices = {}
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        if json_file:
+            self._load()
+        elif prometheus_file:
+            self._load_prometheus()
+
+    @staticmethod
+    def configure(json_file=None, prometheus_file=None):
+        """Starts new metrics for all writes, exported to the given files after each write. Returns them."""
+        WriteMetrics.instance = WriteMetrics(json_file, prometheus_file)
+        return WriteMetrics.instance
+
+    def record(self, method_name, device_id, stats=None, error=None):
+        """Records a write, which either returned the given stats (see WriteMethod.write()) or failed."""
+        with self._lock:
+            entry = self.devices.get((method_name, device_id))
+            if entry is None:
+                entry = dict((name, 0) for name, _ in WriteMetrics.counters)
+                entry['histogram'] = [0] * (len(WriteMetrics.buckets) + 1)
+                self.devices[(method_name, device_id)] = entry
+            if error is not None:
+                entry['failures'] += 1
+            elif stats.get('skipped'):
+                entry['skipped'] += 1
+            else:
+                entry['writes'] += 1
+                entry['retries'] += stats.get('retries', 0)
+                entry['bytes'] += stats['bytes']
+                entry['seconds'] += stats['seconds']
+                bucket = len([b for b in WriteMetrics.buckets if stats['seconds'] > b])
+                entry['histogram'][bucket] += 1
+        self.export()
+
+    def get_snapshot(self):
+        """Returns the metrics as a dict with a list of 'devices', each a dict with the 'method', 'device_id', the
+        counters and the 'histogram' as a list of counts per bucket (see buckets).
+        """
+        with self._lock:
+            devices = []
+            for (method_name, device_id), entry in sorted(self.devices.items()):
+                device = {'method': method_name, 'device_id': device_id}
+                device.update(entry)
+                device['histogram'] = list(entry['histogram'])
+                devices.append(device)
+        return {'time': time.time(), 'buckets': list(WriteMetrics.buckets), 'devices': devices}
+
+    def format_prometheus(self):
+        """Returns the metrics in the Prometheus text format."""
+        snapshot = self.get_snapshot()
+        lines = []
+        for name, description in WriteMetrics.counters:
+            metric = 'lednamebadge_%s_total' % (name,)
+            lines.append('# HELP %s %s.' % (metric, description))
+            lines.append('# TYPE %s counter' % (metric,))
+            for device in snapshot['devices']:
+                lines.append('%s{%s} %s' % (metric, WriteMetrics._labels(device), device[name]))
+        metric = 'lednamebadge_write_seconds'
+        lines.append('# HELP %s Seconds per successful write.' % (metric,))
+        lines.append('# TYPE %s histogram' % (metric,))
+        for device in snapshot['devices']:
+            labels = WriteMetrics._labels(device)
+            count = 0
+            for bound, bucket_count in zip(list(WriteMetrics.buckets) + ['+Inf'], device['histogram']):
+                count += bucket_count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, bound, count))
+            lines.append('%s_sum{%s} %s' % (metric, labels, device['seconds']))
+            lines.append('%s_count{%s} %d' % (metric, labels, count))
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Writes the files given to configure(), if any. Concurrent exports run one after the other, so the last
+        one written has the latest metrics.
+        """
+        with self._export_lock:
+            if self.json_file:
+                WriteMetrics._write_file(self.json_file, json.dumps(self.get_snapshot(), indent=1, sort_keys=True))
+            if self.prometheus_file:
+                WriteMetrics._write_file(self.prometheus_file, self.format_prometheus())
+
+    @staticmethod
+    def _labels(device):
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return 'method="%s",device="%s"' % (escape(device['method']), escape(device['device_id']))
+
+    @staticmethod
+    def _write_file(file_name, text):
+        try:
+            write_file_atomically(file_name, text)
+        except (IOError, OSError) as e:
+            print("Cannot write metrics file %s: %s" % (file_name, e))
+
+    def _load(self):
+        try:
+            with open(self.json_file) as f:
+                snapshot = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if snapshot.get('buckets') != list(WriteMetrics.buckets):
+            return
+        for device in snapshot.get('devices', []):
+            entry = dict((name, device.get(name, 0)) for name, _ in WriteMetrics.counters)
+            entry['histogram'] = list(device['histogram'])
+            self.devices[(device['method'], device['device_id'])] = entry
+
+    def _load_prometheus(self):
+        try:
+            with open(self.prometheus_file) as f:
+                lines = f.read().splitlines()
+        except (IOError, OSError):
+            return
+        bounds = [str(b) for b in WriteMetrics.buckets] + ['+Inf']
+        counters = dict(('%s_total' % (name,), name) for name, _ in WriteMetrics.counters)
+        devices = {}
+        for line in lines:
+            match = WriteMetrics._prometheus_sample.match(line)
+            if not match:
+                continue
+            metric, method_name, device_id, bound, value = match.groups()
+            key = (WriteMetrics._unescape(method_name), WriteMetrics._unescape(device_id))
+            entry = devices.get(key)
+            if entry is None:
+                entry = dict((name, 0) for name, _ in WriteMetrics.counters)
+                # Cumulative counts per bucket, as in the file
+                entry['histogram'] = [0] * len(bounds)
+                devices[key] = entry
+            try:
+                if metric in counters and bound is None:
+                    name = counters[metric]
+                    entry[name] = float(value) if name == 'seconds' else int(value)
+                elif metric == 'write_seconds_bucket' and bound is not None:
+                    entry['histogram'][bounds.index(bound)] = int(value)
+            except ValueError:
+                # Other buckets or garbage, start over
+                return
+        for key, entry in devices.items():
+            cumulative = entry['histogram']
+            entry['histogram'] = [c - p for c, p in zip(cumulative, [0] + cumulative[:-1])]
+            self.devices[key] = entry
+
+    @staticmethod
+    def _unescape(value):
+        return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+WriteMetrics.instance = WriteMetrics()
+
+
+class _Phase:
+    """Measures one phase for UploadProfile.phase()."""
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profile.add(self.name, time.time() - self.start)
+
+
+class _NoPhase:
+    """Measures nothing, for UploadProfile.phase() without an active profile."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_no_phase = _NoPhase()
+
+
+class PayloadTooLargeError(ValueError):
+    """Raised, if the data to write exceeds the size the device can take. Writing more damages the display. The
+    message suggests how many byte-columns to remove, which is also in excess_columns.
+    """
+
+    def __init__(self, size, max_size, rows=11, hint=None):
+        self.size = size
+        self.max_size = max_size
+        self.excess_columns = (size - max_size + rows - 1) // rows
+        message = ("Writing more than %d bytes damages the display! Nothing written. The data has %d bytes, shorten the"
+                   " messages by at least %d byte-columns (%d pixels)." % (max_size, size, self.excess_columns,
+                                                                            self.excess_columns * 8))
+        if hint:
+            message += ' ' + hint
+        ValueError.__init__(self, message)
+
+
+class DeviceBusyError(IOError):
+    """Raised, if the lock of a device could not be acquired in time, see DeviceLock."""
+    pass
+
+
+class WriteSuperseded(Exception):
+    """Raised by DeviceLock.acquire(), if a newer write for the same device is waiting."""
+    pass
+
+
+class WriteCancelled(Exception):
+    """Raised by WriteMethod.write(), if the write was cancelled with WriteMethod.cancel()."""
+    pass
+
+
 class WriteMethod:
     """Base class for a write method. That is a way to communicate with a device. Think of using different access
     libraries or interfaces for communication. Basically it implements the common parts of the functionalities
@@ -442,6 +1427,16 @@ class WriteMethod:
         """Call it from your concrete class in your __init__ method with!
         """
         self.devices = {}
+        self.device_id = None
+        self.pacing = None
+        self.retries = 0
+        self.timeout = None
+        self.cancelled = False
+        self.lock_hold = None
+        # Whether method 'auto' may choose this write method
+        self.auto_select = True
+        # Whether the devices are USB devices listed by the system, so UsbDeviceWatcher notices their changes
+        self.usb_devices = True
 
     def __del__(self):
         self.close()
@@ -459,9 +1454,11 @@ class WriteMethod:
         """
         raise NotImplementedError()
 
-    def open(self, device_id):
+    def open(self, device_id, lock=None):
         """Opens the communication channel to the device, similar to open a file. The device id is one of the ids
         returned by get_available_devices() or 'auto', which selects just the first device in that dict.
+        With a DeviceLock, the lock of the device is acquired before the device is opened and kept until
+        release_lock(). DeviceBusyError and WriteSuperseded are raised as by DeviceLock.acquire().
         It is the common part of the opening process. The concrete open is done in _open() and is to be implemented
         individually.
         """
@@ -473,10 +1470,27 @@ class WriteMethod:
                 if device_id in self.devices.keys():
                     actual_device_id = device_id
 
-            if actual_device_id:
-                return self._open(actual_device_id)
+            if actual_device_id and lock is not None:
+                with UploadProfile.phase('lock'):
+                    self.lock_hold = lock.acquire(self.get_name(), actual_device_id)
+            try:
+                with UploadProfile.phase('open'):
+                    opened = actual_device_id and self._open(actual_device_id)
+            except BaseException:
+                self.release_lock()
+                raise
+            if opened:
+                self.device_id = actual_device_id
+                return True
+            self.release_lock()
         return False
 
+    def release_lock(self):
+        """Releases the lock acquired by open(), if any. Call it after close(), as closing may reset the device."""
+        if self.lock_hold is not None:
+            self.lock_hold.release()
+            self.lock_hold = None
+
     def close(self):
         """Close the communication channel to the device, similar to closing a file.
         This method is to be implemented in your concrete class. It should close and free all handles and resources.
@@ -490,7 +1504,8 @@ class WriteMethod:
         individually.
         """
         if self.is_ready() and not self.devices:
-            self.devices = self._get_available_devices()
+            with UploadProfile.phase('enumerate devices'):
+                self.devices = self._get_available_devices()
         return {did: data[0] for did, data in self.devices.items()}
 
     def is_device_present(self):
@@ -531,56 +1546,190 @@ class WriteMethod:
         """
         raise NotImplementedError()
 
-    def write(self, buf):
-        """Call this to write data to the opened device.
-        The concrete write action is to be implemented in _write()."""
-        self.add_padding(buf, 64)
-        self.check_length(buf, 8192)
-        self._write(buf)
+    def get_device_key(self, device_id=None):
+        """Returns what identifies the opened device, or the given one, for PayloadDigestStore and HotplugWriter. It
+        should change, if another device gets connected in its place, or the same one again. This is the device id,
+        your concrete class may know better.
+        """
+        return device_id or self.device_id
+
+    def set_pacing(self, pacing):
+        """Sets the pause between two reports written to the device. It is one of:
+            * None: the default of the concrete write method,
+            * 'none' or 0: no pause at all,
+            * a number (or a string of it): a fixed pause in seconds,
+            * 'adaptive': start with the shortest pause known to work for the device model and shorten it further
+              until a write fails. Then back off and start over.
+        Only write methods which need such pauses use it, currently that is libusb.
+        """
+        if pacing is None or pacing == 'adaptive':
+            self.pacing = pacing
+        elif pacing == 'none':
+            self.pacing = 0.0
+        else:
+            try:
+                self.pacing = max(float(pacing), 0.0)
+            except (TypeError, ValueError):
+                raise ValueError("Please give 'none', 'adaptive' or a number of seconds as pacing: " + str(pacing))
+
+    def set_retries(self, retries=0, timeout=None):
+        """Sets how often a failed transfer is started over, beginning with the header, as the device expects it first.
+        Before each retry, write() waits retry_backoff seconds, doubled with each further retry. The timeout is the
+        maximum time per report in seconds, None for the default of the USB library. Only write methods with a
+        timeout per report use it, currently that is libusb.
+        """
+        self.retries = max(int(retries), 0)
+        self.timeout = timeout
 
-    @staticmethod
-    def add_padding(buf, block_size):
-        """The given data array will be extended with zeros according to the given block size. SO, afterwards the
-        length of the array is a multiple of block_size.
+    # The pause before the first retry in seconds, see set_retries()
+    retry_backoff = 0.1
+
+    def cancel(self):
+        """Stops a write() running in another thread before the next report. That write() raises WriteCancelled. The
+        device is left with a partial write, which is replaced completely by the next write(). A cancel() while no
+        write() is running has no effect on the next one.
         """
-        need_padding = len(buf) % block_size
-        if need_padding:
-            buf.extend((0,) * (block_size - need_padding))
+        self.cancelled = True
+
+    def check_cancelled(self):
+        """Call this from your concrete _write() before each report, to make cancel() work."""
+        if self.cancelled:
+            raise WriteCancelled("Write to %s cancelled" % (self.device_id,))
+
+    def write(self, buf):
+        """Call this to write data to the opened device.
+        The concrete write action is to be implemented in _write().
+        Returns a dict with the number of bytes written, the transfer time in seconds and the resulting bytes per
+        second. The concrete write method may add more entries.
+        The given data array is not modified, the padding is done in a copy."""
+        # A cancel() of an earlier write, which finished meanwhile, is not meant for this one
+        self.cancelled = False
+        reports = ReportFramer(buf)
+        self.check_length(reports.data, 8192)
+        start = time.time()
+        retries = 0
+        try:
+            while True:
+                try:
+                    with UploadProfile.phase('transfer'):
+                        details = self._write(reports)
+                    break
+                except self._get_transfer_errors() as e:
+                    if retries >= self.retries:
+                        raise
+                    backoff = self.retry_backoff * 2 ** retries
+                    retries += 1
+                    print("Write failed (%s), starting over in %.2f s (retry %d of %d)" % (e, backoff, retries,
+                                                                                          self.retries))
+                    with UploadProfile.phase('retry'):
+                        time.sleep(backoff)
+                    self.check_cancelled()
+        except WriteCancelled:
+            raise
+        except (Exception, SystemExit) as e:
+            WriteMetrics.instance.record(self.get_name(), self.device_id, error=e)
+            raise
+        finally:
+            self.cancelled = False
+        seconds = time.time() - start
+        size = len(reports.data)
+        if UploadProfile.active:
+            UploadProfile.active.add_transfer(size, seconds)
+        stats = {'bytes': size, 'seconds': seconds, 'bytes_per_second': size / seconds if seconds > 0 else 0.0}
+        if details:
+            stats.update(details)
+        stats['retries'] = stats.get('retries', 0) + retries
+        WriteMetrics.instance.record(self.get_name(), self.device_id, stats)
+        print("Written %d bytes in %.2f s (%.0f bytes/s)" % (stats['bytes'], seconds, stats['bytes_per_second']))
+        return stats
 
     @staticmethod
     def check_length(buf, max_size):
-        """Just checks the length of the given data array and abort the program execution if it exceeds max_size.
+        """Just checks the length of the given data array and raises PayloadTooLargeError if it exceeds max_size.
         """
         if len(buf) > max_size:
-            print("Writing more than %d bytes damages the display! Nothing written." % (max_size,))
-            sys.exit(1)
+            raise PayloadTooLargeError(len(buf), max_size)
 
-    def _write(self, buf):
-        """Write the given data array to the opened device.
-        This method is to be implemented in your concrete class. It shall write the given data array to the opened
-        device.
+    def _get_transfer_errors(self):
+        """Returns the exception classes of failed transfers, which write() retries. Your concrete class may add the
+        ones of its library.
+        """
+        return IOError, OSError
+
+    def _write(self, reports):
+        """Write the given data to the opened device. It comes as a ReportFramer, already padded and split into reports.
+        This method is to be implemented in your concrete class. It shall write the reports to the opened device in
+        their order. It may return a dict with additional statistics, which is merged into the result of write().
         """
         raise NotImplementedError()
 
 
+class ReportFramer:
+    """The data for one write, split into the reports of 64 bytes each, without copying report by report: the data is
+    copied once into a zero padded buffer and the reports are views of it. For hidapi, which needs a report id in front
+    of each report, hid_report() fills one preallocated buffer in place. For pyusb, which copies everything but an
+    array('B') into a new one, usb_report() does the same with a preallocated array. So there is no garbage created per
+    report.
+    """
+
+    report_size = 64
+
+    def __init__(self, buf):
+        self.count = (len(buf) + ReportFramer.report_size - 1) // ReportFramer.report_size
+        self.data = bytearray(self.count * ReportFramer.report_size)
+        self.data[:len(buf)] = buf
+        view = memoryview(self.data)
+        self.reports = [view[i * ReportFramer.report_size:(i + 1) * ReportFramer.report_size]
+                        for i in range(self.count)]
+        # Report id 0, then the report
+        self._hid_buffer = bytearray(ReportFramer.report_size + 1)
+        self._hid_view = memoryview(self._hid_buffer)[1:]
+        self._usb_buffer = array('B', [0] * ReportFramer.report_size)
+        self._usb_view = memoryview(self._usb_buffer)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.reports)
+
+    def __getitem__(self, i):
+        """Returns report i as a memoryview."""
+        return self.reports[i]
+
+    def hid_report(self, i):
+        """Returns report i prefixed by the report id 0 in a buffer, which is reused for the next call."""
+        self._hid_view[:] = self.reports[i]
+        return self._hid_buffer
+
+    def usb_report(self, i):
+        """Returns report i in an array('B'), which is reused for the next call."""
+        self._usb_view[:] = self.reports[i]
+        return self._usb_buffer
+
+
 class WriteLibUsb(WriteMethod):
     """Write to a device using pyusb and libusb. The device ids consist of the bus number, the device number on that bus
     and the endpoint number.
     """
-    _module_loaded = False
-    try:
-        import usb.core
-        import usb.util
-        _module_loaded = True
-        print("Module usb.core detected")
-    except:
-        pass
+    # The modules are imported on first use, see _load_module(). None means not tried yet.
+    _module_loaded = None
+    usb = None
+
+    # The pause between two reports, if no pacing is given. The devices seem to need some time for each report.
+    default_delay = 0.1
+    # Shortest pause between two reports, which worked with adaptive pacing, per device model.
+    _learned_delays = {}
+    # Longest pause between two reports, which failed with adaptive pacing, per device model. Never tried again.
+    _failed_delays = {}
 
     def __init__(self):
         WriteMethod.__init__(self)
         self.description = None
         self.dev = None
         self.endpoint = None
+        self.configured = False
+        self.delay = WriteLibUsb.default_delay
 
     def get_name(self):
         return 'libusb'
@@ -592,36 +1741,40 @@ class WriteLibUsb(WriteMethod):
         self.description = self.devices[device_id][0]
         self.dev = self.devices[device_id][1]
         self.endpoint = self.devices[device_id][2]
+        self.configured = False
         print("Libusb device initialized")
         return True
 
     def close(self):
         if self.dev:
-            self.dev.reset()
+            # Not written, e.g. skipped as unchanged: no need to restart the device
+            if self.configured:
+                self.dev.reset()
             WriteLibUsb.usb.util.dispose_resources(self.dev)
         self.description = None
         self.dev = None
         self.endpoint = None
+        self.configured = False
 
     def _get_available_devices(self):
         devs = WriteLibUsb.usb.core.find(idVendor=0x0416, idProduct=0x5020, find_all=True)
         devices = {}
         for d in devs:
+            # Only looked at, another process may be writing to the device. It is configured before the first write,
+            # see _configure(), within the lock of the device, if any. Only a device without a configuration at all
+            # gets one here, as nobody can be writing to it.
             try:
-                # win32: NotImplementedError: is_kernel_driver_active
-                if d.is_kernel_driver_active(0):
-                    d.detach_kernel_driver(0)
-            except:
-                pass
-            try:
-                d.set_configuration()
+                cfg = d.get_active_configuration()[0, 0]
             except WriteLibUsb.usb.core.USBError:
-                # TODO: use all the nice output in _find_write_method(), somehow.
-                print("No read access to device list!")
-                LedNameBadge._print_sudo_hints()
-                sys.exit(1)
+                try:
+                    d.set_configuration()
+                    cfg = d.get_active_configuration()[0, 0]
+                except WriteLibUsb.usb.core.USBError:
+                    # TODO: use all the nice output in _find_write_method(), somehow.
+                    print("No read access to device list!")
+                    LedNameBadge._print_sudo_hints()
+                    sys.exit(1)
 
-            cfg = d.get_active_configuration()[0, 0]
             eps = WriteLibUsb.usb.util.find_descriptor(
                 cfg,
                 find_all=True,
@@ -634,15 +1787,72 @@ class WriteLibUsb(WriteMethod):
         return devices
 
     def is_ready(self):
+        return WriteLibUsb._load_module()
+
+    @staticmethod
+    def _load_module():
+        """Imports pyusb, the first time this write method is considered. Returns True, if it is available."""
+        if WriteLibUsb._module_loaded is None:
+            WriteLibUsb._module_loaded = False
+            with UploadProfile.phase('import backends'):
+                try:
+                    import usb.core
+                    import usb.util
+                    WriteLibUsb.usb = usb
+                    WriteLibUsb._module_loaded = True
+                    print("Module usb.core detected")
+                except:
+                    pass
         return WriteLibUsb._module_loaded
 
     def has_device(self):
         return self.dev is not None
 
-    def _write(self, buf):
+    def _get_transfer_errors(self):
+        return IOError, OSError, WriteLibUsb.usb.core.USBError
+
+    def _write(self, reports):
         if not self.dev:
             return
 
+        if not self.configured:
+            with UploadProfile.phase('configure'):
+                self._configure()
+
+        print("Write using %s via libusb" % (self.description,))
+        if self.pacing != 'adaptive':
+            self.delay = WriteLibUsb.default_delay if self.pacing is None else self.pacing
+            self._write_reports(reports, None)
+            return {'delay': self.delay}
+
+        model = (self.dev.idVendor, self.dev.idProduct, self.dev.bcdDevice)
+        floor = WriteLibUsb._get_delay_floor(model)
+        self.delay = max(WriteLibUsb._learned_delays.get(model, WriteLibUsb.default_delay), floor)
+        for attempt in range(4):
+            try:
+                self._write_reports(reports, floor)
+                break
+            except WriteLibUsb.usb.core.USBError as e:
+                if attempt == 3:
+                    raise
+                # The last pause was too short, the one before worked (unless it was the first). Start over with
+                # that one, the device expects the header first.
+                WriteLibUsb._failed_delays[model] = max(self.delay, WriteLibUsb._failed_delays.get(model, 0.0))
+                floor = WriteLibUsb._get_delay_floor(model)
+                self.delay = floor
+                print("Write failed (%s), starting over with %.3f s between reports" % (e, self.delay))
+        WriteLibUsb._learned_delays[model] = self.delay
+        return {'delay': self.delay, 'retries': attempt}
+
+    @staticmethod
+    def _get_delay_floor(model):
+        """Returns the shortest pause to try with adaptive pacing: one shortening step above the longest one failed."""
+        if model not in WriteLibUsb._failed_delays:
+            return 0.0
+        return max(WriteLibUsb._failed_delays[model] / 0.75, 0.001)
+
+    def _configure(self):
+        """Prepares the opened device for writing. Needed only once after opening, also for multiple writes."""
         try:
             # win32: NotImplementedError: is_kernel_driver_active
             if self.dev.is_kernel_driver_active(0):
@@ -657,25 +1867,39 @@ class WriteLibUsb(WriteMethod):
             print("No write access to device!")
             LedNameBadge._print_sudo_hints()
             sys.exit(1)
+        self.configured = True
 
-        print("Write using %s via libusb" % (self.description,))
-        for i in range(int(len(buf) / 64)):
-            time.sleep(0.1)
-            self.endpoint.write(buf[i * 64:i * 64 + 64])
+    def _write_reports(self, reports, floor):
+        """Writes the reports with self.delay seconds pause before each. If floor is not None, the pause is shortened
+            after each report, but not below floor.
+        """
+        profile = UploadProfile.active
+        for i in range(len(reports)):
+            report = reports.usb_report(i)
+            if self.delay:
+                with UploadProfile.phase('pacing'):
+                    time.sleep(self.delay)
+            self.check_cancelled()
+            start = time.time()
+            if self.timeout is None:
+                self.endpoint.write(report)
+            else:
+                self.endpoint.write(report, int(self.timeout * 1000))
+            if profile:
+                profile.report_seconds.append(time.time() - start)
+            if floor is not None:
+                self.delay = max(self.delay * 0.75 if self.delay * 0.75 >= 0.001 else 0.0, floor)
 
 
 class WriteUsbHidApi(WriteMethod):
     """Write to a device connected to USB using pyhidapi and libhidapi. The device ids are simply the device paths as
     used by libhidapi.
     """
-    _module_loaded = False
-    try:
-        import pyhidapi
-        pyhidapi.hid_init()
-        _module_loaded = True
-        print("Module pyhidapi detected")
-    except:
-        pass
+    # The module is imported on first use, see _load_module(). None means not tried yet.
+    _module_loaded = None
+    pyhidapi = None
+    # Where Linux lists the hidraw devices, see get_device_key()
+    sysfs_hidraw_dir = '/sys/class/hidraw'
 
     def __init__(self):
         WriteMethod.__init__(self)
@@ -689,6 +1913,16 @@ class WriteUsbHidApi(WriteMethod):
     def get_description(self):
         return 'Program a device connected via USB using the pyhidapi package and libhidapi.'
 
+    def get_device_key(self, device_id=None):
+        # The kernel reuses the /dev/hidrawN paths for other devices. The sysfs path of the HID device has the USB port
+        # and a number counting up with each connection instead.
+        device_id = device_id or self.device_id
+        if device_id and device_id.startswith('/dev/hidraw'):
+            link = os.path.join(WriteUsbHidApi.sysfs_hidraw_dir, os.path.basename(device_id), 'device')
+            if os.path.exists(link):
+                return os.path.realpath(link)
+        return device_id
+
     def _open(self, device_id):
         self.description = self.devices[device_id][0]
         self.path = self.devices[device_id][1]
@@ -715,22 +1949,122 @@ class WriteUsbHidApi(WriteMethod):
         return devices
 
     def is_ready(self):
+        return WriteUsbHidApi._load_module()
+
+    @staticmethod
+    def _load_module():
+        """Imports and initializes pyhidapi, the first time this write method is considered. Returns True, if it is
+        available."""
+        if WriteUsbHidApi._module_loaded is None:
+            WriteUsbHidApi._module_loaded = False
+            with UploadProfile.phase('import backends'):
+                try:
+                    import pyhidapi
+                    pyhidapi.hid_init()
+                    WriteUsbHidApi.pyhidapi = pyhidapi
+                    WriteUsbHidApi._module_loaded = True
+                    print("Module pyhidapi detected")
+                except:
+                    pass
         return WriteUsbHidApi._module_loaded
 
     def has_device(self):
         return self.dev is not None
 
-    def _write(self, buf):
+    def _get_transfer_errors(self):
+        # hid_write() raises RuntimeError, if the transfer failed
+        return IOError, OSError, RuntimeError
+
+    def _write(self, reports):
         if not self.dev:
             return
 
         print("Write using [%s] via hidapi" % (self.description,))
-        for i in range(int(len(buf) / 64)):
-            # sendbuf must contain "report ID" as first byte. "0" does the job here.
-            sendbuf = array('B', [0])
-            # Then, put the 64 payload bytes into the buffer
-            sendbuf.extend(buf[i * 64:i * 64 + 64])
-            WriteUsbHidApi.pyhidapi.hid_write(self.dev, sendbuf)
+        profile = UploadProfile.active
+        for i in range(len(reports)):
+            self.check_cancelled()
+            start = time.time()
+            # The buffer must contain the "report ID" as first byte, followed by the 64 payload bytes.
+            WriteUsbHidApi.pyhidapi.hid_write(self.dev, reports.hid_report(i))
+            if profile:
+                profile.report_seconds.append(time.time() - start)
+
+
+class WriteCapture(WriteMethod):
+    """Records the reports with timestamps instead of writing them to a device, in memory (see captured) or in a
+    file. It can simulate the time a device needs per report. It needs no hardware, so it serves as a
+    stand-in device for tests and benchmarks. It is never chosen by method 'auto'. The device ids are 'capture:0',
+    'capture:1' and so on, see configure().
+    """
+
+    # Settings for all devices, see configure()
+    file_name = None
+    latency = 0.0
+    device_count = 1
+    # The reports recorded in memory, as tuples of (timestamp, device id, report bytes)
+    captured = []
+    _lock = threading.Lock()
+
+    def __init__(self):
+        WriteMethod.__init__(self)
+        self.auto_select = False
+        self.usb_devices = False
+        self.file = None
+
+    @staticmethod
+    def configure(file_name=None, latency=0.0, device_count=1):
+        """Sets the file to append the reports to as lines of timestamp, device id and the hex encoded report (None to
+        keep them in memory), the seconds each report takes and the number of devices simulated. Also drops the reports
+        captured in memory so far.
+        """
+        WriteCapture.file_name = file_name
+        WriteCapture.latency = latency
+        WriteCapture.device_count = device_count
+        WriteCapture.captured = []
+
+    def get_name(self):
+        return 'capture'
+
+    def get_description(self):
+        return 'Record the reports in memory or a file instead of writing to a device, e.g. for tests and benchmarks.'
+
+    def _open(self, device_id):
+        if WriteCapture.file_name:
+            self.file = open(WriteCapture.file_name, 'a')
+        print("Capture device initialized")
+        return True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _get_available_devices(self):
+        return {'capture:%d' % (i,): ('Capture device %d' % (i,),) for i in range(WriteCapture.device_count)}
+
+    def is_ready(self):
+        return True
+
+    def has_device(self):
+        return self.device_id is not None
+
+    def _write(self, reports):
+        print("Write using %s via capture" % (self.devices[self.device_id][0],))
+        profile = UploadProfile.active
+        for report in reports:
+            self.check_cancelled()
+            start = time.time()
+            if WriteCapture.latency:
+                time.sleep(WriteCapture.latency)
+            entry = (time.time(), self.device_id, bytes(report))
+            if self.file is None:
+                WriteCapture.captured.append(entry)
+            else:
+                with WriteCapture._lock:
+                    self.file.write("%.6f %s %s\n" % (entry[0], entry[1], binascii.hexlify(entry[2]).decode('ascii')))
+            if profile:
+                profile.report_seconds.append(time.time() - start)
+        return {'latency': WriteCapture.latency}
 
 
 class LedNameBadge:
@@ -742,7 +2076,7 @@ class LedNameBadge:
     )
 
     @staticmethod
-    def header(lengths, speeds, modes, blinks, ants, brightness=100, date=datetime.now()):
+    def header(lengths, speeds, modes, blinks, ants, brightness=100, date=datetime.now(), display_type='11x44'):
         """Create a protocol header
             * length, speeds, modes, blinks, ants are iterables with at least one element
             * lengths[0] is the number of chars/byte-columns of the first text/bitmap, lengths[1] of the second,
@@ -754,13 +2088,17 @@ class LedNameBadge:
             * brightness, if given, is any number, but it'll be limited to 25, 50, 75, 100 (percent), here
             * date, if given, is a datetime object. It will be written in the header, but is not to be seen on the
               devices screen.
+            * display_type, if given, is one of the names in DisplayGeometry.known. It defines the number of bytes per
+              byte-column, which is needed to check the lengths.
         """
+        rows = DisplayGeometry.get(display_type).rows
         try:
             lengths_sum = sum(lengths)
         except:
             raise TypeError("Please give a list or tuple with at least one number: " + str(lengths))
-        if lengths_sum > (8192 - len(LedNameBadge._protocol_header_template)) / 11 + 1:
-            raise ValueError("The given lengths seem to be far too high: " + str(lengths))
+        size = len(LedNameBadge._protocol_header_template) + lengths_sum * rows
+        if size > 8192:
+            raise PayloadTooLargeError(size, 8192, rows, "The given lengths are: " + str(list(lengths)))
 
         ants = LedNameBadge._prepare_iterable(ants, 0, 1)
         blinks = LedNameBadge._prepare_iterable(blinks, 0, 1)
@@ -802,6 +2140,21 @@ class LedNameBadge:
 
         return h
 
+    @staticmethod
+    def build_buffer(bitmaps, speeds=(4,), modes=(0,), blinks=(0,), ants=(0,), brightness=100, date=None,
+                     display_type='11x44'):
+        """Returns the complete data for write() as an array: the protocol header followed by the given bitmaps.
+            The bitmaps are tuples of (buffer, length_in_byte_columns) as returned by SimpleTextAndIcons.bitmap().
+            The other parameters are the same as with header(), date defaults to now.
+        """
+        with UploadProfile.phase('header'):
+            buf = array('B')
+            buf.extend(LedNameBadge.header([b[1] for b in bitmaps], speeds, modes, blinks, ants, brightness,
+                                           date or datetime.now(), display_type))
+            for b in bitmaps:
+                buf.extend(b[0])
+        return buf
+
     @staticmethod
     def _prepare_iterable(iterable, min_, max_):
         try:
@@ -812,7 +2165,8 @@ class LedNameBadge:
             raise TypeError("Please give a list or tuple with at least one number: " + str(iterable))
 
     @staticmethod
-    def write(buf, method='auto', device_id='auto'):
+    def write(buf, method='auto', device_id='auto', pacing=None, digests=None, force=False, lock=None, retries=0,
+              timeout=None):
         """Write the given buffer to the given device.
             It has to begin with a protocol header as provided by header() and followed by the bitmap data.
             In short: the bitmap data is organized in bytes with 8 horizontal pixels per byte and 11 resp. 12
@@ -822,11 +2176,112 @@ class LedNameBadge:
             get_available_methods() and get_available_device_ids(). There are two special values each: 'list'
             will print the implemented / available write methods resp. the available devices, 'auto' (default) will
             choose an appropriate write method resp. the first device found.
+            The pacing is the pause between the reports written to the device, see WriteMethod.set_pacing().
+            With a PayloadDigestStore as digests, the write is skipped, if the device got the same data (except the
+            date) the last time already, unless force is True.
+            With a DeviceLock as lock, other processes using it do not write to the device at the same time. Raises
+            DeviceBusyError, if the device stays busy too long.
+            A failed transfer is started over up to retries times, the timeout is the time allowed per report, see
+            WriteMethod.set_retries(). The number of retries done is 'retries' in the transfer statistics.
+            Returns a dict with the transfer statistics, see WriteMethod.write(), or None if nothing was written.
+            If the write was skipped, 'skipped' is True in there. If a newer write for the device was waiting (see
+            DeviceLock), 'superseded' is True.
         """
-        write_method = LedNameBadge._find_write_method(method, device_id)
+        try:
+            write_method = LedNameBadge._find_write_method(method, device_id, lock)
+        except WriteSuperseded:
+            return LedNameBadge._superseded()
         if write_method:
-            write_method.write(buf)
+            try:
+                write_method.set_pacing(pacing)
+                write_method.set_retries(retries, timeout)
+                return LedNameBadge._write_unless_unchanged(write_method, buf, digests, force)
+            finally:
+                # The device may get reset when closed, that is within the lock
+                with UploadProfile.phase('close'):
+                    write_method.close()
+                write_method.release_lock()
+        return None
+
+    @staticmethod
+    def _superseded():
+        """Returns the transfer statistics of a write given up for a newer one, see DeviceLock."""
+        print("Not written, a newer write for this device is waiting.")
+        return {'bytes': 0, 'seconds': 0.0, 'bytes_per_second': 0.0, 'superseded': True}
+
+    @staticmethod
+    def _write_unless_unchanged(write_method, buf, digests, force):
+        """Writes with the given opened write method, unless digests (if not None) tells, that the device shows the
+            same data already.
+        """
+        if digests is not None and not force and digests.is_unchanged(write_method.get_name(),
+                                                                      write_method.get_device_key(), buf):
+            print("Not written, the device got the same content the last time already. Force writing to write anyway.")
+            stats = {'bytes': 0, 'seconds': 0.0, 'bytes_per_second': 0.0, 'skipped': True}
+            WriteMetrics.instance.record(write_method.get_name(), write_method.device_id, stats)
+            return stats
+        stats = write_method.write(buf)
+        if digests is not None:
+            digests.put(write_method.get_name(), write_method.get_device_key(), buf)
+        return stats
+
+    @staticmethod
+    def write_all(buf, method='auto', pacing=None, max_workers=None, lock=None, retries=0, timeout=None):
+        """Write the given buffer to all devices available with the given write method at the same time. Each device
+            is opened on its own and written to in a thread of its own, at most max_workers at the same time (default:
+            all). So it takes about as long as writing to one device. The lock, retries and timeout apply to each
+            device as with write().
+            Returns a dict with the device ids as the keys and a dict for each device as the values. These contain
+            'ok' (True if successful), 'error' (the error message or None), 'total_seconds' (for opening, writing and
+            closing) and, if successful, the transfer statistics as returned by write().
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        write_method = LedNameBadge._find_write_method(method, 'all')
+        device_ids = sorted(write_method.devices.keys())
+        with ThreadPoolExecutor(max_workers or len(device_ids)) as pool:
+            results = pool.map(lambda did: LedNameBadge._write_one_of_all(write_method, did, buf, pacing, lock,
+                                                                          retries, timeout), device_ids)
+            return dict(zip(device_ids, results))
+
+    @staticmethod
+    def _write_one_of_all(found_method, device_id, buf, pacing, lock=None, retries=0, timeout=None):
+        """Writes to one of the devices found by the given write method with a write method object of its own. The
+            devices are not looked for again.
+        """
+        start = time.time()
+        write_method = found_method.__class__()
+        write_method.devices = {device_id: found_method.devices[device_id]}
+        try:
+            if not write_method.open(device_id, lock):
+                raise IOError("Cannot open device")
+            write_method.set_pacing(pacing)
+            write_method.set_retries(retries, timeout)
+            result = {'ok': True, 'error': None}
+            result.update(write_method.write(buf))
+        except WriteSuperseded:
+            result = {'ok': True, 'error': None}
+            result.update(LedNameBadge._superseded())
+        except (Exception, SystemExit) as e:
+            result = {'ok': False, 'error': str(e) or e.__class__.__name__}
+        finally:
             write_method.close()
+            write_method.release_lock()
+        result['total_seconds'] = time.time() - start
+        return result
+
+    @staticmethod
+    def open(method='auto', device_id='auto', pacing=None, digests=None, retries=0, timeout=None, lock=None):
+        """Opens the given device for writing multiple times. Returns a LedNameBadgeSession, which keeps the device
+            open and configured between the writes. Close it, when done, or use it as a context manager:
+
+                with LedNameBadge.open() as badge:
+                    badge.write(buf)
+
+            The parameters are the same as with write(). With a DeviceLock, the lock is held for each write and for
+            closing, not in between. Raises IOError, if the device is not available.
+        """
+        return LedNameBadgeSession(method, device_id, pacing, digests, retries, timeout, lock)
 
     @staticmethod
     def get_available_methods():
@@ -851,12 +2306,60 @@ class LedNameBadge:
         return []
 
     @staticmethod
-    def _find_write_method(method, device_id):
+    def _find_write_method(method, device_id, lock=None):
         """Here we try to concentrate all special cases, decisions and messages around the manual or automatic
         selection of write methods and device. This way it is a bit easier to extend or modify the different
         working run time environments (think of operating system, python version, installed libraries and python
-        modules, ands so on.)"""
+        modules, ands so on.) With a DeviceLock, the lock of the device is acquired before opening it, see
+        WriteMethod.open()."""
         auto_order_methods = LedNameBadge._get_auto_order_method_list()
+        method = LedNameBadge._check_write_method(method, auto_order_methods)
+
+        first_method_found = None
+        for m in auto_order_methods:
+            if (method == 'auto' and m.auto_select) or method == m.get_name():
+                if not first_method_found:
+                    first_method_found = m
+                if device_id == 'list':
+                    LedNameBadge._print_available_devices(m)
+                    sys.exit(0)
+                elif device_id == 'all':
+                    # Not opened, see write_all()
+                    if m.is_device_present():
+                        return m
+                elif m.open(device_id, lock):
+                    return m
+
+        device_id_str = ''
+        if device_id != 'auto':
+            device_id_str = ' with device_id %s' % (device_id,)
+
+        print("The device is not available with write method '%s'%s." % (method, device_id_str))
+        if first_method_found:
+            LedNameBadge._print_available_devices(first_method_found)
+        print("* Is a led tag device with vendorID 0x0416 and productID 0x5020 connected?")
+        if device_id != 'auto':
+            print("* Have you given the right device_id?")
+            print("  Find the available device ids with option -D list")
+        print("* If it is connected and still do not work:")
+        LedNameBadge._print_sudo_hints()
+        sys.exit(1)
+
+    @staticmethod
+    def _find_devices(method):
+        """Returns the first write method object of the given name (or any for 'auto') with devices available, or None
+        if there are none at the moment. Nothing is opened and nothing is printed. The method name is expected to be
+        checked by _check_write_method() already."""
+        for m in LedNameBadge._get_auto_order_method_list():
+            if ((method == 'auto' and m.auto_select) or method == m.get_name()) and m.is_device_present():
+                return m
+        return None
+
+    @staticmethod
+    def _check_write_method(method, auto_order_methods):
+        """The part of _find_write_method() deciding about the write method, without looking for devices. Returns the
+        name of the write method to be used, or 'auto' to use the first of auto_order_methods with a device available.
+        Prints hints and exits the program, if the given method is not usable."""
         hidapi = [m for m in auto_order_methods if m.get_name() == 'hidapi'][0]
         libusb = [m for m in auto_order_methods if m.get_name() == 'libusb'][0]
 
@@ -917,35 +2420,11 @@ class LedNameBadge:
                 print("Or help us implementing support for Windows.")
                 # But it is not forbidden
 
-        first_method_found = None
-        for m in auto_order_methods:
-            if method == 'auto' or method == m.get_name():
-                if not first_method_found:
-                    first_method_found = m
-                if device_id == 'list':
-                    LedNameBadge._print_available_devices(m)
-                    sys.exit(0)
-                elif m.open(device_id):
-                    return m
-
-        device_id_str = ''
-        if device_id != 'auto':
-            device_id_str = ' with device_id %s' % (device_id,)
-
-        print("The device is not available with write method '%s'%s." % (method, device_id_str))
-        if first_method_found:
-            LedNameBadge._print_available_devices(first_method_found)
-        print("* Is a led tag device with vendorID 0x0416 and productID 0x5020 connected?")
-        if device_id != 'auto':
-            print("* Have you given the right device_id?")
-            print("  Find the available device ids with option -D list")
-        print("* If it is connected and still do not work:")
-        LedNameBadge._print_sudo_hints()
-        sys.exit(1)
+        return method
 
     @staticmethod
     def _get_auto_order_method_list():
-        return [WriteUsbHidApi(), WriteLibUsb()]
+        return [WriteUsbHidApi(), WriteLibUsb(), WriteCapture()]
 
     @staticmethod
     def _print_available_methods(methods):
@@ -1026,12 +2505,985 @@ class LedNameBadge:
             print("* Best: add a udev rule like described in README.md.")
 
 
+class LedNameBadgeSession:
+    """A long-lived connection to one device. The write method and device are found and opened once, then any number of
+    buffers can be written without finding, configuring and resetting the device each time. If a write fails, the
+    device is opened again and the write is repeated once. Get one with LedNameBadge.open().
+    """
+
+    def __init__(self, method='auto', device_id='auto', pacing=None, digests=None, retries=0, timeout=None,
+                 lock=None):
+        self.method = method
+        self.device_id = device_id
+        self.pacing = pacing
+        self.digests = digests
+        self.retries = retries
+        self.timeout = timeout
+        self.lock = lock
+        self.write_method = None
+        self._connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, buf, force=False):
+        """Writes the given buffer, like LedNameBadge.write(), and returns the transfer statistics."""
+        if self.write_method is None:
+            self._connect()
+        hold = None
+        try:
+            if self.lock is not None:
+                try:
+                    with UploadProfile.phase('lock'):
+                        hold = self.lock.acquire(self.write_method.get_name(), self.write_method.device_id)
+                except WriteSuperseded:
+                    return LedNameBadge._superseded()
+            try:
+                return LedNameBadge._write_unless_unchanged(self.write_method, buf, self.digests, force)
+            except (IOError, OSError) as e:
+                print("Write failed (%s), opening the device again" % (e,))
+                self._close()
+                self._connect()
+                return LedNameBadge._write_unless_unchanged(self.write_method, buf, self.digests, force)
+        finally:
+            if hold is not None:
+                hold.release()
+
+    def close(self):
+        """Closes the device. A later write() opens it again. With a lock, it is closed within the lock, as closing
+        may reset the device.
+        """
+        if self.write_method is not None:
+            hold = None
+            if self.lock is not None:
+                try:
+                    # Not given up for newer writes, the device needs to be closed anyway
+                    hold = self.lock.acquire(self.write_method.get_name(), self.write_method.device_id, False)
+                except DeviceBusyError as e:
+                    print("Closing anyway: %s" % (e,))
+            try:
+                self._close()
+            finally:
+                if hold is not None:
+                    hold.release()
+
+    def _close(self):
+        if self.write_method is not None:
+            self.write_method.close()
+            self.write_method = None
+
+    def get_device_id(self):
+        """Returns the id of the opened device, which is the one found for 'auto', or None, if not open."""
+        return self.write_method.device_id if self.write_method else None
+
+    def _connect(self):
+        try:
+            self.write_method = LedNameBadge._find_write_method(self.method, self.device_id)
+        except SystemExit:
+            # Not ending the program from within a library session
+            raise IOError("The device is not available with write method '%s' and device id '%s'" % (
+                self.method, self.device_id))
+        self.write_method.set_pacing(self.pacing)
+        self.write_method.set_retries(self.retries, self.timeout)
+
+
+class CoalescingWriter:
+    """Writes to one device in the background, the latest content only: while a write is running, a newer buffer
+    replaces the one waiting (if any), which is then counted as merged. Also, the writes start at least min_interval
+    seconds apart. So a fast stream of updates never piles up behind the slow transfers.
+    """
+
+    def __init__(self, session, min_interval=0.0, force=False):
+        """The session is a LedNameBadgeSession to write with, force is passed to its write()."""
+        self.session = session
+        self.min_interval = min_interval
+        self.force = force
+        self.submitted = 0
+        self.written = 0
+        self.merged = 0
+        self.failed = 0
+        self.truncated = 0
+        self._pending = None
+        self._closed = False
+        self._last_start = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, buf):
+        """Schedules the given buffer for writing, replacing the one still waiting. Returns immediately."""
+        with self._condition:
+            self.submitted += 1
+            if self._pending is not None:
+                self.merged += 1
+            self._pending = buf
+            self._condition.notify()
+
+    def follow(self, lines, creator, speeds=(4,), modes=(0,), blinks=(0,), ants=(0,), brightness=100,
+               display_type='11x44'):
+        """Submits each non-empty line of the given iterable as the message, as literal text: unknown characters
+            (also tabs) are shown as '?' like with Ticker, and colons as they are. A line too long for the device is
+            shortened to fit.
+        """
+        for line in lines:
+            text = line.rstrip('\r\n')
+            if not text:
+                continue
+            text = u''.join(c if c in SimpleTextAndIcons.char_bitmaps else u'?' for c in text)
+            try:
+                buf = LedNameBadge.build_buffer([creator.bitmap_text(text.replace(':', '::'))], speeds, modes,
+                                                blinks, ants, brightness, display_type=display_type)
+            except PayloadTooLargeError as e:
+                # One byte-column per character
+                self.truncated += 1
+                print("Line shortened by %d characters to fit: %s" % (e.excess_columns, text))
+                text = text[:len(text) - e.excess_columns]
+                buf = LedNameBadge.build_buffer([creator.bitmap_text(text.replace(':', '::'))], speeds, modes,
+                                                blinks, ants, brightness, display_type=display_type)
+            self.submit(buf)
+
+    def close(self):
+        """Writes the buffer still waiting, if any, and stops. Does not close the session."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def get_stats(self):
+        """Returns the numbers of submitted, written, merged and failed buffers and of truncated lines as a dict."""
+        return {'submitted': self.submitted, 'written': self.written, 'merged': self.merged, 'failed': self.failed,
+                'truncated': self.truncated}
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+            if self._last_start is not None:
+                # Newer buffers submitted meanwhile replace the pending one
+                time.sleep(max(self._last_start + self.min_interval - time.time(), 0.0))
+            with self._condition:
+                buf = self._pending
+                self._pending = None
+            self._last_start = time.time()
+            try:
+                self.session.write(buf, self.force)
+                self.written += 1
+            except (Exception, SystemExit) as e:
+                self.failed += 1
+                print("Write failed: %s" % (str(e) or e.__class__.__name__,))
+
+
+class Ticker:
+    """Shows a text too long for one write as a sequence of writes, e.g. a news feed. The text is split at spaces into
+    chunks fitting into one message slot each, and each write (called window here) fills the 8 slots of the device.
+    When a window has scrolled through once, estimated from the scroll speed and the lengths, the next one is written.
+    It is rendered in the background meanwhile. After the last window, the text is read again from its source, and only
+    the slots with changed text are rendered again. The text is shown literally, there are no icons.
+    """
+
+    # Estimated scroll speed in pixels per second for the speeds 1..8, used to time the windows
+    scroll_pixels_per_second = (9.6, 10.4, 16.0, 19.2, 22.4, 36.0, 60.0, 120.0)
+
+    def __init__(self, session, creator, speed=4, mode=0, blink=0, ants=0, brightness=100, display_type='11x44'):
+        """The session is a LedNameBadgeSession to write with, the creator a SimpleTextAndIcons to render with."""
+        self.session = session
+        self.creator = creator
+        self.settings = ([speed], [mode], [blink], [ants], brightness)
+        self.speed = min(max(speed, 1), 8)
+        self.geometry = DisplayGeometry.get(display_type)
+        # As many byte-columns per slot as fit 8 times into one write
+        self.slot_columns = (8192 - len(LedNameBadge._protocol_header_template)) // self.geometry.rows // 8
+        self.written = 0
+        self.failed = 0
+        self.rounds = 0
+        self._renderers = {}
+        self._stop = threading.Event()
+
+    def split(self, text):
+        """Returns the windows for the given text: a list of lists of up to 8 texts, one per slot."""
+        # One byte-column per character, unknown characters are shown as '?'
+        text = u''.join(c if c in SimpleTextAndIcons.char_bitmaps else u'?' for c in u' '.join(text.split()))
+        chunks = []
+        current = u''
+        for word in text.split(u' '):
+            while len(word) > self.slot_columns:
+                if current:
+                    chunks.append(current)
+                    current = u''
+                chunks.append(word[:self.slot_columns])
+                word = word[self.slot_columns:]
+            if not current:
+                current = word
+            elif len(current) + 1 + len(word) <= self.slot_columns:
+                current += u' ' + word
+            else:
+                chunks.append(current)
+                current = word
+        if current:
+            chunks.append(current)
+        return [chunks[i:i + 8] for i in range(0, len(chunks), 8)]
+
+    def get_display_seconds(self, bitmaps):
+        """Returns the estimated time for the given bitmaps to scroll through once: each one enters at one edge of
+        the display and leaves at the other.
+        """
+        pixels = sum(b[1] * 8 + self.geometry.cols for b in bitmaps)
+        return pixels / self.scroll_pixels_per_second[self.speed - 1]
+
+    def run(self, source, rounds=None):
+        """Shows the text of the given source, which is a text or a function returning one, called again for each
+        round through all windows. Runs until stop() is called or the given number of rounds is done.
+        """
+        self._stop.clear()
+        windows = self._read(source)
+        index = 0
+        prepared = self._prepare(index, windows[index]) if windows else None
+        while prepared is not None and not self._stop.is_set():
+            bitmaps = prepared()
+            # Prepare the next window, while this one is shown
+            prepared = None
+            index += 1
+            if index == len(windows):
+                self.rounds += 1
+                index = 0
+                windows = self._read(source) if rounds is None or self.rounds < rounds else []
+            if windows:
+                prepared = self._prepare(index, windows[index])
+            speeds, modes, blinks, ants, brightness = self.settings
+            buf = LedNameBadge.build_buffer(bitmaps, speeds, modes, blinks, ants, brightness,
+                                            display_type=self.geometry.name)
+            try:
+                self.session.write(buf, True)
+                self.written += 1
+            except (Exception, SystemExit) as e:
+                self.failed += 1
+                print("Write failed: %s" % (str(e) or e.__class__.__name__,))
+            if prepared is not None:
+                self._stop.wait(self.get_display_seconds(bitmaps))
+
+    def stop(self):
+        """Lets run() return before the next window."""
+        self._stop.set()
+
+    def get_stats(self):
+        """Returns the numbers of windows written and failed, the rounds done and the rendered and reused slots."""
+        stats = {'written': self.written, 'failed': self.failed, 'rounds': self.rounds, 'rendered': 0, 'reused': 0}
+        for renderer in self._renderers.values():
+            stats['rendered'] += renderer.rendered
+            stats['reused'] += renderer.reused
+        return stats
+
+    def _read(self, source):
+        return self.split(source() if callable(source) else source)
+
+    def _prepare(self, index, texts):
+        """Starts rendering the given window in the background. Returns a function waiting for the bitmaps."""
+        # One renderer per window, so a slot is rendered again only if its text changed since the last round
+        renderer = self._renderers.setdefault(index, SlotRenderer(self.creator))
+        result = {}
+
+        def render():
+            try:
+                result['bitmaps'] = renderer.render([text.replace(u':', u'::') for text in texts])
+            except Exception as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=render)
+        thread.daemon = True
+        thread.start()
+
+        def wait():
+            thread.join()
+            if 'error' in result:
+                raise result['error']
+            return result['bitmaps']
+        return wait
+
+
+class _ValueFormatter(string.Formatter):
+    """Fills in the templates of TemplateScheduler, with the colons in the values escaped as '::', so they are shown
+    as they are instead of starting an icon.
+    """
+
+    def format_field(self, value, format_spec):
+        return string.Formatter.format_field(self, value, format_spec).replace(':', '::')
+
+
+class TemplateScheduler:
+    """Shows messages with values changing over time, e.g. a clock or a queue length. The messages are templates for
+    str.format() with placeholders like {now:%H:%M} or {depth}, evaluated again with each refresh. Colons in the values
+    are shown as they are, while the templates may contain icons like :heart:. Only the messages with changed text are
+    rendered again, the header is reused while the lengths stay the same, and the device is written only if the data
+    differs from the last write.
+    """
+
+    def __init__(self, session, creator, templates, values=None, speeds=(4,), modes=(0,), blinks=(0,), ants=(0,),
+                 brightness=100, display_type='11x44'):
+        """The session is a LedNameBadgeSession to write with, the creator a SimpleTextAndIcons to render with. The
+            values are a dict of the names used in the templates besides 'now' (the time of the refresh) to either a
+            value or a function returning it.
+        """
+        self.session = session
+        self.templates = list(templates)
+        self.values = values or {}
+        self.settings = (speeds, modes, blinks, ants, brightness)
+        self.display_type = display_type
+        self.renderer = SlotRenderer(creator)
+        self.refreshes = 0
+        self.written = 0
+        self.unchanged = 0
+        self.failed = 0
+        self._header = None
+        self._header_lengths = None
+        self._last_written = None
+        self._stop = threading.Event()
+
+    def get_texts(self):
+        """Returns the messages with the placeholders replaced by the current values."""
+        values = {'now': datetime.now()}
+        for name, value in self.values.items():
+            values[name] = value() if callable(value) else value
+        formatter = _ValueFormatter()
+        return [formatter.format(template, **values) for template in self.templates]
+
+    def get_buffer(self):
+        """Returns the data for the current values as an array, rendering only the changed messages."""
+        bitmaps = self.renderer.render(self.get_texts())
+        lengths = [b[1] for b in bitmaps]
+        if lengths != self._header_lengths:
+            speeds, modes, blinks, ants, brightness = self.settings
+            with UploadProfile.phase('header'):
+                self._header = LedNameBadge.header(lengths, speeds, modes, blinks, ants, brightness, datetime.now(),
+                                                   self.display_type)
+            self._header_lengths = lengths
+        buf = array('B', self._header)
+        for b in bitmaps:
+            buf.extend(b[0])
+        return buf
+
+    def refresh(self):
+        """Evaluates the templates and writes the result, if it differs from the last write. Returns True, if
+        written.
+        """
+        self.refreshes += 1
+        buf = self.get_buffer()
+        data = bytes(bytearray(buf))
+        if data == self._last_written:
+            self.unchanged += 1
+            return False
+        self.session.write(buf)
+        self._last_written = data
+        self.written += 1
+        return True
+
+    def run(self, interval, refreshes=None):
+        """Refreshes at multiples of interval seconds (e.g. with 60 at the start of each minute) until stop() is called
+        or the given number of refreshes is done. A failed write is repeated with the next refresh, as is one with
+        values not fitting into the templates or showing unknown characters.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except (IOError, OSError, SystemExit) as e:
+                self.failed += 1
+                print("Write failed: %s" % (str(e) or e.__class__.__name__,))
+            except (KeyError, IndexError, ValueError) as e:
+                self.failed += 1
+                print("Cannot fill in the templates: %s" % (str(e) or e.__class__.__name__,))
+            if refreshes is not None and self.refreshes >= refreshes:
+                break
+            self._stop.wait(interval - time.time() % interval)
+
+    def stop(self):
+        """Lets run() return before the next refresh."""
+        self._stop.set()
+
+    def get_stats(self):
+        """Returns the numbers of refreshes, of writes, of refreshes without a change, of failed refreshes and of the
+        rendered and reused messages as a dict.
+        """
+        stats = {'refreshes': self.refreshes, 'written': self.written, 'unchanged': self.unchanged,
+                 'failed': self.failed}
+        stats.update(self.renderer.get_stats())
+        return stats
+
+
+class UsbDeviceWatcher:
+    """Tells whether devices of a vendor and product id got connected or disconnected, by polling the USB devices
+    listed by Linux in sysfs. A poll costs a directory listing and reading a few bytes per USB device (not per
+    interface): the device number and the vendor id. Only matching devices are remembered, as long as their device
+    number stays the same. It changes also, if a device gets connected again to the same port in between two polls.
+    Looking for the devices with a write method is needed only after a change then. Without sysfs (e.g. other
+    systems), each poll reports a change.
+    """
+
+    sysfs_dir = '/sys/bus/usb/devices'
+
+    def __init__(self, vendor_id=0x0416, product_id=0x5020, sysfs_dir=None):
+        self.ids = ('%04x' % (vendor_id,), '%04x' % (product_id,))
+        if sysfs_dir is not None:
+            self.sysfs_dir = sysfs_dir
+        self.devices = None
+        self._entries = {}  # sysfs entry name -> device number, for the matching devices only
+        self._recheck = False
+
+    def poll(self):
+        """Returns True, if the matching devices changed since the last poll, and at the first poll. Also once more at
+        the poll after a change, as the drivers may need a moment until the device can be found by the write methods.
+        """
+        try:
+            names = os.listdir(self.sysfs_dir)
+        except (IOError, OSError):
+            return True
+        entries = {}
+        for name in names:
+            # Interfaces (named like 1-2:1.0) have no ids, only devices and hubs do.
+            if ':' in name:
+                continue
+            devnum = self._read_attribute(name, 'devnum')
+            if devnum is None:
+                continue
+            if self._entries.get(name) == devnum or self._read_ids(name) == self.ids:
+                entries[name] = devnum
+        changed = self.devices is None or entries != self._entries
+        self._entries = entries
+        if changed:
+            self.devices = sorted(entries)
+            self._recheck = True
+            return True
+        recheck = self._recheck
+        self._recheck = False
+        return recheck
+
+    def _read_ids(self, name):
+        vendor_id = self._read_attribute(name, 'idVendor')
+        if vendor_id != self.ids[0]:
+            return vendor_id, None
+        return vendor_id, self._read_attribute(name, 'idProduct')
+
+    def _read_attribute(self, name, attribute):
+        # None, if missing or e.g. the device is gone already
+        try:
+            with open(os.path.join(self.sysfs_dir, name, attribute)) as f:
+                return f.read().strip() or None
+        except (IOError, OSError):
+            return None
+
+
+class HotplugWriter:
+    """Writes the same data to each device once, as it gets connected, e.g. when programming many badges one after
+    the other. A device is written again only after being disconnected, also if connected again in the meantime (see
+    WriteMethod.get_device_key()). Devices are looked for with the write method only if a UsbDeviceWatcher reports a
+    change.
+    """
+
+    def __init__(self, buf, method='auto', pacing=None, poll_interval=0.5, watcher=None, lock=None, retries=0,
+                 timeout=None):
+        """The method, pacing, lock, retries and timeout are as with LedNameBadge.write()."""
+        self.buf = buf
+        self.method = method
+        self.pacing = pacing
+        self.device_lock = lock
+        self.retries = retries
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.watcher = watcher or UsbDeviceWatcher()
+        self.written = 0
+        self.failed = 0
+        self.enumerations = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, count=None):
+        """Writes to the devices connected until stop() is called or the given number of devices is written."""
+        self._stop.clear()
+        write_method = None
+        done = {}  # device id -> key, of the devices written or being written, until disconnected
+        writers = []
+        print("Waiting for devices...")
+        while not self._stop.is_set() and (count is None or self.written < count):
+            if self.watcher.poll() or (write_method is not None and not write_method.usb_devices):
+                write_method = LedNameBadge._find_devices(self.method)
+                self.enumerations += 1
+                keys = {}
+                if write_method:
+                    keys = dict((did, write_method.get_device_key(did)) for did in write_method.devices)
+                with self._lock:
+                    done = dict((did, key) for did, key in done.items() if keys.get(did) == key)
+                    for did in sorted(set(keys) - set(done)):
+                        done[did] = keys[did]
+                        writer = threading.Thread(target=self._write, args=(write_method, did))
+                        writer.daemon = True
+                        writer.start()
+                        writers.append(writer)
+            writers = [w for w in writers if w.is_alive()]
+            self._stop.wait(self.poll_interval)
+        for writer in writers:
+            writer.join()
+
+    def stop(self):
+        """Lets run() return after the writes running."""
+        self._stop.set()
+
+    def get_stats(self):
+        """Returns the numbers of devices written and failed and of the searches for devices as a dict."""
+        return {'written': self.written, 'failed': self.failed, 'enumerations': self.enumerations}
+
+    def _write(self, write_method, device_id):
+        result = LedNameBadge._write_one_of_all(write_method, device_id, self.buf, self.pacing, self.device_lock,
+                                                self.retries, self.timeout)
+        with self._lock:
+            if result['ok']:
+                self.written += 1
+                print("[%s] '%s' written in %.1f s (%d so far)" % (time.strftime('%H:%M:%S'), device_id,
+                                                                   result['total_seconds'], self.written))
+            else:
+                self.failed += 1
+                print("[%s] '%s' failed after %.1f s: %s" % (time.strftime('%H:%M:%S'), device_id,
+                                                            result['total_seconds'], result['error']))
+
+
+class BatchProgrammer:
+    """Programs many devices with individual content, e.g. one badge per attendee of a conference. Each job (see
+    load_jobs()) is written to exactly one device. The jobs are rendered in a pool of processes in the background,
+    while the devices are programmed: each newly connected device gets the next rendered job. Then it can be
+    disconnected and the next one can be connected (or many at once, with a hub).
+    """
+
+    def __init__(self, jobs, method='auto', pacing=None, display_type='11x44', poll_interval=1.0, processes=None,
+                 watcher=None, lock=None, retries=0, timeout=None):
+        """The jobs are dicts as returned by load_jobs(). The method, pacing, lock, retries and timeout are as with
+            LedNameBadge.write(), the display_type as with SimpleTextAndIcons. Every poll_interval seconds the
+            UsbDeviceWatcher is asked for changes, and then the devices are looked for. The number of rendering
+            processes defaults to the number of CPUs.
+        """
+        self.jobs = jobs
+        self.method = method
+        self.pacing = pacing
+        self.display_type = display_type
+        self.poll_interval = poll_interval
+        self.processes = processes
+        self.watcher = watcher or UsbDeviceWatcher()
+        self.device_lock = lock
+        self.retries = retries
+        self.timeout = timeout
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.start_time = None
+        self._payloads = queue.Queue()
+        self._render_error = None
+        self._unassigned = len(jobs)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load_jobs(file_name, defaults=None):
+        """Reads the jobs from a CSV file (with a header line) or a JSON lines file (one object per line, if the name
+            ends with .jsonl or .json). The fields of a job are:
+            * 'message' or 'messages' (a list, for JSON only) or 'message1' to 'message8': the message texts
+            * 'speed', 'mode', 'blink', 'ants': a number, a list of numbers (JSON only) or comma separated numbers
+            * 'brightness': a number
+            * 'name': something to recognize the job in the progress output, defaults to the first message
+            Missing fields are taken from the defaults dict, which has the same fields.
+            Returns a list of dicts with the keys 'name', 'messages', 'speeds', 'modes', 'blinks', 'ants' and
+            'brightness'.
+        """
+        import csv
+        import io
+
+        with io.open(file_name, encoding='utf-8', newline='') as f:
+            if file_name.endswith('.jsonl') or file_name.endswith('.json'):
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = list(csv.DictReader(f))
+        return [BatchProgrammer._make_job(row, defaults or {}, i + 1) for i, row in enumerate(rows)]
+
+    @staticmethod
+    def _make_job(row, defaults, number):
+        def get(key, default):
+            value = row.get(key)
+            if value is None or value == '':
+                value = defaults.get(key, default)
+            return value
+
+        def ints(key, default):
+            value = get(key, default)
+            if isinstance(value, (list, tuple)):
+                return [int(x) for x in value]
+            return split_to_ints(str(value))
+
+        messages = row.get('messages')
+        if messages is None:
+            keys = sorted((k for k in row if k and re.match('^message[1-8]?$', k)), key=lambda k: k[7:].zfill(1))
+            messages = [row[k] for k in keys if row[k]]
+        elif not isinstance(messages, list) or not all(isinstance(m, (type(u''), str)) for m in messages):
+            raise ValueError("Job %d: 'messages' must be a list of texts: %s" % (number, messages))
+        if not messages:
+            raise ValueError("Job %d has no message: %s" % (number, row))
+        return {
+            'name': get('name', messages[0]),
+            'messages': messages,
+            'speeds': ints('speed', 4),
+            'modes': ints('mode', 0),
+            'blinks': ints('blink', 0),
+            'ants': ints('ants', 0),
+            'brightness': int(get('brightness', 100)),
+        }
+
+    @staticmethod
+    def render_job(job, display_type='11x44'):
+        """Returns the complete data for writing the given job as bytes."""
+        creator = BatchProgrammer._creators.get(display_type)
+        if creator is None:
+            creator = SimpleTextAndIcons(display_type=display_type)
+            BatchProgrammer._creators[display_type] = creator
+        bitmaps = [creator.bitmap(m) for m in job['messages']]
+        return bytes(bytearray(LedNameBadge.build_buffer(bitmaps, job['speeds'], job['modes'], job['blinks'],
+                                                         job['ants'], job['brightness'], display_type=display_type)))
+
+    # One creator per display type and rendering process, reusing its cache for all jobs
+    _creators = {}
+
+    @staticmethod
+    def _render_job_safely(args):
+        try:
+            return BatchProgrammer.render_job(*args), None
+        except (Exception, SystemExit) as e:
+            return None, str(e) or e.__class__.__name__
+
+    def run(self):
+        """Renders and writes all jobs. Returns, when all jobs are written or failed to render. Returns a dict with
+            the numbers of jobs, written, failed and retried (failed writes are retried with the next device) jobs,
+            the total seconds and jobs per minute. If the rendering stops altogether (e.g. the jobs cannot be handed
+            to the rendering processes), the writes running are finished and the error is raised.
+        """
+        self.start_time = time.time()
+        renderer = threading.Thread(target=self._render_all)
+        renderer.daemon = True
+        renderer.start()
+
+        known = {}  # device id -> 'busy' or 'done', until disconnected
+        known_keys = {}  # device id -> key (see WriteMethod.get_device_key()), to tell reconnected devices apart
+        writers = []
+        write_method = None
+        keys = {}
+        print("Waiting for devices to program %d jobs..." % (len(self.jobs),))
+        while self.written + self.failed < len(self.jobs) and self._render_error is None:
+            if self.watcher.poll() or (write_method is not None and not write_method.usb_devices):
+                write_method = LedNameBadge._find_devices(self.method)
+                keys = {}
+                if write_method:
+                    keys = dict((did, write_method.get_device_key(did)) for did in write_method.devices)
+            with self._lock:
+                for did in list(known.keys()):
+                    if keys.get(did) != known_keys[did] and known[did] == 'done':
+                        del known[did]
+                for did in sorted(keys):
+                    if did not in known and self._unassigned > 0:
+                        known[did] = 'busy'
+                        known_keys[did] = keys[did]
+                        self._unassigned -= 1
+                        writer = threading.Thread(target=self._program, args=(write_method, did, known))
+                        writer.daemon = True
+                        writer.start()
+                        writers.append(writer)
+            time.sleep(self.poll_interval)
+
+        for writer in writers:
+            writer.join()
+        if self._render_error is not None:
+            raise self._render_error
+        return self.get_stats()
+
+    def get_stats(self):
+        """Returns the progress so far as a dict, see run()."""
+        seconds = time.time() - self.start_time if self.start_time else 0.0
+        return {
+            'jobs': len(self.jobs),
+            'written': self.written,
+            'failed': self.failed,
+            'retried': self.retried,
+            'seconds': seconds,
+            'jobs_per_minute': 60.0 * self.written / seconds if seconds > 0 else 0.0,
+        }
+
+    def _render_all(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        try:
+            with ProcessPoolExecutor(self.processes) as pool:
+                args = [(job, self.display_type) for job in self.jobs]
+                for job, (payload, error) in zip(self.jobs, pool.map(BatchProgrammer._render_job_safely, args)):
+                    self._payloads.put((job, payload, error))
+        except BaseException as e:
+            self._render_error = e
+            # Wake up all devices waiting for a job
+            for _ in self.jobs:
+                self._payloads.put((None, None, None))
+
+    def _program(self, write_method, device_id, known):
+        """Writes the next rendered job to the given device. Runs in a thread per device. One job is reserved already
+            by the caller.
+        """
+        while True:
+            job, payload, error = self._payloads.get()
+            if job is None:
+                # Rendering stopped, see _render_all()
+                with self._lock:
+                    del known[device_id]
+                return
+            if payload is not None:
+                break
+            with self._lock:
+                self.failed += 1
+                print("Job '%s' failed to render: %s" % (job['name'], error))
+                if self._unassigned == 0:
+                    del known[device_id]
+                    return
+                self._unassigned -= 1
+
+        result = LedNameBadge._write_one_of_all(write_method, device_id, payload, self.pacing, self.device_lock,
+                                                self.retries, self.timeout)
+        with self._lock:
+            known[device_id] = 'done'
+            if result['ok']:
+                self.written += 1
+                stats = self.get_stats()
+                print("[%d/%d] '%s' written to '%s' in %.1f s, %.1f jobs per minute" % (
+                    self.written + self.failed, len(self.jobs), job['name'], device_id, result['total_seconds'],
+                    stats['jobs_per_minute']))
+            else:
+                # Give the job to the next device. This one is skipped until it is connected again.
+                self.retried += 1
+                self._unassigned += 1
+                self._payloads.put((job, payload, None))
+                print("Writing '%s' to '%s' failed: %s" % (job['name'], device_id, result['error']))
+
+
+class BadgeDaemon:
+    """Keeps running and writes to the devices on request, so the start of Python, the search for the devices and their
+    configuration are done once only. The requests come in via a UNIX domain socket, one JSON object per line, and
+    each gets one JSON object per line as response. The requests are:
+    * {"messages": ["Hello", ...], "speed": "4,5", "mode": [0, 1], ..., "device_id": "auto", "force": false}
+      Renders the messages and writes them to the device. The fields are those of BatchProgrammer.load_jobs() plus the
+      device id and force (see LedNameBadge.write()). The response is {"ok": true, "device_id": ..., "bytes": ...,
+      ...} with the transfer statistics, or {"ok": false, "error": "..."}.
+    * {"command": "devices"}: the response contains the available "devices" as a dict of ids and descriptions.
+    * {"command": "stats"}: the response contains the numbers of requests, rejected requests and the render cache
+      statistics.
+    Each device is kept open by a LedNameBadgeSession and has a worker thread with a queue of at most queue_size
+    requests. If that is full, the request is rejected.
+    """
+
+    def __init__(self, socket_path, method='auto', pacing=None, creator=None, digests=None, defaults=None,
+                 queue_size=8, lock=None, retries=0, timeout=None):
+        """The creator is the SimpleTextAndIcons to render with, the digests a PayloadDigestStore to skip unchanged
+            content (or None) and the defaults are used for the fields missing in the requests. With a DeviceLock,
+            each write waits for other processes writing to the device, see LedNameBadge.open(). The retries and
+            timeout are as with LedNameBadge.write().
+        """
+        self.socket_path = socket_path
+        self.method = method
+        self.pacing = pacing
+        self.creator = creator or SimpleTextAndIcons()
+        self.digests = digests
+        self.defaults = defaults or {}
+        self.queue_size = queue_size
+        self.device_lock = lock
+        self.retries = retries
+        self.timeout = timeout
+        self.requests = 0
+        self.rejected = 0
+        self.server = None
+        # device id -> (thread, request queue, session), also for 'auto' as an alias of the device found
+        self._workers = {}
+        self._workers_lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def serve_forever(self):
+        """Listens on the socket until shutdown() is called (or the program is interrupted)."""
+        try:
+            import socketserver
+        except ImportError:  # Python 2
+            import SocketServer as socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line.decode('utf-8'))
+                        if not isinstance(request, dict):
+                            raise ValueError("A request is a JSON object")
+                    except ValueError as e:
+                        response = {'ok': False, 'error': "Invalid request: %s" % (e,)}
+                    else:
+                        response = daemon.handle_request(request)
+                    self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(self.socket_path):
+            if BadgeDaemon._is_listening(self.socket_path):
+                raise IOError("Another daemon is listening on %s already" % (self.socket_path,))
+            # Left over by a daemon not shut down properly
+            os.remove(self.socket_path)
+        self.server = Server(self.socket_path, Handler)
+        print("Listening on %s" % (self.socket_path,))
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            os.remove(self.socket_path)
+            self._stop_workers()
+
+    def shutdown(self):
+        """Stops serve_forever(), call it from another thread."""
+        if self.server:
+            self.server.shutdown()
+
+    def handle_request(self, request):
+        """Handles one request as described above and returns the response as a dict."""
+        with self._stats_lock:
+            self.requests += 1
+            number = self.requests
+        try:
+            command = request.get('command', 'write')
+            if command == 'write':
+                return self._write(request, number)
+            if command == 'devices':
+                write_method = LedNameBadge._find_devices(self.method)
+                return {'ok': True, 'devices': write_method.get_available_devices() if write_method else {}}
+            if command == 'stats':
+                with self._stats_lock:
+                    counts = {'requests': self.requests, 'rejected': self.rejected}
+                return {'ok': True, 'requests': counts['requests'], 'rejected': counts['rejected'],
+                        'render_cache': self.creator.render_cache.get_stats(),
+                        'metrics': WriteMetrics.instance.get_snapshot()}
+            raise ValueError("Unknown command '%s'" % (command,))
+        except (Exception, SystemExit) as e:
+            return {'ok': False, 'error': str(e) or e.__class__.__name__}
+
+    @staticmethod
+    def send_request(socket_path, request, timeout=None):
+        """Sends the given request (a dict) to the daemon listening on the given socket and returns its response."""
+        import socket
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            line = sock.makefile('rb').readline()
+        finally:
+            sock.close()
+        if not line:
+            raise IOError("No response from %s" % (socket_path,))
+        return json.loads(line.decode('utf-8'))
+
+    @staticmethod
+    def _is_listening(socket_path):
+        """Tells whether a daemon accepts connections on the given socket."""
+        import socket
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+            return True
+        except (IOError, OSError):
+            return False
+        finally:
+            sock.close()
+
+    def _write(self, request, number):
+        job = BatchProgrammer._make_job(request, self.defaults, number)
+        with self._render_lock:
+            bitmaps = [self.creator.bitmap(m) for m in job['messages']]
+        buf = LedNameBadge.build_buffer(bitmaps, job['speeds'], job['modes'], job['blinks'], job['ants'],
+                                        job['brightness'], display_type=self.creator.geometry.name)
+
+        requests = self._get_worker(request.get('device_id') or 'auto')[1]
+        reply = queue.Queue(1)
+        try:
+            requests.put_nowait((buf, bool(request.get('force')), reply))
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return {'ok': False, 'error': "Too many requests waiting for the device, try again later"}
+        return reply.get()
+
+    def _get_worker(self, device_id):
+        """Returns the worker of the given device. Opens the device and starts the worker, if there is none yet."""
+        with self._workers_lock:
+            worker = self._workers.get(device_id)
+            if worker is None:
+                session = LedNameBadgeSession(self.method, device_id, self.pacing, self.digests, self.retries,
+                                              self.timeout, self.device_lock)
+                actual_device_id = session.get_device_id()
+                worker = self._workers.get(actual_device_id)
+                if worker is None:
+                    requests = queue.Queue(self.queue_size)
+                    thread = threading.Thread(target=self._serve_device, args=(session, requests))
+                    thread.daemon = True
+                    worker = (thread, requests, session)
+                    thread.start()
+                    self._workers[actual_device_id] = worker
+                else:
+                    session.close()
+                self._workers[device_id] = worker
+            return worker
+
+    @staticmethod
+    def _serve_device(session, requests):
+        """The worker thread of one device: writes the queued buffers one after the other."""
+        while True:
+            item = requests.get()
+            if item is None:
+                break
+            buf, force, reply = item
+            try:
+                result = {'ok': True, 'error': None}
+                result.update(session.write(buf, force))
+                result['device_id'] = session.get_device_id()
+            except (Exception, SystemExit) as e:
+                result = {'ok': False, 'error': str(e) or e.__class__.__name__}
+            reply.put(result)
+        session.close()
+
+    def _stop_workers(self):
+        with self._workers_lock:
+            workers = set(self._workers.values())
+            self._workers.clear()
+        for thread, requests, session in workers:
+            requests.put(None)
+            thread.join()
+
+
 def main():
+    # Imported here, as only the command line needs it
+    import argparse
+
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
                                      description='Upload messages or graphics to a 11x44 led badge via USB HID.\nVersion %s from https://github.com/jnweiger/led-badge-ls32\n -- see there for more examples and for updates.' % __version,
                                      epilog='Example combining image and text:\n sudo %s "I:HEART2:you"' % sys.argv[0])
-    parser.add_argument('-t', '--type', default='11x44',
-                        help="Type of display: supported values are 12x48 or (default) 11x44. Rename the program to led-badge-12x48, to switch the default.")
+    parser.add_argument('-t', '--type',
+                        help="Type of display: supported values are 12x48, 11x55 or (default) 11x44. Rename the program to led-badge-12x48, to switch the default.")
     parser.add_argument('-H',
                         '--hid',
                         default='0',
@@ -1043,25 +3495,80 @@ def main():
     parser.add_argument('-D',
                         '--device-id',
                         default='auto',
-                        help="Force using the given device id, if ambiguous. Use one of 'auto', 'list' or whatever list is printing.")
-    parser.add_argument('-s', '--speed', default='4', help="Scroll speed (Range 1..8). Up to 8 comma-separated values.")
-    parser.add_argument('-B', '--brightness', default='100',
+                        help="Force using the given device id, if ambiguous. Use one of 'auto', 'list', 'all' (write to all devices at the same time) or whatever list is printing.")
+    parser.add_argument('--pacing', default=None,
+                        help="Pause between the USB reports with write method libusb: 'none', 'adaptive' (find the shortest working pause) or seconds (default 0.1).")
+    parser.add_argument('--capture-file', metavar='FILE',
+                        help="With write method 'capture': append the reports to this file instead of keeping them in memory.")
+    parser.add_argument('--capture-latency', metavar='SECONDS', type=float, default=0.0,
+                        help="With write method 'capture': simulate this time needed by the device per report.")
+    parser.add_argument('--capture-devices', metavar='N', type=int, default=1,
+                        help="With write method 'capture': number of devices simulated (default 1).")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print how long the phases of the upload took, including the time per USB report. With several writes (e.g. --follow or --daemon) summed up at the end.")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="Skip the write, if the device got the same content the last time already, also by an earlier run.")
+    parser.add_argument('-f', '--force', action='store_true',
+                        help="Write, even if skipping unchanged content.")
+    parser.add_argument('--state-file', metavar='FILE',
+                        help="Where to remember what was written to which device for --skip-unchanged, which it implies (default %s)." % (
+                            PayloadDigestStore.default_file,))
+    parser.add_argument('--retries', metavar='N', type=int, default=2,
+                        help="Start a failed transfer over, beginning with the header, up to this many times, after a pause doubled with each retry (default 2).")
+    parser.add_argument('--report-timeout', metavar='SECONDS', type=float,
+                        help="With write method libusb: give up a transfer, if one report takes longer than this (default: the one of pyusb, 1 s).")
+    parser.add_argument('--lock-timeout', metavar='SECONDS', type=float, default=60.0,
+                        help="Wait this long at most, while other processes write to the device (default 60). They write one after the other, in the order they started waiting.")
+    parser.add_argument('--supersede', action='store_true',
+                        help="Give up waiting for the device, as soon as a newer write to it starts waiting, as that one overwrites the content anyway.")
+    parser.add_argument('--no-lock', action='store_true',
+                        help="Do not wait for other processes writing to the device.")
+    parser.add_argument('--metrics-json', metavar='FILE',
+                        help="After each write, save counters and a latency histogram per device to this JSON file. Counting continues from the values found in it.")
+    parser.add_argument('--metrics-prom', metavar='FILE',
+                        help="After each write, save the same metrics to this file in the Prometheus text format, e.g. for the textfile collector of the node exporter. Without --metrics-json, counting continues from the values found in it.")
+    # No defaults here, so --send can tell the options given, see option_defaults below
+    parser.add_argument('-s', '--speed', help="Scroll speed (Range 1..8). Up to 8 comma-separated values.")
+    parser.add_argument('-B', '--brightness',
                         help="Brightness for the display in percent: 25, 50, 75, or 100.")
-    parser.add_argument('-m', '--mode', default='0',
+    parser.add_argument('-m', '--mode',
                         help="Up to 8 mode values: Scroll-left(0) -right(1) -up(2) -down(3); still-centered(4); animation(5); drop-down(6); curtain(7); laser(8); See '--mode-help' for more details.")
-    parser.add_argument('-b', '--blink', default='0', help="1: blinking, 0: normal. Up to 8 comma-separated values.")
+    parser.add_argument('-b', '--blink', help="1: blinking, 0: normal. Up to 8 comma-separated values.")
     parser.add_argument('-a',
                         '--ants',
-                        default='0',
                         help="1: animated border, 0: normal. Up to 8 comma-separated values.")
     parser.add_argument('-p', '--preload', metavar='FILE', action='append',
                         help=argparse.SUPPRESS)  # "Load bitmap images. Use ^A, ^B, ^C, ... in text messages to make them visible. Deprecated, embed within ':' instead")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Make the upload smaller: remove blank byte-columns at the start and end of the messages, where the mode shows no difference, and drop messages repeating an earlier one with the same settings.")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help="Keep rendered messages in this directory and reuse them in later runs, as long as the referenced image files are unchanged.")
     parser.add_argument('-l',
                         '--list-names',
                         action='version',
                         help="list named icons to be embedded in messages and exit.",
                         version=':' + ':  :'.join(SimpleTextAndIcons._get_named_bitmaps_keys()) + ':  ::  or e.g. :path/to/some_icon.png:')
-    parser.add_argument('message', metavar='MESSAGE', nargs='+',
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and write the messages to each device once, as it gets connected, e.g. to program many badges one after the other.")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="Program one device per line of this CSV or JSON lines (.jsonl) file, each with its own messages and options, as the devices get connected. See README.md for the format.")
+    parser.add_argument('--daemon', metavar='SOCKET',
+                        help="Keep running and write to the devices on requests via this UNIX domain socket, e.g. sent with --send. The other options are the defaults for the requests.")
+    parser.add_argument('--send', metavar='SOCKET',
+                        help="Do not write to the device, but let the daemon listening on this UNIX domain socket do it. See --daemon.")
+    parser.add_argument('--follow', action='store_true',
+                        help="Read lines from standard input and show each as the message, as literal text. While a write is running, only the latest line is kept for the next write.")
+    parser.add_argument('--ticker', metavar='FILE',
+                        help="Show the text of this file ('-' for standard input) as a ticker, as literal text: split into as many writes as needed, one after the other, timed by the speed. The file is read again after the last write.")
+    parser.add_argument('--rounds', metavar='N', type=int,
+                        help="With --ticker: stop after showing the whole text this many times (default: run until interrupted).")
+    parser.add_argument('--refresh', metavar='SECONDS', type=float,
+                        help="Treat the messages as templates with placeholders like {now:%%H:%%M} or {name} (see --value), and write them again every this many seconds, if changed. Runs until interrupted.")
+    parser.add_argument('--value', metavar='NAME=FILE', action='append', default=[],
+                        help="With --refresh: the placeholder {NAME} shows the content of FILE, read with each refresh. Can be given multiple times.")
+    parser.add_argument('--min-interval', metavar='SECONDS', type=float, default=0.0,
+                        help="With --follow: start the writes at least this many seconds apart (default 0).")
+    parser.add_argument('message', metavar='MESSAGE', nargs='*',
                         help="Up to 8 message texts with embedded builtin icons or loaded images within colons(:) -- See -l for a list of builtins.")
     parser.add_argument('--mode-help', action='version', help=argparse.SUPPRESS, version="""
     
@@ -1085,8 +3592,169 @@ def main():
      (No "rotation" or "smoothing"(?) effect can be expected, though)
     """ % sys.argv[0])
     args = parser.parse_args()
+    if not args.message and not args.batch and not args.daemon and not args.follow and not args.ticker:
+        parser.error("the following arguments are required: MESSAGE")
+    if args.profile:
+        UploadProfile.start()
+    if args.metrics_json or args.metrics_prom:
+        WriteMetrics.configure(args.metrics_json, args.metrics_prom)
+
+    display_type = args.type
+    if not display_type:
+        display_type = '12x48' if '12' in sys.argv[0] else '11x44'
+    try:
+        geometry = DisplayGeometry.get(display_type)
+    except ValueError as e:
+        sys.exit(str(e))
+    print("Type: %s" % (geometry.name,))
+
+    option_defaults = {'speed': '4', 'mode': '0', 'blink': '0', 'ants': '0', 'brightness': '100'}
+    given = [key for key in option_defaults if getattr(args, key) is not None]
+    for key in option_defaults:
+        if getattr(args, key) is None:
+            setattr(args, key, option_defaults[key])
+    speeds = split_to_ints(args.speed)
+    modes = split_to_ints(args.mode)
+    blinks = split_to_ints(args.blink)
+    ants = split_to_ints(args.ants)
+    brightness = int(args.brightness)
 
-    creator = SimpleTextAndIcons()
+    # Translate -H to -M parameter
+    method = args.method
+    if args.hid == 1:
+        print("Option -H is deprecated, please use -M!")
+        if not method or method == 'auto':
+            method = 'hidapi'
+        else:
+            sys.exit("Parameter values are ambiguous. Please use -M only.")
+    WriteCapture.configure(args.capture_file, args.capture_latency, args.capture_devices)
+    defaults = {'speed': speeds, 'mode': modes, 'blink': blinks, 'ants': ants, 'brightness': brightness}
+    lock = None if args.no_lock else DeviceLock(timeout=args.lock_timeout, supersede=args.supersede)
+    digests = PayloadDigestStore(args.state_file) if args.skip_unchanged or args.state_file else None
+
+    if args.send:
+        # The daemon resolves the paths against its own working directory and has its own defaults, so send absolute
+        # paths and only the options given on the command line.
+        request = {'messages': [SimpleTextAndIcons.absolute_paths(m) for m in args.message],
+                   'device_id': args.device_id, 'force': args.force}
+        request.update((key, defaults[key]) for key in given)
+        try:
+            response = BadgeDaemon.send_request(args.send, request)
+        except (IOError, OSError) as e:
+            sys.exit("Cannot reach the daemon at %s: %s" % (args.send, e))
+        if not response.get('ok'):
+            sys.exit("The daemon failed: %s" % (response.get('error'),))
+        if response.get('skipped'):
+            print("Not written by the daemon, the device %s got the same content the last time already." % (
+                response.get('device_id'),))
+        else:
+            print("Written %d bytes to %s by the daemon in %.2f s" % (response['bytes'], response['device_id'],
+                                                                      response['seconds']))
+        sys.exit(0)
+
+    if args.daemon:
+        creator = SimpleTextAndIcons(RenderCache(directory=args.cache_dir), geometry.name)
+        method = LedNameBadge._check_write_method(method, LedNameBadge._get_auto_order_method_list())
+        # Clean up on kill as well
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            BadgeDaemon(args.daemon, method, args.pacing, creator, digests, defaults, lock=lock, retries=args.retries,
+                        timeout=args.report_timeout).serve_forever()
+        except (IOError, OSError) as e:
+            sys.exit(str(e))
+        finally:
+            # Also when killed
+            UploadProfile.print_active()
+        sys.exit(0)
+
+    if args.follow:
+        creator = SimpleTextAndIcons(RenderCache(directory=args.cache_dir), geometry.name)
+        session = LedNameBadge.open(method, args.device_id, args.pacing, digests, args.retries, args.report_timeout,
+                                    lock)
+        writer = CoalescingWriter(session, args.min_interval, args.force)
+        try:
+            writer.follow(iter(sys.stdin.readline, ''), creator, speeds, modes, blinks, ants, brightness,
+                          geometry.name)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.close()
+            session.close()
+        stats = writer.get_stats()
+        print("%d lines, %d written, %d merged, %d failed, %d shortened" % (
+            stats['submitted'], stats['written'], stats['merged'], stats['failed'], stats['truncated']))
+        UploadProfile.print_active()
+        sys.exit(1 if stats['failed'] else 0)
+
+    if args.ticker:
+        creator = SimpleTextAndIcons(RenderCache(directory=args.cache_dir), geometry.name)
+        session = LedNameBadge.open(method, args.device_id, args.pacing, None, args.retries, args.report_timeout,
+                                    lock)
+        ticker = Ticker(session, creator, speeds[0], modes[0], blinks[0], ants[0], brightness, geometry.name)
+        if args.ticker == '-':
+            source = sys.stdin.read()
+        else:
+            def source():
+                with open(args.ticker) as f:
+                    return f.read()
+        try:
+            ticker.run(source, args.rounds)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            session.close()
+        stats = ticker.get_stats()
+        print("%d windows written in %d rounds, %d failed, %d slots rendered, %d reused" % (
+            stats['written'], stats['rounds'], stats['failed'], stats['rendered'], stats['reused']))
+        UploadProfile.print_active()
+        sys.exit(1 if stats['failed'] else 0)
+
+    if args.refresh:
+        values = {}
+        for value in args.value:
+            name, sep, file_name = value.partition('=')
+            if not sep:
+                sys.exit("Please give --value as NAME=FILE: %s" % (value,))
+            values[name] = read_value_file(file_name)
+        creator = SimpleTextAndIcons(RenderCache(directory=args.cache_dir), geometry.name)
+        session = LedNameBadge.open(method, args.device_id, args.pacing, digests, args.retries, args.report_timeout,
+                                    lock)
+        scheduler = TemplateScheduler(session, creator, args.message, values, speeds, modes, blinks, ants, brightness,
+                                      geometry.name)
+        try:
+            scheduler.get_texts()
+        except (KeyError, ValueError, IndexError) as e:
+            session.close()
+            sys.exit("Cannot fill in the templates: %s" % (e,))
+        try:
+            scheduler.run(args.refresh)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            session.close()
+        stats = scheduler.get_stats()
+        print("%d refreshes, %d written, %d unchanged, %d failed, %d messages rendered, %d reused" % (
+            stats['refreshes'], stats['written'], stats['unchanged'], stats['failed'], stats['rendered'],
+            stats['reused']))
+        UploadProfile.print_active()
+        sys.exit(1 if stats['failed'] else 0)
+
+    if args.batch:
+        jobs = BatchProgrammer.load_jobs(args.batch, defaults)
+        method = LedNameBadge._check_write_method(method, LedNameBadge._get_auto_order_method_list())
+        try:
+            stats = BatchProgrammer(jobs, method, args.pacing, geometry.name, lock=lock, retries=args.retries,
+                                    timeout=args.report_timeout).run()
+        except Exception as e:
+            sys.exit("Rendering the jobs failed: %s" % (str(e) or e.__class__.__name__,))
+        print("%d of %d jobs written in %.0f s (%.1f jobs per minute), %d failed, %d retried" % (
+            stats['written'], stats['jobs'], stats['seconds'], stats['jobs_per_minute'], stats['failed'],
+            stats['retried']))
+        UploadProfile.print_active()
+        sys.exit(1 if stats['failed'] else 0)
+
+    creator = SimpleTextAndIcons(RenderCache(directory=args.cache_dir), geometry.name)
 
     if args.preload:
         for filename in args.preload:
@@ -1100,43 +3768,93 @@ def main():
         print(
             "\nWARNING:\n Your preloaded images are not used.\n Try without '-p' or embed the control character '^A' in your message.\n")
 
-    if '12' in args.type or '12' in sys.argv[0]:
-        print("Type: 12x48")
-        for msg_bitmap in msg_bitmaps:
-            # trivial hack to support 12x48 badges:
-            # patch extra empty lines into the message stream.
-            for i in reversed(range(1, int(len(msg_bitmap[0]) / 11) + 1)):
-                msg_bitmap[0][i * 11:i * 11] = array('B', [0])
+    optimizer = PayloadOptimizer(geometry.name)
+    if args.optimize:
+        msg_bitmaps, speeds, modes, blinks, ants = optimizer.optimize(msg_bitmaps, speeds, modes, blinks, ants)
+        stats = optimizer.get_stats()
+        print("Optimized: %d bytes saved (%d blank byte-columns trimmed, %d duplicate messages dropped), %d bytes left" %
+              (stats['bytes_saved'], stats['trimmed_columns'], stats['folded'], stats['bytes']))
+    try:
+        optimizer.check_fit(msg_bitmaps)
+    except PayloadTooLargeError as e:
+        message = str(e)
+        if not args.optimize:
+            optimizer.optimize(msg_bitmaps, speeds, modes, blinks, ants)
+            if optimizer.get_stats()['bytes'] <= optimizer.max_size:
+                message += " With --optimize it has %d bytes and fits." % (optimizer.get_stats()['bytes'],)
+        sys.exit(message)
+
+    buf = LedNameBadge.build_buffer(msg_bitmaps, speeds, modes, blinks, ants, brightness,
+                                    display_type=geometry.name)
+
+    failed = False
+    if args.watch:
+        method = LedNameBadge._check_write_method(method, LedNameBadge._get_auto_order_method_list())
+        writer = HotplugWriter(buf, method, args.pacing, lock=lock, retries=args.retries, timeout=args.report_timeout)
+        try:
+            writer.run()
+        except KeyboardInterrupt:
+            writer.stop()
+        stats = writer.get_stats()
+        print("%d devices written, %d failed" % (stats['written'], stats['failed']))
+        failed = stats['failed'] > 0
+    elif args.device_id == 'all':
+        results = LedNameBadge.write_all(buf, method, args.pacing, lock=lock, retries=args.retries,
+                                         timeout=args.report_timeout)
+        print("Results per device:")
+        for did, result in sorted(results.items()):
+            if result['ok']:
+                print("  '%s': ok in %.2f s" % (did, result['total_seconds']))
+            else:
+                print("  '%s': failed after %.2f s: %s" % (did, result['total_seconds'], result['error']))
+        failed = not all(r['ok'] for r in results.values())
     else:
-        print("Type: 11x44")
+        try:
+            LedNameBadge.write(buf, method, args.device_id, args.pacing, digests, args.force, lock, args.retries,
+                               args.report_timeout)
+        except DeviceBusyError as e:
+            print(e)
+            failed = True
+
+    UploadProfile.print_active()
+    if failed:
+        sys.exit(1)
 
-    lengths = [b[1] for b in msg_bitmaps]
-    speeds = split_to_ints(args.speed)
-    modes = split_to_ints(args.mode)
-    blinks = split_to_ints(args.blink)
-    ants = split_to_ints(args.ants)
-    brightness = int(args.brightness)
 
-    buf = array('B')
-    buf.extend(LedNameBadge.header(lengths, speeds, modes, blinks, ants, brightness))
+def split_to_ints(list_str):
+    return [int(x) for x in re.split(r'[\s,]+', list_str)]
 
-    for msg_bitmap in msg_bitmaps:
-        buf.extend(msg_bitmap[0])
 
-    # Translate -H to -M parameter
-    method = args.method
-    if args.hid == 1:
-        print("Option -H is deprecated, please use -M!")
-        if not method or method == 'auto':
-            method = 'hidapi'
-        else:
-            sys.exit("Parameter values are ambiguous. Please use -M only.")
+def write_file_atomically(file_name, text):
+    """Writes the given text (or bytes) to a temporary file of a unique name first and then replaces the given file
+    with it, so concurrent readers never see half of a file, nor do concurrent writers mix their content.
+    """
+    import tempfile
 
-    LedNameBadge.write(buf, method, args.device_id)
+    fd, tmp_name = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(file_name) + '.',
+                                    dir=os.path.dirname(file_name) or '.')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+        raise
 
 
-def split_to_ints(list_str):
-    return [int(x) for x in re.split(r'[\s,]+', list_str)]
+def read_value_file(file_name):
+    """Returns a function returning the stripped content of the given file, or '?' if it cannot be read."""
+    def read():
+        try:
+            with open(file_name) as f:
+                return f.read().strip()
+        except (IOError, OSError):
+            return '?'
+    return read
 
 
 if __name__ == '__main__':
@@ -0,0 +1,249 @@
+# -*- encoding: utf-8 -*-
+#
+# asyncio interface to lednamebadge.py, needs Python 3.8 or newer.
+#
+# The USB access of pyusb and pyhidapi is blocking, and so is the pause between the reports. All of it runs in an
+# executor here, so the event loop is free for other I/O, while a badge is written.
+#
+#     import asyncio
+#     from lednamebadge_async import AsyncLedNameBadge
+#
+#     async def main():
+#         badge = AsyncLedNameBadge(max_concurrency=4)
+#         async for method, device_id, description in badge.discover():
+#             await badge.write(buf, method, device_id)
+#
+#     asyncio.run(main())
+
+import asyncio
+
+from lednamebadge import DeviceBusyError, LedNameBadge, WriteSuperseded
+
+
+class AsyncLedNameBadge:
+    """The asyncio counterpart of LedNameBadge. All writes of one object share a limit of max_concurrency devices
+    being written at the same time (each in a thread of the executor, default: the loop's default executor).
+    Cancelling a write stops it before the next report and closes the device. A cancelled write is incomplete, the
+    next write to that device replaces it. A DeviceLock is waited for in the executor as well.
+    """
+
+    def __init__(self, max_concurrency=4, executor=None):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def discover(self, method='auto'):
+        """Yields a tuple (method, device_id, description) for each device available with the given write method. With
+        'auto', these are the devices of the first write method having any. The method and device id can be given to
+        write().
+        """
+        write_method = await self._run(LedNameBadge._find_devices, method)
+        if write_method:
+            for device_id, description in sorted(write_method.get_available_devices().items()):
+                yield write_method.get_name(), device_id, description
+
+    async def write(self, buf, method='auto', device_id='auto', pacing=None, lock=None, retries=0, timeout=None):
+        """Writes the given buffer to the given device, like LedNameBadge.write(), also with the lock, retries and
+        timeout. Waits first, if max_concurrency writes are running already. Returns the transfer statistics. Raises
+        IOError, if the device is not available, DeviceBusyError, if it stays locked too long.
+        """
+        async with self._limit():
+            try:
+                write_method = await self._run_opening(AsyncLedNameBadge._close, self._open, method, device_id, lock)
+            except WriteSuperseded:
+                return LedNameBadge._superseded()
+            return await self._write_and_close(write_method, buf, pacing, retries, timeout)
+
+    async def write_all(self, buf, method='auto', pacing=None, lock=None, retries=0, timeout=None):
+        """Writes the given buffer to all devices available with the given write method, within the max_concurrency
+        limit. The lock, retries and timeout apply to each device as with write(). Returns a dict like
+        LedNameBadge.write_all().
+        """
+        found_method = await self._run(LedNameBadge._find_devices, method)
+        device_ids = sorted(found_method.devices.keys()) if found_method else []
+        results = await asyncio.gather(*[self._write_one_of_all(found_method, did, buf, pacing, lock, retries, timeout)
+                                         for did in device_ids])
+        return dict(zip(device_ids, results))
+
+    def open(self, method='auto', device_id='auto', pacing=None, retries=0, timeout=None, lock=None):
+        """Returns an AsyncLedNameBadgeSession for writing to one device multiple times. Use it as an async context
+        manager:
+
+            async with badge.open() as session:
+                await session.write(buf)
+
+        The parameters are the same as with write(). With a DeviceLock, the lock is held for each write and for
+        closing, not in between, like with LedNameBadge.open().
+        """
+        return AsyncLedNameBadgeSession(self, method, device_id, pacing, retries, timeout, lock)
+
+    async def _write_one_of_all(self, found_method, device_id, buf, pacing, lock=None, retries=0, timeout=None):
+        """Like LedNameBadge._write_one_of_all(), but the write can be cancelled."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            async with self._limit():
+                write_method = found_method.__class__()
+                write_method.devices = {device_id: found_method.devices[device_id]}
+                if not await self._run_opening(lambda opened: AsyncLedNameBadge._close(write_method),
+                                               write_method.open, device_id, lock):
+                    raise IOError("Cannot open device")
+                result = {'ok': True, 'error': None}
+                result.update(await self._write_and_close(write_method, buf, pacing, retries, timeout))
+        except WriteSuperseded:
+            result = {'ok': True, 'error': None}
+            result.update(LedNameBadge._superseded())
+        except (Exception, SystemExit) as e:
+            result = {'ok': False, 'error': str(e) or e.__class__.__name__}
+        result['total_seconds'] = loop.time() - start
+        return result
+
+    async def _write_and_close(self, write_method, buf, pacing, retries=0, timeout=None):
+        try:
+            write_method.set_pacing(pacing)
+            write_method.set_retries(retries, timeout)
+            return await self._write(write_method, buf)
+        finally:
+            await self._run(AsyncLedNameBadge._close, write_method)
+
+    async def _write(self, write_method, buf):
+        """Runs write_method.write() in the executor. If cancelled, the write is stopped and waited for, so the device
+        can be closed safely afterwards.
+        """
+        future = asyncio.ensure_future(self._run(write_method.write, buf))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Only a write still running is stopped, not the next one
+            if not future.done():
+                write_method.cancel()
+            await asyncio.wait([future])
+            if not future.cancelled():
+                # Usually WriteCancelled, retrieved to not have it logged
+                future.exception()
+            raise
+
+    async def _run_opening(self, close, func, *args):
+        """Runs func opening a device in the executor, like _run(). If cancelled meanwhile, func is waited for and
+        close is called with its result, so the device is not left open.
+        """
+        future = asyncio.ensure_future(self._run(func, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            if not future.cancelled() and future.exception() is None:
+                await self._run(close, future.result())
+            raise
+
+    def _limit(self):
+        # Created on first use, as it belongs to the running loop with Python < 3.10
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    @staticmethod
+    def _open(method, device_id, lock=None):
+        """LedNameBadge._find_write_method(), but raising IOError instead of exiting the program, if there is no
+        device."""
+        try:
+            return LedNameBadge._find_write_method(method, device_id, lock)
+        except SystemExit:
+            raise IOError("The device is not available with write method '%s' and device id '%s'" % (method, device_id))
+
+    @staticmethod
+    def _close(write_method):
+        # The device may get reset when closed, that is within the lock
+        write_method.close()
+        write_method.release_lock()
+
+
+class AsyncLedNameBadgeSession:
+    """The asyncio counterpart of LedNameBadgeSession: keeps one device open between writes. Get one with
+    AsyncLedNameBadge.open(). The device is opened with the first write, or when entering the context.
+    """
+
+    def __init__(self, badge, method='auto', device_id='auto', pacing=None, retries=0, timeout=None, lock=None):
+        self.badge = badge
+        self.method = method
+        self.device_id = device_id
+        self.pacing = pacing
+        self.retries = retries
+        self.timeout = timeout
+        self.lock = lock
+        self.write_method = None
+
+    async def __aenter__(self):
+        await self._connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def write(self, buf):
+        """Writes the given buffer and returns the transfer statistics. If it fails, the device is opened again and
+        the write is repeated once.
+        """
+        async with self.badge._limit():
+            if self.write_method is None:
+                await self._connect()
+            hold = None
+            try:
+                if self.lock is not None:
+                    try:
+                        hold = await self.badge._run_opening(lambda h: h.release(), self.lock.acquire,
+                                                             self.write_method.get_name(), self.write_method.device_id)
+                    except WriteSuperseded:
+                        return LedNameBadge._superseded()
+                try:
+                    return await self.badge._write(self.write_method, buf)
+                except (IOError, OSError) as e:
+                    print("Write failed (%s), opening the device again" % (e,))
+                    await self._close()
+                    await self._connect()
+                    return await self.badge._write(self.write_method, buf)
+            finally:
+                if hold is not None:
+                    hold.release()
+
+    async def close(self):
+        """Closes the device. A later write() opens it again. With a lock, it is closed within the lock, as closing
+        may reset the device.
+        """
+        if self.write_method is not None:
+            write_method = self.write_method
+            self.write_method = None
+            await self.badge._run(self._close_locked, write_method)
+
+    async def _close(self):
+        if self.write_method is not None:
+            write_method = self.write_method
+            self.write_method = None
+            await self.badge._run(write_method.close)
+
+    def _close_locked(self, write_method):
+        hold = None
+        if self.lock is not None:
+            try:
+                # Not given up for newer writes, the device needs to be closed anyway
+                hold = self.lock.acquire(write_method.get_name(), write_method.device_id, False)
+            except DeviceBusyError as e:
+                print("Closing anyway: %s" % (e,))
+        try:
+            write_method.close()
+        finally:
+            if hold is not None:
+                hold.release()
+
+    def get_device_id(self):
+        """Returns the id of the opened device, or None, if not open."""
+        return self.write_method.device_id if self.write_method else None
+
+    async def _connect(self):
+        self.write_method = await self.badge._run_opening(lambda m: m.close(), AsyncLedNameBadge._open, self.method,
+                                                          self.device_id)
+        self.write_method.set_pacing(self.pacing)
+        self.write_method.set_retries(self.retries, self.timeout)
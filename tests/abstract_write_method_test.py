@@ -3,6 +3,8 @@ from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from io import StringIO
 
+import lednamebadge
+
 
 class USBError(BaseException):
     pass
@@ -31,7 +33,6 @@ class AbstractWriteMethodTest(TestCase):
         mocks = None
         with self.do_import_patch(pyusb_available, pyhidapi_available, device_available) as module_mocks:
             with patch('sys.stdout', new_callable=StringIO) as stdio_mock:
-                import lednamebadge
                 try:
                     result = func(lednamebadge.LedNameBadge)
                     mocks = {'pyhidapi': module_mocks['pyhidapi'], 'usb': module_mocks['usb']}
@@ -48,9 +49,11 @@ class AbstractWriteMethodTest(TestCase):
             'usb.core':          MagicMock() if pyusb_available else None,
             'usb.core.USBError': USBError if pyusb_available else None,
             'usb.util':          MagicMock() if pyusb_available else None})
-        # Assure fresh reimport of lednamebadge with current mocks
-        if 'lednamebadge' in sys.modules:
-            del sys.modules['lednamebadge']
+        # Have the write methods import the current mocks on their next use
+        lednamebadge.WriteLibUsb._module_loaded = None
+        lednamebadge.WriteUsbHidApi._module_loaded = None
+        lednamebadge.WriteLibUsb._learned_delays.clear()
+        lednamebadge.WriteLibUsb._failed_delays.clear()
         return patch_obj
 
 
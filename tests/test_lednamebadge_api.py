@@ -1,7 +1,15 @@
+import json
+import os
+import shutil
 import sys
+import tempfile
+import threading
 from array import array
+from unittest.mock import patch, call, MagicMock
 
 import abstract_write_method_test
+from lednamebadge import LedNameBadge as testee, PayloadDigestStore, SimpleTextAndIcons, UploadProfile, WriteCapture, \
+    WriteMetrics, WriteUsbHidApi
 
 
 class Test(abstract_write_method_test.AbstractWriteMethodTest):
@@ -9,7 +17,9 @@ class Test(abstract_write_method_test.AbstractWriteMethodTest):
         methods, output = self.call_info_methods()
         self.assertDictEqual({
             'hidapi': ('Program a device connected via USB using the pyhidapi package and libhidapi.', True),
-            'libusb': ('Program a device connected via USB using the pyusb package and libusb.', True)},
+            'libusb': ('Program a device connected via USB using the pyusb package and libusb.', True),
+            'capture': ('Record the reports in memory or a file instead of writing to a device, e.g. for tests and '
+                        'benchmarks.', True)},
             methods)
 
     def test_get_device_ids(self):
@@ -36,6 +46,433 @@ class Test(abstract_write_method_test.AbstractWriteMethodTest):
         mocks['usb'].util.find_descriptor.return_value[0].write.assert_called_once()
 
 
+    @patch('time.sleep')
+    def test_write_pacing(self, sleep_mock):
+        buf = array('B', [1] * 200)
+        reports = []
+
+        def write(m):
+            # The report array is reused, so keep copies
+            endpoint = sys.modules['usb'].util.find_descriptor.return_value[0]
+            endpoint.write.side_effect = lambda report, *args: reports.append((type(report), report.tobytes()))
+            return m.write(buf, 'libusb', pacing='none')
+
+        stats, output, mocks = self.prepare_modules(True, True, True, write)
+        sleep_mock.assert_not_called()
+        self.assertEqual(256, stats['bytes'])
+        # Padded in a copy only
+        self.assertEqual(200, len(buf))
+        self.assertEqual([array] * 4, [r[0] for r in reports])
+        reports = [r[1] for r in reports]
+        self.assertEqual([64] * 4, [len(r) for r in reports])
+        self.assertEqual(bytes([1] * 8) + bytes(56), bytes(reports[3]))
+        self.assertIn('Written 256 bytes', output)
+
+        stats, output, mocks = self.prepare_modules(True, True, True,
+                                                    lambda m: m.write(array('B', [1] * 200), 'libusb', pacing=0.25))
+        self.assertEqual([call(0.25)] * 4, sleep_mock.call_args_list)
+
+    @patch('time.sleep')
+    def test_write_adaptive_pacing(self, sleep_mock):
+        def write(m):
+            endpoint = sys.modules['usb'].util.find_descriptor.return_value[0]
+            endpoint.write.side_effect = [None, None, abstract_write_method_test.USBError('timeout')] + [None] * 4
+            return m.write(array('B', [1] * 200), 'libusb', pacing='adaptive')
+
+        stats, output, mocks = self.prepare_modules(True, True, True, write)
+        self.assertIn('starting over', output)
+        # The pause got shorter until the failure, then the last one working is kept.
+        self.assertEqual([0.1, 0.075, 0.05625, 0.075, 0.075, 0.075, 0.075],
+                         [round(c[0][0], 6) for c in sleep_mock.call_args_list])
+        self.assertAlmostEqual(0.075, stats['delay'])
+
+    @patch('time.sleep')
+    def test_write_adaptive_pacing_threshold(self, sleep_mock):
+        def write(m):
+            # The device fails with pauses below 0.03 s
+            endpoint = sys.modules['usb'].util.find_descriptor.return_value[0]
+
+            def write_report(report, *args):
+                if sleep_mock.call_args[0][0] < 0.03:
+                    raise abstract_write_method_test.USBError('timeout')
+
+            endpoint.write.side_effect = write_report
+            first = m.write(array('B', [1] * 64 * 12), 'libusb', pacing='adaptive')
+            sleep_mock.reset_mock()
+            return first, m.write(array('B', [1] * 64 * 12), 'libusb', pacing='adaptive')
+
+        (first, second), output, mocks = self.prepare_modules(True, True, True, write)
+        self.assertEqual(1, first['retries'])
+        self.assertEqual(0, second['retries'])
+        self.assertEqual(1, output.count('starting over'))
+        # Started with the pause learned, never shorter
+        self.assertEqual(12, len(sleep_mock.call_args_list))
+        self.assertTrue(all(0.03 <= c[0][0] < 0.03 / 0.75 for c in sleep_mock.call_args_list))
+        self.assertAlmostEqual(first['delay'], second['delay'])
+
+
+    @patch('time.sleep')
+    def test_write_retries(self, sleep_mock):
+        writes = []
+
+        def write(m, failures, retries):
+            def write_report(report, *args):
+                writes.append((report.tobytes(),) + args)
+                if failures:
+                    failure = failures.pop(0)
+                    if failure:
+                        raise failure
+
+            del writes[:]
+            endpoint = sys.modules['usb'].util.find_descriptor.return_value[0]
+            endpoint.write.side_effect = write_report
+            return m.write(array('B', [1] * 100), 'libusb', pacing='none', retries=retries, timeout=0.5)
+
+        usb_error = abstract_write_method_test.USBError('timeout')
+        stats, output, mocks = self.prepare_modules(True, True, True, lambda m: write(m, [None, usb_error], 2))
+        self.assertEqual(1, stats['retries'])
+        self.assertIn('starting over in 0.10 s (retry 1 of 2)', output)
+        self.assertEqual([call(0.1)], sleep_mock.call_args_list)
+        # Started over with the header, with a timeout per report in ms
+        self.assertEqual(4, len(writes))
+        self.assertEqual(writes[0], writes[2])
+        self.assertNotEqual(writes[1], writes[2])
+        self.assertEqual(500, writes[3][1])
+
+        sleep_mock.reset_mock()
+        with self.assertRaises(abstract_write_method_test.USBError):
+            self.prepare_modules(True, True, True, lambda m: write(m, [usb_error] * 3, 2))
+        self.assertEqual([call(0.1), call(0.2)], sleep_mock.call_args_list)
+
+        stats, output, mocks = self.prepare_modules(True, True, True, lambda m: write(m, [], 0))
+        self.assertEqual(0, stats['retries'])
+
+    @patch('time.sleep')
+    def test_write_retries_hidapi(self, sleep_mock):
+        def write(m):
+            sys.modules['pyhidapi'].hid_write.side_effect = [64, RuntimeError('hid_write failed'), 64, 64]
+            return m.write(array('B', [1] * 100), 'hidapi', retries=2)
+
+        stats, output, mocks = self.prepare_modules(True, True, True, write)
+        self.assertEqual(1, stats['retries'])
+        self.assertEqual(4, mocks['pyhidapi'].hid_write.call_count)
+        self.assertEqual([call(0.1)], sleep_mock.call_args_list)
+
+        # Also when writing to all devices
+        def write_all(m):
+            sys.modules['pyhidapi'].hid_write.side_effect = [RuntimeError('hid_write failed'), 64]
+            return m.write_all(array('B', [1, 2, 3]), 'hidapi', retries=1)
+
+        results, output, mocks = self.prepare_modules(True, True, True, write_all)
+        self.assertTrue(results['3-4:5-6']['ok'])
+        self.assertEqual(1, results['3-4:5-6']['retries'])
+
+
+    def test_session(self):
+        def write_twice(m):
+            with m.open('libusb') as badge:
+                badge.write(array('B', [1, 2, 3]))
+                badge.write(array('B', [4, 5, 6]))
+                return badge.get_device_id()
+
+        device_id, output, mocks = self.prepare_modules(True, True, True, write_twice)
+        self.assertEqual('3:4:2', device_id)
+        device = mocks['usb'].core.find.return_value[0]
+        # Only before the first write, not while finding the device, which may be written by another process
+        self.assertEqual(1, device.set_configuration.call_count)
+        device.detach_kernel_driver.assert_called_once()
+        device.reset.assert_called_once()
+        self.assertEqual(2, mocks['usb'].util.find_descriptor.return_value[0].write.call_count)
+
+    def test_session_reconnect(self):
+        def write_with_error(m):
+            badge = m.open('hidapi')
+            sys.modules['pyhidapi'].hid_write.side_effect = [IOError('gone'), 64]
+            stats = badge.write(array('B', [1, 2, 3]))
+            badge.close()
+            return stats
+
+        stats, output, mocks = self.prepare_modules(True, True, True, write_with_error)
+        self.assertIn('opening the device again', output)
+        self.assertEqual(64, stats['bytes'])
+        self.assertEqual(2, mocks['pyhidapi'].hid_open_path.call_count)
+        self.assertEqual(2, mocks['pyhidapi'].hid_close.call_count)
+
+
+    def test_session_no_device(self):
+        def open_missing(m):
+            with self.assertRaises(IOError):
+                m.open('hidapi', 'no-such-device')
+            return True
+
+        result, output, mocks = self.prepare_modules(True, True, True, open_missing)
+        self.assertTrue(result)
+        self.assertIn('not available', output)
+
+
+    def test_write_all(self):
+        def write_all(m):
+            hid = sys.modules['pyhidapi']
+            second = MagicMock()
+            second.path = b'3-5:5-6'
+            second.manufacturer_string = 'HidApi Test Manufacturer'
+            second.product_string = 'HidApi Test Product'
+            second.interface_number = 0
+            hid.hid_enumerate.return_value = hid.hid_enumerate.return_value + [second]
+            hid.hid_open_path.side_effect = lambda path: None if path == b'3-5:5-6' else 123456
+            return m.write_all(array('B', [1, 2, 3]), 'hidapi')
+
+        results, output, mocks = self.prepare_modules(True, True, True, write_all)
+        self.assertEqual(['3-4:5-6', '3-5:5-6'], sorted(results.keys()))
+        self.assertTrue(results['3-4:5-6']['ok'])
+        self.assertEqual(64, results['3-4:5-6']['bytes'])
+        self.assertFalse(results['3-5:5-6']['ok'])
+        self.assertEqual('Cannot open device', results['3-5:5-6']['error'])
+        mocks['pyhidapi'].hid_enumerate.assert_called_once()
+        mocks['pyhidapi'].hid_write.assert_called_once()
+
+
+    def test_write_skip_unchanged(self):
+        fd, state_file = tempfile.mkstemp('.json')
+        os.close(fd)
+        os.remove(state_file)
+
+        def write(m, buf, force=False):
+            digests = PayloadDigestStore(state_file)
+            return m.write(buf, 'libusb', digests=digests, force=force)
+
+        try:
+            header = list(testee.header((1,), (4,), (0,), (0,), (0,), 100))
+            data = [1] * 11
+            stats, output, mocks = self.prepare_modules(True, True, True, lambda m: write(m, array('B', header + data)))
+            self.assertNotIn('skipped', stats)
+            # Same content at a later time
+            header[43] += 1
+            stats, output, mocks = self.prepare_modules(True, True, True, lambda m: write(m, array('B', header + data)))
+            self.assertTrue(stats['skipped'])
+            self.assertIn('Not written', output)
+            mocks['usb'].util.find_descriptor.return_value[0].write.assert_not_called()
+            mocks['usb'].core.find.return_value[0].reset.assert_not_called()
+            # Forced
+            stats, output, mocks = self.prepare_modules(True, True, True,
+                                                        lambda m: write(m, array('B', header + data), True))
+            self.assertEqual(2, mocks['usb'].util.find_descriptor.return_value[0].write.call_count)
+            # Changed content
+            data = [2] * 11
+            stats, output, mocks = self.prepare_modules(True, True, True, lambda m: write(m, array('B', header + data)))
+            self.assertEqual(128, stats['bytes'])
+        finally:
+            os.remove(state_file)
+
+
+    def test_digest_store_threads(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            digests = PayloadDigestStore(os.path.join(temp_dir, 'written.json'))
+            threads = [threading.Thread(target=digests.put, args=('capture', 'capture:%d' % (i,), array('B', [i])))
+                       for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # No update lost
+            self.assertTrue(all(digests.is_unchanged('capture', 'capture:%d' % (i,), array('B', [i]))
+                                for i in range(20)))
+            self.assertEqual(['written.json'], os.listdir(temp_dir))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_hidraw_device_key(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            device_dir = os.path.join(temp_dir, 'usb3', '3-4', '3-4:1.0', '0003:0416:5020.0007')
+            os.makedirs(device_dir)
+            os.makedirs(os.path.join(temp_dir, 'hidraw', 'hidraw2'))
+            os.symlink(device_dir, os.path.join(temp_dir, 'hidraw', 'hidraw2', 'device'))
+            write_method = WriteUsbHidApi()
+            with patch.object(WriteUsbHidApi, 'sysfs_hidraw_dir', os.path.join(temp_dir, 'hidraw')):
+                write_method.device_id = '/dev/hidraw2'
+                self.assertEqual(os.path.realpath(device_dir), write_method.get_device_key())
+                # Not listed, or no hidraw path
+                write_method.device_id = '/dev/hidraw3'
+                self.assertEqual('/dev/hidraw3', write_method.get_device_key())
+                write_method.device_id = '3-4:1.0'
+                self.assertEqual('3-4:1.0', write_method.get_device_key())
+                # A device found, not opened
+                self.assertEqual(os.path.realpath(device_dir), write_method.get_device_key('/dev/hidraw2'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_metrics_threads(self):
+        temp_dir = tempfile.mkdtemp()
+        json_file = os.path.join(temp_dir, 'metrics.json')
+        try:
+            metrics = WriteMetrics(json_file, os.path.join(temp_dir, 'metrics.prom'))
+            threads = [threading.Thread(target=metrics.record, args=('capture', 'capture:%d' % (i % 2,),
+                                                                     {'bytes': 64, 'seconds': 0.01}))
+                       for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # The last export has all writes
+            with open(json_file) as f:
+                self.assertEqual([10, 10], [d['writes'] for d in json.load(f)['devices']])
+            self.assertEqual(['metrics.json', 'metrics.prom'], sorted(os.listdir(temp_dir)))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @patch('time.sleep')
+    def test_capture(self, sleep_mock):
+        WriteCapture.configure(latency=0.5, device_count=2)
+        stats, output, mocks = self.prepare_modules(False, False, False,
+                                                    lambda m: m.write(array('B', [1] * 100), 'capture', 'capture:1'))
+        self.assertEqual(128, stats['bytes'])
+        self.assertEqual(['capture:1', 'capture:1'], [c[1] for c in WriteCapture.captured])
+        self.assertEqual(bytes([1] * 36) + bytes(28), WriteCapture.captured[1][2])
+        self.assertEqual([call(0.5)] * 2, sleep_mock.call_args_list)
+
+        fd, file_name = tempfile.mkstemp('.txt')
+        os.close(fd)
+        try:
+            WriteCapture.configure(file_name)
+            results, output, mocks = self.prepare_modules(False, False, False,
+                                                          lambda m: m.write_all(array('B', [2] * 64), 'capture'))
+            self.assertEqual(['capture:0'], list(results.keys()))
+            with open(file_name) as f:
+                lines = [line.split() for line in f]
+            self.assertEqual([['capture:0', '02' * 64]], [line[1:] for line in lines])
+            self.assertEqual([], WriteCapture.captured)
+        finally:
+            os.remove(file_name)
+
+        # Never chosen automatically
+        result, output, mocks = self.prepare_modules(False, False, False, lambda m: m.write(array('B', [1]), 'auto'))
+        self.assertIsNone(result)
+        self.assertNotIn('Capture device', output)
+        WriteCapture.configure()
+
+
+    @patch('time.sleep')
+    def test_profile(self, sleep_mock):
+        def write(m):
+            profile = UploadProfile.start()
+            try:
+                buf = m.build_buffer([SimpleTextAndIcons().bitmap("Hello")])
+                m.write(buf, 'libusb', pacing=0.1)
+            finally:
+                UploadProfile.stop()
+            return profile.get_stats()
+
+        stats, output, mocks = self.prepare_modules(True, True, True, write)
+        self.assertEqual(['close', 'configure', 'enumerate devices', 'header', 'import backends', 'open', 'pacing',
+                          'render', 'transfer'], sorted(stats['phases'].keys()))
+        self.assertEqual(2, stats['phases']['pacing']['count'])
+        self.assertEqual(2, stats['reports']['count'])
+        self.assertLessEqual(stats['reports']['p50'], stats['reports']['max'])
+        self.assertEqual(128, stats['bytes'])
+        self.assertIsNone(UploadProfile.active)
+
+    def test_profile_threads(self):
+        profile = UploadProfile()
+        threads = [threading.Thread(target=lambda: [profile.add('transfer', 0.5) for _ in range(1000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({'count': 4000, 'seconds': 2000.0}, profile.get_stats()['phases']['transfer'])
+
+    @patch('sys.stdout')
+    def test_profile_print_active(self, stdout_mock):
+        UploadProfile.print_active()
+        stdout_mock.write.assert_not_called()
+        UploadProfile.start().add('render', 0.25)
+        UploadProfile.print_active()
+        self.assertIn('render', ''.join(c[0][0] for c in stdout_mock.write.call_args_list))
+        self.assertIsNone(UploadProfile.active)
+
+    def test_profile_percentile(self):
+        values = [0.1 * i for i in range(1, 11)]
+        self.assertAlmostEqual(0.5, UploadProfile.percentile(values, 50))
+        self.assertAlmostEqual(0.9, UploadProfile.percentile(values, 90))
+        self.assertAlmostEqual(1.0, UploadProfile.percentile(values, 99))
+        self.assertAlmostEqual(0.1, UploadProfile.percentile(values, 0))
+        self.assertIsNone(UploadProfile.percentile([], 50))
+
+
+    def test_metrics_prometheus_only(self):
+        temp_dir = tempfile.mkdtemp()
+        prom_file = os.path.join(temp_dir, 'metrics.prom')
+        try:
+            metrics = WriteMetrics(None, prom_file)
+            metrics.record('capture', 'capture:1', {'bytes': 64, 'seconds': 0.3})
+            metrics.record('capture', 'capture:1', {'bytes': 128, 'seconds': 20.0, 'retries': 1})
+            metrics.record('hidapi', 'a "b"\\c\nd', error=IOError('gone'))
+            expected = metrics.get_snapshot()['devices']
+
+            # Counting continues from the Prometheus file
+            metrics = WriteMetrics(None, prom_file)
+            self.assertEqual(expected, metrics.get_snapshot()['devices'])
+            metrics.record('capture', 'capture:1', {'bytes': 64, 'seconds': 0.01})
+            with open(prom_file) as f:
+                prom = f.read()
+            self.assertIn('lednamebadge_writes_total{method="capture",device="capture:1"} 3\n', prom)
+            self.assertIn('lednamebadge_bytes_total{method="capture",device="capture:1"} 256\n', prom)
+            self.assertIn('lednamebadge_write_seconds_bucket{method="capture",device="capture:1",le="0.05"} 1\n', prom)
+            self.assertIn('lednamebadge_write_seconds_bucket{method="capture",device="capture:1",le="+Inf"} 3\n', prom)
+
+            with open(prom_file, 'w') as f:
+                f.write('garbage\n')
+            self.assertEqual([], WriteMetrics(None, prom_file).get_snapshot()['devices'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @patch('time.sleep')
+    def test_metrics(self, sleep_mock):
+        temp_dir = tempfile.mkdtemp()
+        json_file = os.path.join(temp_dir, 'metrics.json')
+        prom_file = os.path.join(temp_dir, 'metrics.prom')
+
+        def write_fail(m):
+            sys.modules['pyhidapi'].hid_write.side_effect = IOError('gone')
+            with self.assertRaises(IOError):
+                m.write(array('B', [1] * 64), 'hidapi')
+
+        try:
+            WriteCapture.configure(device_count=2)
+            WriteMetrics.configure(json_file, prom_file)
+            self.prepare_modules(False, False, False, lambda m: m.write(array('B', [1] * 100), 'capture', 'capture:1'))
+            self.prepare_modules(False, False, False, lambda m: m.write(array('B', [1] * 64), 'capture', 'capture:1'))
+            self.prepare_modules(True, True, True, write_fail)
+            # Counting continues from the JSON file
+            metrics = WriteMetrics.configure(json_file, prom_file)
+            metrics.record('capture', 'capture:0', {'bytes': 0, 'seconds': 0.0, 'skipped': True})
+
+            with open(json_file) as f:
+                devices = json.load(f)['devices']
+            self.assertEqual([('capture', 'capture:0'), ('capture', 'capture:1'), ('hidapi', '3-4:5-6')],
+                             [(d['method'], d['device_id']) for d in devices])
+            self.assertEqual([0, 2, 0], [d['writes'] for d in devices])
+            self.assertEqual([1, 0, 0], [d['skipped'] for d in devices])
+            self.assertEqual([0, 0, 1], [d['failures'] for d in devices])
+            self.assertEqual(192, devices[1]['bytes'])
+            self.assertEqual(2, sum(devices[1]['histogram']))
+
+            with open(prom_file) as f:
+                prom = f.read()
+            self.assertIn('# TYPE lednamebadge_writes_total counter\n', prom)
+            self.assertIn('lednamebadge_writes_total{method="capture",device="capture:1"} 2\n', prom)
+            self.assertIn('lednamebadge_failures_total{method="hidapi",device="3-4:5-6"} 1\n', prom)
+            self.assertIn('lednamebadge_write_seconds_bucket{method="capture",device="capture:1",le="+Inf"} 2\n', prom)
+            self.assertIn('lednamebadge_write_seconds_count{method="capture",device="capture:1"} 2\n', prom)
+            self.assertEqual([], [n for n in os.listdir(temp_dir) if n.endswith('.tmp')])
+        finally:
+            WriteCapture.configure()
+            WriteMetrics.configure()
+            shutil.rmtree(temp_dir)
+
+
     # -------------------------------------------------------------------------
 
 
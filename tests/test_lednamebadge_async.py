@@ -0,0 +1,222 @@
+import asyncio
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from unittest.mock import MagicMock, patch
+
+import abstract_write_method_test
+from lednamebadge import DeviceBusyError, DeviceLock
+from lednamebadge_async import AsyncLedNameBadge
+
+
+class Test(abstract_write_method_test.AbstractWriteMethodTest):
+    def test_discover(self):
+        async def discover(badge):
+            return [d async for d in badge.discover()]
+
+        devices, output, mocks = self.run_async(discover)
+        self.assertEqual([('hidapi', '3-4:5-6', 'HidApi Test Manufacturer - HidApi Test Product (if=0)')], devices)
+
+    def test_write(self):
+        async def write(badge):
+            return await badge.write(array('B', [1, 2, 3]), 'hidapi')
+
+        stats, output, mocks = self.run_async(write)
+        self.assertEqual(64, stats['bytes'])
+        mocks['pyhidapi'].hid_write.assert_called_once()
+        mocks['pyhidapi'].hid_close.assert_called_once()
+
+    def test_write_no_device(self):
+        async def write(badge):
+            sys.modules['pyhidapi'].hid_enumerate.return_value = []
+            with self.assertRaises(IOError):
+                await badge.write(array('B', [1, 2, 3]), 'hidapi')
+            return True
+
+        done, output, mocks = self.run_async(write)
+        self.assertTrue(done)
+
+    def test_write_cancel(self):
+        started = threading.Event()
+
+        def slow_write(dev, buf):
+            started.set()
+            time.sleep(0.01)
+            return 65
+
+        async def write(badge):
+            sys.modules['pyhidapi'].hid_write.side_effect = slow_write
+            task = asyncio.ensure_future(badge.write(array('B', [1] * 8000), 'hidapi'))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return True
+
+        done, output, mocks = self.run_async(write)
+        self.assertTrue(done)
+        # Stopped early and closed after the writing thread stopped
+        self.assertLess(mocks['pyhidapi'].hid_write.call_count, 125)
+        mocks['pyhidapi'].hid_close.assert_called_once()
+
+    def test_cancel_while_opening(self):
+        started = threading.Event()
+
+        def slow_open(path):
+            started.set()
+            time.sleep(0.05)
+            return 123456
+
+        async def write(badge):
+            sys.modules['pyhidapi'].hid_open_path.side_effect = slow_open
+            task = asyncio.ensure_future(badge.write(array('B', [1] * 100), 'hidapi'))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return True
+
+        done, output, mocks = self.run_async(write)
+        self.assertTrue(done)
+        mocks['pyhidapi'].hid_write.assert_not_called()
+        # Opened meanwhile, so closed after all
+        mocks['pyhidapi'].hid_close.assert_called_once()
+
+    def test_cancel_after_write(self):
+        async def write(badge):
+            async with badge.open('hidapi') as session:
+                await session.write(array('B', [1, 2, 3]))
+                # Too late for the write before, no effect on the next one
+                session.write_method.cancel()
+                return await session.write(array('B', [4, 5, 6]))
+
+        stats, output, mocks = self.run_async(write)
+        self.assertEqual(64, stats['bytes'])
+        self.assertEqual(2, mocks['pyhidapi'].hid_write.call_count)
+
+    def test_write_all_bounded(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def write(dev, buf):
+            with lock:
+                running.append(dev)
+                max_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(dev)
+            return 65
+
+        async def write_all(badge):
+            hid = sys.modules['pyhidapi']
+            device = hid.hid_enumerate.return_value[0]
+            devices = []
+            for i in range(4):
+                d = MagicMock()
+                d.path = ('3-%d:5-6' % (i,)).encode('ascii')
+                d.manufacturer_string = device.manufacturer_string
+                d.product_string = device.product_string
+                d.interface_number = 0
+                devices.append(d)
+            hid.hid_enumerate.return_value = devices
+            hid.hid_open_path.side_effect = lambda path: path
+            hid.hid_write.side_effect = write
+            return await badge.write_all(array('B', [1] * 100), 'hidapi')
+
+        results, output, mocks = self.run_async(write_all, max_concurrency=2)
+        self.assertEqual(4, len(results))
+        self.assertTrue(all(r['ok'] for r in results.values()))
+        self.assertEqual(8, mocks['pyhidapi'].hid_write.call_count)
+        self.assertEqual(2, max(max_running))
+
+    def test_session(self):
+        async def write_twice(badge):
+            async with badge.open('libusb', pacing='none') as session:
+                await session.write(array('B', [1, 2, 3]))
+                await session.write(array('B', [4, 5, 6]))
+                return session.get_device_id()
+
+        device_id, output, mocks = self.run_async(write_twice)
+        self.assertEqual('3:4:2', device_id)
+        self.assertEqual(2, mocks['usb'].util.find_descriptor.return_value[0].write.call_count)
+
+    def test_lock(self):
+        lock_dir = tempfile.mkdtemp()
+        lock = DeviceLock(lock_dir, timeout=0.1)
+
+        async def write(badge):
+            hold = lock.acquire('hidapi', '3-4:5-6')
+            with self.assertRaises(DeviceBusyError):
+                await badge.write(array('B', [1, 2, 3]), 'hidapi', lock=lock)
+            results = await badge.write_all(array('B', [1, 2, 3]), 'hidapi', lock=lock)
+            self.assertFalse(results['3-4:5-6']['ok'])
+            # Not opened while another one writes
+            sys.modules['pyhidapi'].hid_open_path.assert_not_called()
+            hold.release()
+            stats = await badge.write(array('B', [1, 2, 3]), 'hidapi', lock=lock)
+            results = await badge.write_all(array('B', [1, 2, 3]), 'hidapi', lock=lock)
+            self.assertTrue(results['3-4:5-6']['ok'])
+            # Released after closing
+            lock.acquire('hidapi', '3-4:5-6').release()
+            return stats
+
+        try:
+            stats, output, mocks = self.run_async(write)
+        finally:
+            shutil.rmtree(lock_dir)
+        self.assertEqual(64, stats['bytes'])
+        self.assertEqual(2, mocks['pyhidapi'].hid_close.call_count)
+
+    def test_session_lock(self):
+        lock_dir = tempfile.mkdtemp()
+        lock = DeviceLock(lock_dir, timeout=0.1)
+
+        async def write(badge):
+            hold = lock.acquire('hidapi', '3-4:5-6')
+            # Opened without the lock, but each write waits for it
+            async with badge.open('hidapi', lock=lock) as session:
+                with self.assertRaises(DeviceBusyError):
+                    await session.write(array('B', [1, 2, 3]))
+                sys.modules['pyhidapi'].hid_write.assert_not_called()
+                hold.release()
+                stats = await session.write(array('B', [4, 5, 6]))
+                lock.acquire('hidapi', '3-4:5-6').release()
+            return stats
+
+        try:
+            stats, output, mocks = self.run_async(write)
+        finally:
+            shutil.rmtree(lock_dir)
+        self.assertEqual(64, stats['bytes'])
+        mocks['pyhidapi'].hid_write.assert_called_once()
+        mocks['pyhidapi'].hid_close.assert_called_once()
+
+    @patch('time.sleep')
+    def test_retries(self, sleep_mock):
+        async def write(badge):
+            sys.modules['pyhidapi'].hid_write.side_effect = [RuntimeError('hid_write failed'), 64,
+                                                             RuntimeError('hid_write failed'), 64,
+                                                             RuntimeError('hid_write failed'), 64]
+            stats = await badge.write(array('B', [1, 2, 3]), 'hidapi', retries=1)
+            results = await badge.write_all(array('B', [1, 2, 3]), 'hidapi', retries=1)
+            async with badge.open('hidapi', retries=1) as session:
+                return stats, results, await session.write(array('B', [4, 5, 6]))
+
+        (stats, results, session_stats), output, mocks = self.run_async(write)
+        self.assertEqual(1, stats['retries'])
+        self.assertEqual(1, results['3-4:5-6']['retries'])
+        self.assertEqual(1, session_stats['retries'])
+        self.assertEqual(6, mocks['pyhidapi'].hid_write.call_count)
+
+    # -------------------------------------------------------------------------
+
+
+    def run_async(self, coroutine_func, max_concurrency=4):
+        def run(m):
+            return asyncio.run(coroutine_func(AsyncLedNameBadge(max_concurrency)))
+
+        return self.prepare_modules(True, True, True, run)
@@ -0,0 +1,80 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+import abstract_write_method_test
+from lednamebadge import BatchProgrammer
+
+
+class Test(abstract_write_method_test.AbstractWriteMethodTest):
+    def test_load_jobs_csv(self):
+        jobs = self.load_jobs('.csv', 'name,message1,message2,speed,brightness\n'
+                                      'Alice,Hello,Alice,"5,6",\n'
+                                      ',Bob,,,50\n',
+                              {'speed': [4], 'brightness': 75})
+        self.assertEqual([
+            {'name': 'Alice', 'messages': ['Hello', 'Alice'], 'speeds': [5, 6], 'modes': [0], 'blinks': [0],
+             'ants': [0], 'brightness': 75},
+            {'name': 'Bob', 'messages': ['Bob'], 'speeds': [4], 'modes': [0], 'blinks': [0],
+             'ants': [0], 'brightness': 50}],
+            jobs)
+
+    def test_load_jobs_jsonl(self):
+        jobs = self.load_jobs('.jsonl', '{"messages": ["Hi", "Carol"], "mode": [1, 2]}\n'
+                                        '\n'
+                                        '{"message": "Dave", "blink": 1}\n')
+        self.assertEqual(['Hi', 'Carol'], jobs[0]['messages'])
+        self.assertEqual([1, 2], jobs[0]['modes'])
+        self.assertEqual('Dave', jobs[1]['name'])
+        self.assertEqual([1], jobs[1]['blinks'])
+
+        with self.assertRaises(ValueError):
+            self.load_jobs('.jsonl', '{"speed": 1}\n')
+
+    def test_render_job(self):
+        job = {'messages': ['A'], 'speeds': [4], 'modes': [0], 'blinks': [0], 'ants': [0], 'brightness': 100}
+        payload = BatchProgrammer.render_job(job)
+        self.assertEqual(64 + 11, len(payload))
+        self.assertEqual(b'wang', payload[0:4])
+
+    @patch('time.sleep')
+    def test_run(self, sleep_mock):
+        def run(m):
+            jobs = [{'name': 'Eve', 'messages': ['Eve'], 'speeds': [4], 'modes': [0], 'blinks': [0], 'ants': [0],
+                     'brightness': 100}]
+            return BatchProgrammer(jobs, 'hidapi', poll_interval=0, processes=1).run()
+
+        stats, output, mocks = self.prepare_modules(True, True, True, run)
+        self.assertEqual(1, stats['written'])
+        self.assertEqual(0, stats['failed'])
+        self.assertIn("'Eve' written to '3-4:5-6'", output)
+        # Header and one report of bitmap data
+        self.assertEqual(2, mocks['pyhidapi'].hid_write.call_count)
+
+
+    @patch('time.sleep')
+    def test_run_render_failure(self, sleep_mock):
+        def run(m):
+            # Cannot be handed to the rendering process
+            jobs = [{'name': 'Eve', 'messages': ['Eve'], 'speeds': [4], 'modes': [0], 'blinks': [0], 'ants': [0],
+                     'brightness': 100, 'unpicklable': lambda: None}]
+            with self.assertRaises(Exception):
+                BatchProgrammer(jobs, 'hidapi', poll_interval=0, processes=1).run()
+            return True
+
+        result, output, mocks = self.prepare_modules(True, True, True, run)
+        self.assertTrue(result)
+        mocks['pyhidapi'].hid_write.assert_not_called()
+
+
+    # -------------------------------------------------------------------------
+
+
+    def load_jobs(self, suffix, content, defaults=None):
+        fd, file_name = tempfile.mkstemp(suffix)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            return BatchProgrammer.load_jobs(file_name, defaults)
+        finally:
+            os.remove(file_name)
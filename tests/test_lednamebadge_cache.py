@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+from unittest import TestCase
+
+from lednamebadge import SimpleTextAndIcons, RenderCache
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lru(self):
+        cache = RenderCache(2)
+        cache.put('a', (array('B', [1]), 1))
+        cache.put('b', (array('B', [2]), 1))
+        self.assertEqual((array('B', [1]), 1), cache.get('a'))
+        cache.put('c', (array('B', [3]), 1))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual({'hits': 3, 'misses': 1, 'disk_hits': 0, 'entries': 2}, cache.get_stats())
+
+    def test_results_are_copies(self):
+        creator = SimpleTextAndIcons()
+        buf, cols = creator.bitmap("Hello :HEART2:")
+        buf[0:0] = array('B', [255])
+        self.assertEqual(creator.bitmap("Hello :HEART2:"), SimpleTextAndIcons(RenderCache(0)).bitmap("Hello :HEART2:"))
+        self.assertEqual(1, creator.render_cache.hits)
+
+    def test_text_with_image_file(self):
+        image = os.path.join(self.tmp_dir, 'img.png')
+        shutil.copy("resources/bitpatterns.png", image)
+        creator = SimpleTextAndIcons()
+        first = creator.bitmap(":%s:" % image)
+        self.assertEqual(first, creator.bitmap(":%s:" % image))
+        self.assertEqual(1, creator.render_cache.hits)
+        # The cached text still has its preload slot for later references
+        self.assertEqual(first, creator.bitmap(":1:"))
+        self.assertEqual(2, len(creator.bitmap_preloaded))
+
+        os.utime(image, (0, 0))
+        creator.bitmap(":%s:" % image)
+        self.assertEqual(2, creator.render_cache.misses)
+
+    def test_not_cached(self):
+        creator = SimpleTextAndIcons()
+        creator.add_preload_img("resources/bitpatterns.png")
+        creator.bitmap("\x01")
+        creator.bitmap(":1:")
+        self.assertEqual({'hits': 0, 'misses': 0, 'disk_hits': 0, 'entries': 0}, creator.render_cache.get_stats())
+
+    def test_disk(self):
+        SimpleTextAndIcons(RenderCache(directory=self.tmp_dir)).bitmap("Hello :HEART2:")
+        creator = SimpleTextAndIcons(RenderCache(directory=self.tmp_dir))
+        self.assertEqual(SimpleTextAndIcons(RenderCache(0)).bitmap("Hello :HEART2:"), creator.bitmap("Hello :HEART2:"))
+        self.assertEqual(1, creator.render_cache.disk_hits)
+
+    def test_disk_threads(self):
+        cache = RenderCache(directory=self.tmp_dir)
+        threads = [threading.Thread(target=cache.put, args=(('text', '11x44', 'Hello', ()), (array('B', [i]), 1)))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # One file, no temporary ones left
+        self.assertEqual(1, len(os.listdir(self.tmp_dir)))
+        self.assertEqual(1, RenderCache(directory=self.tmp_dir).get(('text', '11x44', 'Hello', ()))[1])
@@ -1,5 +1,8 @@
+import os
+import tempfile
 from array import array
 from unittest import TestCase
+from unittest.mock import patch
 
 from lednamebadge import SimpleTextAndIcons as testee
 
@@ -32,3 +35,77 @@ class Test(TestCase):
                                 [128, 64, 32, 16, 8, 4, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 128, 64, 32, 0, 1, 2, 3,
                                  4, 5, 15, 31, 63, 127, 255]),
                           3), buf)
+
+    def test_absolute_paths(self):
+        path = os.path.abspath("resources/bitpatterns.png")
+        self.assertEqual(path, testee.absolute_paths("resources/bitpatterns.png"))
+        self.assertEqual("a:%s:b:heart:c::d:missing.png:" % (path,),
+                         testee.absolute_paths("a:resources/bitpatterns.png:b:heart:c::d:missing.png:"))
+        self.assertEqual("Hello", testee.absolute_paths("Hello"))
+
+    def test_bitmap_img_bulk_equals_pixelwise(self):
+        from PIL import Image
+        import random
+        rnd = random.Random(4711)
+        rgba = Image.frombytes('RGBA', (53, 11), bytes(bytearray(rnd.randrange(256) for _ in range(53 * 11 * 4))))
+        images = [rgba.convert(mode) for mode in ('1', 'L', 'P', 'LA', 'RGB', 'RGBA')]
+        images.append(Image.open("resources/bitpatterns.png"))
+        for im in images:
+            expected = testee._bitmap_img_pixelwise(im, 'test')
+            self.assertEqual(expected, testee._bitmap_img_bulk(im), im.mode)
+            with patch.dict('sys.modules', {'numpy': None}):
+                self.assertEqual(expected, testee._bitmap_img_bulk(im), im.mode + ' without numpy')
+
+    def test_bitmap_img_bulk_unknown_format(self):
+        from PIL import Image
+        self.assertIsNone(testee._bitmap_img_bulk(Image.new('F', (8, 11))))
+
+    def test_bitmap_text_font_only(self):
+        creator = testee()
+        text = testee.charmap.replace('\0', '')
+        buf, cols = creator.bitmap_text(text)
+        self.assertEqual(len(text), cols)
+        expected = array('B')
+        for c in text:
+            o = testee.char_offsets[c]
+            expected.extend(bytearray(testee.font_11x44[o:o + 11]))
+        self.assertEqual(expected, buf)
+
+    def test_bitmap_text_unknown_char(self):
+        creator = testee()
+        with self.assertRaises(KeyError):
+            creator.bitmap_text(u"€")
+
+    def test_preload_same_file_once(self):
+        creator = testee()
+        single = creator.bitmap(":resources/bitpatterns.png:")
+        buf = creator.bitmap(":resources/bitpatterns.png:A:./resources/bitpatterns.png:")
+        self.assertEqual(2, len(creator.bitmap_preloaded))
+        self.assertEqual(single[0] + array('B', testee.char_bitmaps['A']) + single[0], buf[0])
+        self.assertEqual(7, buf[1])
+
+    def test_preload_too_many(self):
+        creator = testee()
+        for i in range(testee.preload_slots_max):
+            creator.add_preload_img("resources/bitpatterns.png")
+        creator.bitmap(":resources/bitpatterns.png:")
+        with tempfile.NamedTemporaryFile(suffix='.png') as f:
+            f.write(open("resources/bitpatterns.png", 'rb').read())
+            f.flush()
+            with self.assertRaises(ValueError):
+                creator.bitmap(":%s:" % f.name)
+
+    def test_bitmap_12x48(self):
+        for msg in ("Hello World", "/:HEART2:\\", "I:HEART2:my:resources/bitpatterns.png:", "resources/bitpatterns.png"):
+            buf, cols = testee().bitmap(msg)
+            # Former way: insert an empty row after each byte-column of the 11x44 bitmap
+            for i in reversed(range(1, int(len(buf) / 11) + 1)):
+                buf[i * 11:i * 11] = array('B', [0])
+            self.assertEqual((buf, cols), testee(display_type='12x48').bitmap(msg), msg)
+
+    def test_bitmap_11x55(self):
+        self.assertEqual(testee().bitmap("Hello :HEART2:"), testee(display_type='11x55').bitmap("Hello :HEART2:"))
+
+    def test_bitmap_unknown_type(self):
+        with self.assertRaises(ValueError):
+            testee(display_type='8x8')
@@ -0,0 +1,111 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from lednamebadge import BadgeDaemon, WriteCapture
+
+
+class Test(TestCase):
+    def setUp(self):
+        WriteCapture.configure(device_count=2)
+        self.daemon = BadgeDaemon(None, 'capture', defaults={'speed': [6]})
+
+    def tearDown(self):
+        self.daemon._stop_workers()
+        WriteCapture.configure()
+
+    def test_write(self):
+        response = self.daemon.handle_request({'messages': ['Hello', 'World'], 'mode': '1,2'})
+        self.assertTrue(response['ok'])
+        self.assertEqual('capture:0', response['device_id'])
+        self.assertEqual(192, response['bytes'])
+        header = WriteCapture.captured[0][2]
+        # Speed 6 (from the defaults) and the modes
+        self.assertEqual([0x51, 0x52, 0x52], list(bytearray(header[8:11])))
+
+        response = self.daemon.handle_request({'message1': 'Hello', 'device_id': 'capture:1'})
+        self.assertEqual('capture:1', response['device_id'])
+        # 'auto' and 'capture:0' share the worker
+        self.assertEqual(['auto', 'capture:0', 'capture:1'], sorted(self.daemon._workers.keys()))
+        self.assertEqual(2, len(set(self.daemon._workers.values())))
+
+    def test_errors(self):
+        response = self.daemon.handle_request({'speed': 1})
+        self.assertFalse(response['ok'])
+        self.assertIn('no message', response['error'])
+
+        response = self.daemon.handle_request({'messages': ['Hello'], 'device_id': 'capture:7'})
+        self.assertFalse(response['ok'])
+
+        response = self.daemon.handle_request({'messages': 'Hello'})
+        self.assertFalse(response['ok'])
+        self.assertIn("'messages' must be a list of texts", response['error'])
+
+        response = self.daemon.handle_request({'command': 'reboot'})
+        self.assertEqual("Unknown command 'reboot'", response['error'])
+
+    def test_retries(self):
+        self.daemon.retries = 3
+        self.daemon.timeout = 0.5
+        self.assertTrue(self.daemon.handle_request({'messages': ['Hello']})['ok'])
+        write_method = self.daemon._workers['auto'][2].write_method
+        self.assertEqual((3, 0.5), (write_method.retries, write_method.timeout))
+
+    def test_devices_and_stats(self):
+        response = self.daemon.handle_request({'command': 'devices'})
+        self.assertEqual({'capture:0': 'Capture device 0', 'capture:1': 'Capture device 1'}, response['devices'])
+
+        self.daemon.handle_request({'messages': ['Hello']})
+        self.daemon.handle_request({'messages': ['Hello']})
+        response = self.daemon.handle_request({'command': 'stats'})
+        self.assertEqual(4, response['requests'])
+        self.assertEqual(1, response['render_cache']['hits'])
+
+    def test_socket(self):
+        directory = tempfile.mkdtemp()
+        self.daemon.socket_path = os.path.join(directory, 'badge.sock')
+        thread = threading.Thread(target=self.daemon.serve_forever)
+        thread.start()
+        try:
+            for _ in range(100):
+                if os.path.exists(self.daemon.socket_path):
+                    break
+                time.sleep(0.01)
+            response = BadgeDaemon.send_request(self.daemon.socket_path, {'messages': ['Hello']}, 5)
+            self.assertTrue(response['ok'])
+            self.assertEqual(128, response['bytes'])
+            # Not taken over by another daemon
+            with self.assertRaises(IOError):
+                BadgeDaemon(self.daemon.socket_path, 'capture').serve_forever()
+            self.assertTrue(BadgeDaemon.send_request(self.daemon.socket_path, {'command': 'stats'}, 5)['ok'])
+        finally:
+            self.daemon.shutdown()
+            thread.join()
+            shutil.rmtree(directory)
+        self.assertEqual({}, self.daemon._workers)
+
+    def test_stale_socket(self):
+        directory = tempfile.mkdtemp()
+        socket_path = os.path.join(directory, 'badge.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        try:
+            self.assertTrue(os.path.exists(socket_path))
+            self.assertFalse(BadgeDaemon._is_listening(socket_path))
+            self.daemon.socket_path = socket_path
+            thread = threading.Thread(target=self.daemon.serve_forever)
+            thread.start()
+            for _ in range(100):
+                if BadgeDaemon._is_listening(socket_path):
+                    break
+                time.sleep(0.01)
+            self.assertTrue(BadgeDaemon.send_request(socket_path, {'command': 'stats'}, 5)['ok'])
+            self.daemon.shutdown()
+            thread.join()
+        finally:
+            shutil.rmtree(directory)
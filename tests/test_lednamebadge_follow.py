@@ -0,0 +1,86 @@
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lednamebadge import CoalescingWriter, RenderCache, SimpleTextAndIcons
+
+
+class Test(TestCase):
+    def test_latest_wins(self):
+        started = threading.Event()
+        proceed = threading.Event()
+        written = []
+
+        def write(buf, force):
+            written.append(buf)
+            started.set()
+            proceed.wait(5)
+
+        session = MagicMock()
+        session.write.side_effect = write
+        writer = CoalescingWriter(session)
+        writer.submit('first')
+        started.wait(5)
+        # The first is written, these are waiting, only the last one survives
+        writer.submit('second')
+        writer.submit('third')
+        writer.submit('fourth')
+        proceed.set()
+        writer.close()
+
+        self.assertEqual(['first', 'fourth'], written)
+        self.assertEqual({'submitted': 4, 'written': 2, 'merged': 2, 'failed': 0, 'truncated': 0}, writer.get_stats())
+
+    @patch('time.sleep')
+    @patch('time.time')
+    def test_min_interval(self, time_mock, sleep_mock):
+        clock = [100.0]
+        time_mock.side_effect = lambda: clock[0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        sleep_mock.side_effect = sleep
+        started = threading.Event()
+        starts = []
+
+        def write(buf, force):
+            starts.append(clock[0])
+            clock[0] += 0.02
+            started.set()
+
+        session = MagicMock()
+        session.write.side_effect = write
+        writer = CoalescingWriter(session, 0.1, True)
+        writer.submit('first')
+        started.wait(5)
+        writer.submit('second')
+        writer.close()
+
+        self.assertEqual([100.0, 100.1], [round(s, 6) for s in starts])
+        self.assertEqual(1, sleep_mock.call_count)
+        self.assertAlmostEqual(0.08, sleep_mock.call_args[0][0])
+        session.write.assert_called_with('second', True)
+
+    def test_failure(self):
+        session = MagicMock()
+        session.write.side_effect = IOError('gone')
+        writer = CoalescingWriter(session)
+        writer.submit('first')
+        writer.close()
+        self.assertEqual(1, writer.get_stats()['failed'])
+
+    @patch('sys.stdout')
+    def test_follow_long_line(self, stdout_mock):
+        session = MagicMock()
+        writer = CoalescingWriter(session)
+        creator = SimpleTextAndIcons(RenderCache(0))
+        writer.follow(['x' * 800 + '\n', '\n'], creator)
+        writer.close()
+
+        self.assertEqual({'submitted': 1, 'written': 1, 'merged': 0, 'failed': 0, 'truncated': 1}, writer.get_stats())
+        buf = session.write.call_args[0][0]
+        self.assertLessEqual(len(buf), 8192)
+        # Shortened just enough
+        self.assertGreater(len(buf) + 11, 8192)
+        self.assertIn('shortened', ''.join(c[0][0] for c in stdout_mock.write.call_args_list))
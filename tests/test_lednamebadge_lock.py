@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from unittest import TestCase
+from unittest.mock import patch
+
+from lednamebadge import DeviceBusyError, DeviceLock, LedNameBadge, WriteCapture, WriteSuperseded
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.lock_dir)
+        WriteCapture.configure()
+
+    def test_fifo(self):
+        lock = DeviceLock(self.lock_dir, timeout=5)
+        order = []
+        hold = lock.acquire('hidapi', '1-2')
+
+        def wait(name):
+            with lock.acquire('hidapi', '1-2'):
+                order.append(name)
+
+        threads = []
+        for name in ('first', 'second', 'third'):
+            threads.append(threading.Thread(target=wait, args=(name,)))
+            threads[-1].start()
+            # Each one waits with its ticket before the next one starts
+            self.wait_for_tickets(len(threads) + 1)
+        # Another device is independent
+        lock.acquire('hidapi', '1-3').release()
+        hold.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['first', 'second', 'third'], order)
+        self.assertEqual(0, self.count_tickets())
+
+    def test_timeout(self):
+        hold = DeviceLock(self.lock_dir).acquire('libusb', '3:4:2')
+        try:
+            with self.assertRaises(DeviceBusyError) as context:
+                DeviceLock(self.lock_dir, timeout=0.1).acquire('libusb', '3:4:2')
+            self.assertIn('1 writes before this one', str(context.exception))
+            self.assertEqual(1, self.count_tickets())
+        finally:
+            hold.release()
+
+    def test_supersede(self):
+        lock = DeviceLock(self.lock_dir, timeout=5, supersede=True)
+        hold = lock.acquire('hidapi', '1-2')
+        results = []
+
+        def wait():
+            try:
+                lock.acquire('hidapi', '1-2').release()
+                results.append('written')
+            except WriteSuperseded:
+                results.append('superseded')
+
+        older = threading.Thread(target=wait)
+        older.start()
+        self.wait_for_tickets(2)
+        newer = threading.Thread(target=wait)
+        newer.start()
+        older.join()
+        self.assertEqual(['superseded'], results)
+        hold.release()
+        newer.join()
+        self.assertEqual(['superseded', 'written'], results)
+
+    def test_stale_ticket(self):
+        DeviceLock(self.lock_dir).acquire('capture', 'capture:0').release()
+        queue_dir = [d for d in os.listdir(self.lock_dir) if d.endswith('.queue')][0]
+        # Of a process not running anymore
+        open(os.path.join(self.lock_dir, queue_dir, '%017d-999999999-1' % (0,)), 'w').close()
+        DeviceLock(self.lock_dir, timeout=0.5).acquire('capture', 'capture:0').release()
+        self.assertEqual(0, self.count_tickets())
+
+    def test_write(self):
+        lock = DeviceLock(self.lock_dir, timeout=5, supersede=True)
+        stats = LedNameBadge.write(array('B', [1] * 64), 'capture', 'capture:0', lock=lock)
+        self.assertEqual(64, stats['bytes'])
+
+        hold = lock.acquire('capture', 'capture:0')
+        results = []
+        older = threading.Thread(target=lambda: results.append(
+            LedNameBadge.write(array('B', [2] * 64), 'capture', 'capture:0', lock=lock)))
+        older.start()
+        self.wait_for_tickets(2)
+        newer = threading.Thread(target=lambda: results.append(
+            LedNameBadge.write(array('B', [3] * 64), 'capture', 'capture:0', lock=lock)))
+        newer.start()
+        older.join()
+        hold.release()
+        newer.join()
+        self.assertTrue(results[0]['superseded'])
+        self.assertEqual(64, results[1]['bytes'])
+        self.assertEqual([bytes([1] * 64), bytes([3] * 64)], [c[2] for c in WriteCapture.captured])
+
+    def test_lock_before_open(self):
+        hold = DeviceLock(self.lock_dir).acquire('capture', 'capture:0')
+        try:
+            with patch.object(WriteCapture, '_open') as open_mock:
+                with self.assertRaises(DeviceBusyError):
+                    LedNameBadge.write(array('B', [1] * 64), 'capture', 'auto', lock=DeviceLock(self.lock_dir, 0.1))
+                open_mock.assert_not_called()
+        finally:
+            hold.release()
+
+    def test_write_all(self):
+        WriteCapture.configure(device_count=2)
+        lock = DeviceLock(self.lock_dir, timeout=5)
+        hold = lock.acquire('capture', 'capture:1')
+        results = []
+        writer = threading.Thread(target=lambda: results.append(
+            LedNameBadge.write_all(array('B', [1] * 64), 'capture', lock=lock)))
+        writer.start()
+        self.wait_for_tickets(2)
+        deadline = time.time() + 5
+        while not WriteCapture.captured and time.time() < deadline:
+            time.sleep(0.01)
+        # The other device is written meanwhile
+        self.assertEqual(['capture:0'], [c[1] for c in WriteCapture.captured])
+        hold.release()
+        writer.join()
+        self.assertEqual(['capture:0', 'capture:1'], [c[1] for c in WriteCapture.captured])
+        self.assertTrue(all(r['ok'] for r in results[0].values()))
+
+    def test_session(self):
+        lock = DeviceLock(self.lock_dir, timeout=0.1)
+        hold = lock.acquire('capture', 'capture:0')
+        # Opened without the lock, but each write waits for it
+        with LedNameBadge.open('capture', lock=lock) as badge:
+            with self.assertRaises(DeviceBusyError):
+                badge.write(array('B', [1] * 64))
+            hold.release()
+            self.assertEqual(64, badge.write(array('B', [2] * 64))['bytes'])
+            self.assertEqual(0, self.count_tickets())
+        self.assertEqual([bytes([2] * 64)], [c[2] for c in WriteCapture.captured])
+
+    # -------------------------------------------------------------------------
+
+    def count_tickets(self):
+        return sum(len(os.listdir(os.path.join(self.lock_dir, d))) for d in os.listdir(self.lock_dir)
+                   if d.endswith('.queue'))
+
+    def wait_for_tickets(self, count):
+        deadline = time.time() + 5
+        while self.count_tickets() < count and time.time() < deadline:
+            time.sleep(0.01)
@@ -0,0 +1,61 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lednamebadge import LedNameBadge, SimpleTextAndIcons, TemplateScheduler
+
+
+class Test(TestCase):
+    def test_refresh(self):
+        depths = [3, 3, 12, 12]
+        session = MagicMock()
+        scheduler = TemplateScheduler(session, SimpleTextAndIcons(), ["Queue", "{depth} jobs"],
+                                      {'depth': lambda: depths.pop(0), 'unused': 'x'})
+        with patch.object(LedNameBadge, 'header', wraps=LedNameBadge.header) as header_mock:
+            self.assertTrue(scheduler.refresh())
+            self.assertFalse(scheduler.refresh())
+            # Longer text, new header
+            self.assertTrue(scheduler.refresh())
+            self.assertFalse(scheduler.refresh())
+        self.assertEqual(2, header_mock.call_count)
+
+        self.assertEqual(2, session.write.call_count)
+        buf = session.write.call_args[0][0]
+        self.assertEqual([5, 7], [buf[17], buf[19]])
+        self.assertEqual(SimpleTextAndIcons().bitmap_text("12 jobs")[0], buf[64 + 5 * 11:])
+        self.assertEqual({'refreshes': 4, 'written': 2, 'unchanged': 2, 'failed': 0, 'rendered': 3, 'reused': 5},
+                         scheduler.get_stats())
+
+    def test_now(self):
+        scheduler = TemplateScheduler(MagicMock(), SimpleTextAndIcons(), ["{now:%Y}"])
+        self.assertEqual(1, len(scheduler.get_texts()))
+        self.assertEqual(4, len(scheduler.get_texts()[0]))
+        with self.assertRaises(KeyError):
+            TemplateScheduler(MagicMock(), SimpleTextAndIcons(), ["{unknown}"]).get_texts()
+
+    def test_colons(self):
+        scheduler = TemplateScheduler(MagicMock(), SimpleTextAndIcons(), [":heart: {now:%H:%M} {time}"],
+                                      {'time': '12:05:45'})
+        text = scheduler.get_texts()[0]
+        self.assertRegex(text, r'^:heart: [0-9]{2}::[0-9]{2} 12::05::45$')
+        scheduler.get_buffer()
+
+    def test_run(self):
+        session = MagicMock()
+        session.write.side_effect = [IOError('gone'), None]
+        scheduler = TemplateScheduler(session, SimpleTextAndIcons(), ["Hello"])
+        scheduler.run(0.01, 3)
+        self.assertEqual({'refreshes': 3, 'written': 1, 'unchanged': 1, 'failed': 1, 'rendered': 1, 'reused': 2},
+                         scheduler.get_stats())
+
+    def test_run_bad_values(self):
+        values = ['a\tb', 'ok']
+        session = MagicMock()
+        # No glyph for the tab at first
+        scheduler = TemplateScheduler(session, SimpleTextAndIcons(), ["{value}"], {'value': lambda: values.pop(0)})
+        scheduler.run(0.01, 2)
+        stats = scheduler.get_stats()
+        self.assertEqual((2, 1, 1), (stats['refreshes'], stats['written'], stats['failed']))
+
+        scheduler = TemplateScheduler(session, SimpleTextAndIcons(), ["{unknown}"])
+        scheduler.run(0.01, 2)
+        self.assertEqual(2, scheduler.get_stats()['failed'])
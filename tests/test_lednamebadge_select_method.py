@@ -155,8 +155,14 @@ class Test(abstract_write_method_test.AbstractWriteMethodTest):
 
     def call_find(self, pyusb_available, pyhidapi_available, device_available, method, device_id):
         self.print_test_conditions(pyusb_available, pyhidapi_available, device_available, method, device_id)
+        def find_write_method(m):
+            # The modules are imported on first use, so make all write methods check for theirs first
+            for write_method in m._get_auto_order_method_list():
+                write_method.is_ready()
+            return m._find_write_method(method, device_id)
+
         method_obj, output, _ = self.prepare_modules(pyusb_available, pyhidapi_available, device_available,
-                                                  lambda m: m._find_write_method(method, device_id))
+                                                  find_write_method)
         self.assertEqual(pyusb_available, 'usb.core detected' in output)
         self.assertEqual(pyhidapi_available, 'pyhidapi detected' in output)
         return method_obj, output
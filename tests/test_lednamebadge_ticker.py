@@ -0,0 +1,45 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from lednamebadge import LedNameBadge, SimpleTextAndIcons, SlotRenderer, Ticker
+
+
+class Test(TestCase):
+    def test_split(self):
+        ticker = Ticker(MagicMock(), SimpleTextAndIcons())
+        self.assertEqual(92, ticker.slot_columns)
+        ticker.slot_columns = 10
+        self.assertEqual([['Hello', 'World, how', 'are you?'], ], ticker.split(u"Hello\n World,   how are you?"))
+        self.assertEqual([['abcdefghij', 'klmno xy', 'a?b']], ticker.split(u"abcdefghijklmno xy a☃b"))
+        ticker.slot_columns = 2
+        windows = ticker.split(u" ".join(str(i) for i in range(20)))
+        self.assertEqual([8, 8, 4], [len(w) for w in windows])
+        self.assertEqual([], ticker.split(u"  "))
+        self.assertEqual(84, Ticker(MagicMock(), SimpleTextAndIcons(), display_type='12x48').slot_columns)
+
+    def test_slot_renderer(self):
+        renderer = SlotRenderer(SimpleTextAndIcons())
+        first = renderer.render(['one', 'two'])
+        second = renderer.render(['one', 'three', 'four'])
+        self.assertIs(first[0], second[0])
+        self.assertEqual(SimpleTextAndIcons().bitmap_text('three'), second[1])
+        self.assertEqual({'rendered': 4, 'reused': 1}, renderer.get_stats())
+
+    def test_run(self):
+        texts = [u"one two three", u"one two four"]
+        session = MagicMock()
+        ticker = Ticker(session, SimpleTextAndIcons(), speed=8, mode=1)
+        ticker.slot_columns = 5
+        ticker.scroll_pixels_per_second = (1e6,) * 8
+        ticker.run(lambda: texts.pop(0), 2)
+
+        self.assertEqual({'written': 2, 'failed': 0, 'rounds': 2, 'rendered': 4, 'reused': 2}, ticker.get_stats())
+        buf = session.write.call_args_list[1][0][0]
+        # 3 slots with 3, 3 and 4 byte-columns, mode 1, speed 8
+        self.assertEqual(LedNameBadge.header((3, 3, 4), (8,), (1,), (0,), (0,))[:38], list(buf[:38]))
+        self.assertEqual(64 + 10 * 11, len(buf))
+
+    def test_display_seconds(self):
+        ticker = Ticker(MagicMock(), SimpleTextAndIcons(), speed=3)
+        # (8 * 10 + 44) + (8 * 2 + 44) pixels at 16 pixels per second
+        self.assertAlmostEqual(11.5, ticker.get_display_seconds([(None, 10), (None, 2)]))
@@ -0,0 +1,122 @@
+import itertools
+import os
+import shutil
+import tempfile
+from array import array
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from lednamebadge import HotplugWriter, UsbDeviceWatcher, WriteCapture
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.sysfs_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.sysfs_dir)
+        WriteCapture.configure()
+
+    def test_poll(self):
+        watcher = UsbDeviceWatcher(sysfs_dir=self.sysfs_dir)
+        self.add_entry('usb1', '1d6b', '0002')
+        self.add_entry('1-0:1.0')
+        self.assertTrue(watcher.poll())
+        self.assertTrue(watcher.poll())
+        self.assertFalse(watcher.poll())
+
+        self.add_entry('1-2', '0416', '5020')
+        self.assertTrue(watcher.poll())
+        self.assertEqual(['1-2'], watcher.devices)
+        # Once more after the change, then only on changes
+        self.assertTrue(watcher.poll())
+        self.assertFalse(watcher.poll())
+
+        # Matching devices are not read again
+        with patch.object(watcher, '_read_ids', wraps=watcher._read_ids) as read_mock:
+            self.add_entry('1-3', '0416', '5020')
+            self.assertTrue(watcher.poll())
+            self.assertEqual(['1-3', 'usb1'], sorted(c[0][0] for c in read_mock.call_args_list))
+
+        shutil.rmtree(os.path.join(self.sysfs_dir, '1-2'))
+        self.assertTrue(watcher.poll())
+        self.assertEqual(['1-3'], watcher.devices)
+
+    def test_poll_incomplete(self):
+        watcher = UsbDeviceWatcher(sysfs_dir=self.sysfs_dir)
+        self.assertTrue(watcher.poll())
+        self.assertTrue(watcher.poll())
+        # Still being set up by the kernel: not remembered as not matching
+        self.add_entry('1-2', '0416', None)
+        self.assertFalse(watcher.poll())
+        self.add_attribute('1-2', 'idProduct', '5020')
+        self.assertTrue(watcher.poll())
+        self.assertEqual(['1-2'], watcher.devices)
+
+    def test_poll_reconnected(self):
+        watcher = UsbDeviceWatcher(sysfs_dir=self.sysfs_dir)
+        self.add_entry('1-2', '0416', '5020', devnum=5)
+        self.assertTrue(watcher.poll())
+        self.assertTrue(watcher.poll())
+        self.assertFalse(watcher.poll())
+        # Disconnected and connected again to the same port in between two polls
+        shutil.rmtree(os.path.join(self.sysfs_dir, '1-2'))
+        self.add_entry('1-2', '0416', '5020', devnum=6)
+        self.assertTrue(watcher.poll())
+        self.assertEqual(['1-2'], watcher.devices)
+        self.assertTrue(watcher.poll())
+        self.assertFalse(watcher.poll())
+        # Another device in its place
+        shutil.rmtree(os.path.join(self.sysfs_dir, '1-2'))
+        self.add_entry('1-2', '046d', 'c52b', devnum=7)
+        self.assertTrue(watcher.poll())
+        self.assertEqual([], watcher.devices)
+
+    def test_no_sysfs(self):
+        watcher = UsbDeviceWatcher(sysfs_dir=os.path.join(self.sysfs_dir, 'missing'))
+        self.assertTrue(watcher.poll())
+        self.assertTrue(watcher.poll())
+
+    @patch('time.sleep')
+    def test_hotplug_writer(self, sleep_mock):
+        WriteCapture.configure(device_count=2)
+        watcher = MagicMock()
+        # A change at first only, the capture devices are looked for anyway
+        watcher.poll.side_effect = itertools.chain([True], itertools.repeat(False))
+        writer = HotplugWriter(array('B', [1] * 64), 'capture', poll_interval=0, watcher=watcher)
+        writer.run(2)
+        stats = writer.get_stats()
+        self.assertEqual((2, 0), (stats['written'], stats['failed']))
+        self.assertEqual(['capture:0', 'capture:1'], sorted(c[1] for c in WriteCapture.captured))
+
+    @patch('time.sleep')
+    def test_hotplug_writer_reconnected(self, sleep_mock):
+        WriteCapture.configure(device_count=2)
+        watcher = MagicMock()
+        watcher.poll.return_value = True
+
+        def get_device_key(write_method, device_id=None):
+            # capture:0 gets connected again in between two polls after being written
+            if device_id == 'capture:0' and [c for c in WriteCapture.captured if c[1] == device_id]:
+                return 'capture:0 again'
+            return device_id
+
+        with patch.object(WriteCapture, 'get_device_key', autospec=True, side_effect=get_device_key):
+            writer = HotplugWriter(array('B', [1] * 64), 'capture', poll_interval=0, watcher=watcher)
+            writer.run(3)
+        self.assertEqual(3, writer.get_stats()['written'])
+        self.assertEqual(['capture:0', 'capture:0', 'capture:1'], sorted(c[1] for c in WriteCapture.captured))
+
+    # -------------------------------------------------------------------------
+
+    def add_entry(self, name, vendor_id=None, product_id=None, devnum=2):
+        os.mkdir(os.path.join(self.sysfs_dir, name))
+        if vendor_id:
+            self.add_attribute(name, 'devnum', str(devnum))
+            self.add_attribute(name, 'idVendor', vendor_id)
+            if product_id:
+                self.add_attribute(name, 'idProduct', product_id)
+
+    def add_attribute(self, name, attribute, value):
+        with open(os.path.join(self.sysfs_dir, name, attribute), 'w') as f:
+            f.write(value + '\n')
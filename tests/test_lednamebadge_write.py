@@ -1,7 +1,8 @@
 import datetime
+from array import array
 from unittest import TestCase
 
-from lednamebadge import LedNameBadge as testee
+from lednamebadge import LedNameBadge as testee, PayloadOptimizer, PayloadTooLargeError, ReportFramer
 
 
 class Test(TestCase):
@@ -77,3 +78,53 @@ class Test(TestCase):
             testee.header(("nan",), (4,), (4,), (0,), (0,), 80, self.test_date)
         with self.assertRaises(ValueError):
             testee.header((370,380), (4,), (4,), (0,), (0,), 80, self.test_date)
+        testee.header((370, 310), (4,), (4,), (0,), (0,), 80, self.test_date)
+        with self.assertRaises(PayloadTooLargeError) as context:
+            testee.header((370, 310), (4,), (4,), (0,), (0,), 80, self.test_date, '12x48')
+        # 64 + 680 * 12 = 8224 bytes, 32 too many
+        self.assertEqual(3, context.exception.excess_columns)
+
+    def test_optimize(self):
+        blank = [0] * 11
+        column = [1] * 11
+        bitmaps = [(array('B', blank + column + blank), 3), (array('B', column), 1), (array('B', blank + column), 2),
+                   (array('B', blank + column + blank), 3), (array('B', blank * 2), 2)]
+        optimizer = PayloadOptimizer()
+        result = optimizer.optimize(bitmaps, (4,), (0, 0, 4, 5, 0), (0,), (0,))
+        # The second is the same as the first after trimming, the last keeps one byte-column
+        self.assertEqual([(array('B', column), 1), bitmaps[2], bitmaps[3], (array('B', blank), 1)], result[0])
+        self.assertEqual(([4] * 4, [0, 4, 5, 0], [0] * 4, [0] * 4), result[1:])
+        self.assertEqual({'messages': 5, 'folded': 1, 'trimmed_columns': 3, 'bytes_saved': 44, 'bytes': 64 + 77},
+                         optimizer.get_stats())
+        self.assertEqual((array('B', blank + column), 2), optimizer.trim(array('B', blank + column + blank), 3, 2))
+
+        optimizer.check_fit([(array('B', column * 738), 738)])
+        with self.assertRaises(PayloadTooLargeError) as context:
+            optimizer.check_fit([(array('B', column), 1), (array('B', column * 738), 738)])
+        self.assertIn('at least 1 byte-columns', str(context.exception))
+        self.assertIn('message 2 with 738', str(context.exception))
+
+    def test_report_framer(self):
+        buf = array('B', range(100))
+        reports = ReportFramer(buf)
+        self.assertEqual(2, len(reports))
+        self.assertEqual(128, len(reports.data))
+        self.assertEqual(100, len(buf))
+        self.assertEqual(bytes(bytearray(range(64))), bytes(reports[0]))
+        self.assertEqual(bytes(bytearray(range(64, 100))) + bytes(28), bytes(reports[1]))
+        self.assertEqual([bytes(r) for r in reports], [bytes(reports[0]), bytes(reports[1])])
+
+        first = reports.hid_report(0)
+        self.assertEqual(b'\x00' + bytes(reports[0]), bytes(first))
+        second = reports.hid_report(1)
+        self.assertIs(first, second)
+        self.assertEqual(b'\x00' + bytes(reports[1]), bytes(second))
+
+        first = reports.usb_report(0)
+        self.assertEqual(array('B', range(64)), first)
+        second = reports.usb_report(1)
+        self.assertIs(first, second)
+        self.assertEqual(bytes(reports[1]), second.tobytes())
+
+        self.assertEqual(1, len(ReportFramer([1, 2, 3])))
+        self.assertEqual(0, len(ReportFramer(array('B'))))